@@ -0,0 +1,364 @@
+import asyncio
+import json
+import os
+from contextlib import suppress
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from PIL import Image, UnidentifiedImageError
+import openai_async
+from image_processing import decode_photo
+from recipe_index import find_local_recipes
+from parsing import validate_ingredients
+from telemetry import register_metrics, start_metrics_server
+from scheduler import scheduling, PRIORITY_NAMES, INTERACTIVE
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", 8080))
+# Largest request body accepted, in megabytes
+API_MAX_UPLOAD_MB = float(os.environ.get("API_MAX_UPLOAD_MB", 25))
+# Requests handled at once; further requests get 503 straight away instead of piling up
+API_MAX_ACTIVE = int(os.environ.get("API_MAX_ACTIVE", 1000))
+# Seconds a client may take to send each part of its request
+API_READ_TIMEOUT = float(os.environ.get("API_READ_TIMEOUT", 30))
+# Most recipes one request may ask for
+API_MAX_RECIPES = int(os.environ.get("API_MAX_RECIPES", 5))
+
+READ_CHUNK = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+AUDIO_FILENAMES = {
+    'audio/wav': 'audio.wav',
+    'audio/x-wav': 'audio.wav',
+    'audio/wave': 'audio.wav',
+    'audio/mpeg': 'audio.mp3',
+    'audio/mp3': 'audio.mp3',
+    'audio/mp4': 'audio.m4a',
+    'audio/x-m4a': 'audio.m4a',
+}
+
+api_stats = {
+    'active': 0,
+    'rejected': 0,
+}
+_responses = {}
+
+
+class HTTPError(Exception):
+    """Ends a request with the given status and a JSON error message"""
+
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+class Request:
+    """A parsed request line and headers; the body is read from the connection on demand"""
+
+    def __init__(self, method, target, headers, reader, writer):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path.rstrip("/") or "/"
+        self.query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+        self.body_read = False
+        self.keep_alive = headers.get("connection", "").lower() != "close"
+
+    @property
+    def unread_body(self):
+        """Whether body bytes are still waiting on the connection"""
+        if self.body_read:
+            return False
+        return "chunked" in self.headers.get("transfer-encoding", "").lower() or self.headers.get("content-length", "0") != "0"
+
+    async def body(self):
+        """Read the whole body, refusing it before it is sent if it is too large"""
+        if "chunked" in self.headers.get("transfer-encoding", "").lower():
+            self.keep_alive = False
+            raise HTTPError(411, "Send a Content-Length with the request body")
+        try:
+            length = int(self.headers.get("content-length", 0))
+        except ValueError:
+            self.keep_alive = False
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > API_MAX_UPLOAD_MB * 1024 * 1024:
+            self.keep_alive = False
+            raise HTTPError(413, f"Request body is larger than {API_MAX_UPLOAD_MB:g} MB")
+
+        if self.headers.get("expect", "").lower() == "100-continue":
+            self.writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await self.writer.drain()
+
+        # Read in chunks; the stream stops reading from the socket while its buffer is full
+        body = bytearray()
+        while len(body) < length:
+            chunk = await asyncio.wait_for(self.reader.read(min(READ_CHUNK, length - len(body))), API_READ_TIMEOUT)
+            if not chunk:
+                self.keep_alive = False
+                raise HTTPError(400, "Request body ended early")
+            body += chunk
+        self.body_read = True
+        return bytes(body)
+
+    async def json(self):
+        try:
+            payload = json.loads(await self.body() or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return payload
+
+
+async def read_request(reader, writer):
+    """Parse the next request on a connection, or return None when the client has gone"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431)
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return Request(method.upper(), target, headers, reader, writer)
+
+
+async def send_json(writer, status, payload, keep_alive=True, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    for name, value in (headers or {}).items():
+        head.append(f"{name}: {value}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def send_event(writer, event, payload):
+    """Write one server-sent event and wait until the client has taken it"""
+    data = json.dumps(payload, ensure_ascii=False)
+    writer.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+    await writer.drain()
+
+
+def _ingredients(payload):
+    ingredients = payload.get("ingredients")
+    if not isinstance(ingredients, list) or not all(isinstance(name, str) for name in ingredients):
+        raise HTTPError(400, '"ingredients" must be a list of strings')
+    ingredients = validate_ingredients(ingredients)
+    if not ingredients:
+        raise HTTPError(400, "No recognisable ingredients given")
+    return ingredients
+
+
+def _recipe_request(payload):
+    n = payload.get("n", 3)
+    if not isinstance(n, int) or not 1 <= n <= API_MAX_RECIPES:
+        raise HTTPError(400, f'"n" must be a whole number from 1 to {API_MAX_RECIPES}')
+    exclude = payload.get("exclude") or []
+    if not isinstance(exclude, list):
+        raise HTTPError(400, '"exclude" must be a list of recipes')
+    return _ingredients(payload), n, exclude
+
+
+async def health(request):
+    return {"status": "ok"}
+
+
+async def recipes(request):
+    """POST {"ingredients": [...], "n": 3, "exclude": [...], "novel": false}"""
+    payload = await request.json()
+    ingredients, n, exclude = _recipe_request(payload)
+    if not payload.get("novel"):
+        local = await asyncio.to_thread(find_local_recipes, ingredients, n, exclude)
+        if local:
+            return {"ingredients": ingredients, "recipes": local, "source": "local"}
+    results = await openai_async.generate_recipes(ingredients, n=n, exclude=exclude)
+    return {"ingredients": ingredients, "recipes": results, "source": "model"}
+
+
+async def recipes_stream(request):
+    """Like /recipes, sent as server-sent "partial" events followed by one "done" event"""
+    payload = await request.json()
+    ingredients, n, exclude = _recipe_request(payload)
+    writer = request.writer
+    writer.write((
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: text/event-stream\r\n"
+        "Cache-Control: no-cache\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("latin-1"))
+    request.keep_alive = False
+
+    try:
+        if not payload.get("novel"):
+            local = await asyncio.to_thread(find_local_recipes, ingredients, n, exclude)
+            if local:
+                await send_event(writer, "done", {"recipes": local, "source": "local"})
+                return None
+
+        stream = openai_async.stream_recipes(ingredients, n=n, exclude=exclude)
+        try:
+            final = []
+            async for partial in stream:
+                final = partial
+                await send_event(writer, "partial", {"recipes": partial})
+        finally:
+            await stream.aclose()
+        await send_event(writer, "done", {"recipes": final, "source": "model"})
+    except ConnectionError:
+        # The client went away; closing the stream above stops the model call
+        pass
+    except Exception as e:
+        with suppress(ConnectionError):
+            await send_event(writer, "error", {"error": str(e)})
+    return None
+
+
+async def ingredients_from_image(request):
+    """POST the raw bytes of a PNG or JPEG photo"""
+    data = await request.body()
+    if not data:
+        raise HTTPError(400, "Send the photo as the request body")
+    try:
+        photo = await asyncio.to_thread(decode_photo, data)
+    except Image.DecompressionBombError:
+        raise HTTPError(413, "The photo has too many pixels")
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        # Pillow reports corrupt or truncated files with any of these
+        raise HTTPError(415, "The request body is not a supported image")
+    found = await openai_async.recognize_ingredients_from_photo(photo)
+    return {"ingredients": validate_ingredients(found)}
+
+
+async def ingredients_from_audio(request):
+    """POST the raw bytes of a WAV, MP3 or M4A recording; ?filename= names its format"""
+    data = await request.body()
+    if not data:
+        raise HTTPError(400, "Send the recording as the request body")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    filename = request.query.get("filename") or AUDIO_FILENAMES.get(content_type, "audio.wav")
+    transcript = await openai_async.transcribe_audio_to_text(data, os.path.basename(filename))
+    found = await openai_async.extract_ingredients_from_speech(transcript) if transcript else []
+    return {"transcript": transcript, "ingredients": validate_ingredients(found)}
+
+
+ROUTES = {
+    ("GET", "/health"): health,
+    ("POST", "/recipes"): recipes,
+    ("POST", "/recipes/stream"): recipes_stream,
+    ("POST", "/ingredients/from-image"): ingredients_from_image,
+    ("POST", "/ingredients/from-audio"): ingredients_from_audio,
+}
+
+
+def _count_response(path, status):
+    key = (path if any(path == route for _, route in ROUTES) else "other", status)
+    _responses[key] = _responses.get(key, 0) + 1
+
+
+async def dispatch(request):
+    """Run the handler for a request and send its response; returns whether to keep the connection"""
+    writer = request.writer
+    handler = ROUTES.get((request.method, request.path))
+    status = 200
+    try:
+        if handler is None:
+            known = any(path == request.path for _, path in ROUTES)
+            raise HTTPError(405 if known else 404)
+        if api_stats['active'] >= API_MAX_ACTIVE:
+            # Shed load early rather than queueing work the client may give up on
+            api_stats['rejected'] += 1
+            raise HTTPError(503, "The server is busy. Please retry shortly.")
+
+        # Clients share rate limit capacity fairly; X-Priority: background or batch lets them yield to others
+        session = request.headers.get("x-session-id") or writer.get_extra_info("peername", ("unknown",))[0]
+        priority = request.headers.get("x-priority", "").lower()
+        priority = PRIORITY_NAMES.index(priority) if priority in PRIORITY_NAMES else INTERACTIVE
+        api_stats['active'] += 1
+        try:
+            with scheduling(priority, session):
+                result = await handler(request)
+        finally:
+            api_stats['active'] -= 1
+        if result is None:
+            return False
+        keep_alive = request.keep_alive and not request.unread_body
+        await send_json(writer, 200, result, keep_alive)
+        return keep_alive
+    except HTTPError as e:
+        status = e.status
+        keep_alive = request.keep_alive and not request.unread_body
+        headers = {"Retry-After": "1"} if status == 503 else None
+        await send_json(writer, status, {"error": str(e)}, keep_alive, headers)
+        return keep_alive
+    except Exception as e:
+        # Failures of the upstream model service
+        status = 502
+        await send_json(writer, status, {"error": str(e)}, False)
+        return False
+    finally:
+        _count_response(request.path, status)
+
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader, writer), API_READ_TIMEOUT)
+            except HTTPError as e:
+                await send_json(writer, e.status, {"error": str(e)}, False)
+                break
+            except (asyncio.TimeoutError, ConnectionError):
+                break
+            if request is None or not await dispatch(request):
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+        with suppress(ConnectionError):
+            await writer.wait_closed()
+
+
+async def serve(host=API_HOST, port=API_PORT):
+    server = await asyncio.start_server(handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    async with server:
+        await server.serve_forever()
+
+
+def _api_metrics():
+    lines = [
+        "# HELP api_requests_total API responses by route and status",
+        "# TYPE api_requests_total counter",
+    ]
+    for (path, status), count in sorted(_responses.items()):
+        lines.append(f'api_requests_total{{path="{path}",status="{status}"}} {count}')
+    lines.append("# HELP api_requests_active API requests being handled")
+    lines.append("# TYPE api_requests_active gauge")
+    lines.append(f"api_requests_active {api_stats['active']}")
+    lines.append("# HELP api_requests_rejected_total API requests refused because the server was busy")
+    lines.append("# TYPE api_requests_rejected_total counter")
+    lines.append(f"api_requests_rejected_total {api_stats['rejected']}")
+    return lines
+
+
+register_metrics(_api_metrics)
+
+
+if __name__ == "__main__":
+    start_metrics_server()
+    asyncio.run(serve())
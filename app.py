@@ -1,16 +1,26 @@
 import streamlit as st
-import base64
-import tempfile
 import os
-from PIL import Image
-import io
 import speech_recognition as sr
 from openai_helper import (
     generate_recipe_from_ingredients,
-    recognize_ingredients_from_image,
+    stream_recipe_from_ingredients,
+    generate_recipes,
+    stream_recipes_from_ingredients,
+    recognize_ingredients_from_photos,
     transcribe_audio_to_text
 )
 from utils import validate_ingredients, format_recipe_display
+from prefetch import RecipePrefetcher, PREFETCH_RECIPES
+from recipe_index import find_local_recipes
+from telemetry import start_metrics_server
+from theme import theme_html
+from image_processing import decode_photo
+from pantry import open_pantry
+
+# Show recipes while they are being written instead of waiting for the full response
+STREAM_RECIPES = os.environ.get("STREAM_RECIPES", "1") != "0"
+# Recipes fetched per request; the user pages through them without further calls
+RECIPE_BATCH_SIZE = int(os.environ.get("RECIPE_BATCH_SIZE", 3))
 
 # Configure page settings
 st.set_page_config(
@@ -20,318 +30,11 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Dynamic CSS based on theme selection
-def get_theme_css(is_dark_mode):
-    if is_dark_mode:
-        return """
-        <style>
-            /* Dark Mode Styles */
-            .main .block-container {
-                background: linear-gradient(135deg, #1a1a2e 0%, #16213e 25%, #0f3460 50%, #1a1a2e 100%) !important;
-                color: #ffffff !important;
-            }
-            
-            .main-header {
-                font-size: 3rem !important;
-                font-weight: bold !important;
-                text-align: center !important;
-                color: #64ffda !important;
-                margin-bottom: 2rem !important;
-                text-shadow: 0 0 20px rgba(100, 255, 218, 0.5) !important;
-            }
-            
-            .section-header {
-                font-size: 2rem !important;
-                font-weight: bold !important;
-                color: #bb86fc !important;
-                margin: 2rem 0 1rem 0 !important;
-                text-shadow: 0 0 10px rgba(187, 134, 252, 0.3) !important;
-            }
-            
-            .instruction-text {
-                font-size: 1.2rem !important;
-                line-height: 1.6 !important;
-                color: #e0e0e0 !important;
-                margin-bottom: 1rem !important;
-                background: rgba(255, 255, 255, 0.1) !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                border-left: 4px solid #64ffda !important;
-                backdrop-filter: blur(10px) !important;
-            }
-            
-            .stButton > button {
-                font-size: 1.5rem !important;
-                padding: 1rem 2rem !important;
-                border-radius: 10px !important;
-                font-weight: bold !important;
-                min-height: 60px !important;
-                background: linear-gradient(135deg, #6200ea, #3700b3) !important;
-                color: #ffffff !important;
-                border: 2px solid #bb86fc !important;
-                box-shadow: 0 4px 15px rgba(98, 0, 234, 0.3) !important;
-            }
-            
-            .stButton > button:hover {
-                background: linear-gradient(135deg, #3700b3, #6200ea) !important;
-                box-shadow: 0 6px 20px rgba(98, 0, 234, 0.5) !important;
-                transform: translateY(-2px) !important;
-            }
-            
-            .stButton > button[kind="primary"] {
-                background: linear-gradient(135deg, #64ffda, #00bcd4) !important;
-                color: #000000 !important;
-                border: 2px solid #64ffda !important;
-            }
-            
-            .stTextInput > div > div > input {
-                font-size: 1.3rem !important;
-                padding: 1rem !important;
-                background: rgba(255, 255, 255, 0.1) !important;
-                color: #ffffff !important;
-                border: 2px solid #64ffda !important;
-                border-radius: 10px !important;
-            }
-            
-            .stTextArea > div > div > textarea {
-                font-size: 1.3rem !important;
-                padding: 1rem !important;
-                background: rgba(255, 255, 255, 0.1) !important;
-                color: #ffffff !important;
-                border: 2px solid #64ffda !important;
-                border-radius: 10px !important;
-            }
-            
-            .recipe-container {
-                background: rgba(255, 255, 255, 0.1) !important;
-                padding: 2rem !important;
-                border-radius: 15px !important;
-                border: 2px solid #64ffda !important;
-                margin: 1rem 0 !important;
-                backdrop-filter: blur(10px) !important;
-                color: #ffffff !important;
-            }
-            
-            .ingredient-list {
-                font-size: 1.2rem !important;
-                line-height: 1.8 !important;
-                color: #64ffda !important;
-                background: rgba(100, 255, 218, 0.1) !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                border-left: 4px solid #64ffda !important;
-            }
-            
-            .success-message {
-                background: rgba(76, 175, 80, 0.2) !important;
-                color: #4caf50 !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                font-size: 1.2rem !important;
-                margin: 1rem 0 !important;
-                border: 2px solid #4caf50 !important;
-            }
-            
-            .error-message {
-                background: rgba(244, 67, 54, 0.2) !important;
-                color: #f44336 !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                font-size: 1.2rem !important;
-                margin: 1rem 0 !important;
-                border: 2px solid #f44336 !important;
-            }
-            
-            .stTabs [data-baseweb="tab-list"] {
-                background: rgba(255, 255, 255, 0.1) !important;
-                border-radius: 10px !important;
-            }
-            
-            .stTabs [data-baseweb="tab"] {
-                color: #bb86fc !important;
-                font-weight: bold !important;
-            }
-            
-            .stTabs [aria-selected="true"] {
-                background: rgba(100, 255, 218, 0.2) !important;
-                color: #64ffda !important;
-            }
-            
-            .stSelectbox > div > div {
-                background: rgba(255, 255, 255, 0.1) !important;
-                color: #ffffff !important;
-                border: 2px solid #64ffda !important;
-            }
-            
-            .theme-toggle {
-                position: fixed !important;
-                top: 1rem !important;
-                right: 1rem !important;
-                z-index: 999 !important;
-                background: rgba(100, 255, 218, 0.2) !important;
-                padding: 0.5rem !important;
-                border-radius: 25px !important;
-                border: 2px solid #64ffda !important;
-            }
-        </style>
-        """
-    else:
-        return """
-        <style>
-            /* Light Mode Styles - White and Gray Theme */
-            .main .block-container {
-                background: linear-gradient(135deg, #ffffff 0%, #f8f9fa 25%, #e9ecef 50%, #dee2e6 100%) !important;
-                color: #2c3e50 !important;
-            }
-            
-            .main-header {
-                font-size: 3rem !important;
-                font-weight: bold !important;
-                text-align: center !important;
-                color: #2c3e50 !important;
-                margin-bottom: 2rem !important;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1) !important;
-            }
-            
-            .section-header {
-                font-size: 2rem !important;
-                font-weight: bold !important;
-                color: #495057 !important;
-                margin: 2rem 0 1rem 0 !important;
-            }
-            
-            .instruction-text {
-                font-size: 1.2rem !important;
-                line-height: 1.6 !important;
-                color: #2c3e50 !important;
-                margin-bottom: 1rem !important;
-                background: rgba(255, 255, 255, 0.9) !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                border-left: 4px solid #6c757d !important;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1) !important;
-            }
-            
-            .stButton > button {
-                font-size: 1.5rem !important;
-                padding: 1rem 2rem !important;
-                border-radius: 10px !important;
-                font-weight: bold !important;
-                min-height: 60px !important;
-                background: linear-gradient(135deg, #6c757d, #495057) !important;
-                color: #ffffff !important;
-                border: 2px solid #6c757d !important;
-                box-shadow: 0 4px 15px rgba(108, 117, 125, 0.3) !important;
-            }
-            
-            .stButton > button:hover {
-                background: linear-gradient(135deg, #495057, #343a40) !important;
-                box-shadow: 0 6px 20px rgba(108, 117, 125, 0.4) !important;
-                transform: translateY(-2px) !important;
-            }
-            
-            .stButton > button[kind="primary"] {
-                background: linear-gradient(135deg, #343a40, #212529) !important;
-                color: #ffffff !important;
-                border: 2px solid #343a40 !important;
-            }
-            
-            .stTextInput > div > div > input {
-                font-size: 1.3rem !important;
-                padding: 1rem !important;
-                background: rgba(255, 255, 255, 0.95) !important;
-                color: #2c3e50 !important;
-                border: 2px solid #ced4da !important;
-                border-radius: 10px !important;
-            }
-            
-            .stTextArea > div > div > textarea {
-                font-size: 1.3rem !important;
-                padding: 1rem !important;
-                background: rgba(255, 255, 255, 0.95) !important;
-                color: #2c3e50 !important;
-                border: 2px solid #ced4da !important;
-                border-radius: 10px !important;
-            }
-            
-            .recipe-container {
-                background: rgba(255, 255, 255, 0.95) !important;
-                padding: 2rem !important;
-                border-radius: 15px !important;
-                border: 2px solid #dee2e6 !important;
-                margin: 1rem 0 !important;
-                box-shadow: 0 8px 25px rgba(0, 0, 0, 0.1) !important;
-                color: #2c3e50 !important;
-            }
-            
-            .ingredient-list {
-                font-size: 1.2rem !important;
-                line-height: 1.8 !important;
-                color: #2c3e50 !important;
-                background: rgba(248, 249, 250, 0.8) !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                border-left: 4px solid #6c757d !important;
-            }
-            
-            .success-message {
-                background: rgba(212, 237, 218, 0.8) !important;
-                color: #155724 !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                font-size: 1.2rem !important;
-                margin: 1rem 0 !important;
-                border: 2px solid #c3e6cb !important;
-            }
-            
-            .error-message {
-                background: rgba(248, 215, 218, 0.8) !important;
-                color: #721c24 !important;
-                padding: 1rem !important;
-                border-radius: 10px !important;
-                font-size: 1.2rem !important;
-                margin: 1rem 0 !important;
-                border: 2px solid #f5c6cb !important;
-            }
-            
-            .stTabs [data-baseweb="tab-list"] {
-                background: rgba(255, 255, 255, 0.9) !important;
-                border-radius: 10px !important;
-                border: 1px solid #dee2e6 !important;
-            }
-            
-            .stTabs [data-baseweb="tab"] {
-                color: #6c757d !important;
-                font-weight: bold !important;
-            }
-            
-            .stTabs [aria-selected="true"] {
-                background: rgba(248, 249, 250, 0.8) !important;
-                color: #495057 !important;
-            }
-            
-            .stSelectbox > div > div {
-                background: rgba(255, 255, 255, 0.95) !important;
-                color: #2c3e50 !important;
-                border: 2px solid #ced4da !important;
-            }
-            
-            .theme-toggle {
-                position: fixed !important;
-                top: 1rem !important;
-                right: 1rem !important;
-                z-index: 999 !important;
-                background: rgba(255, 255, 255, 0.95) !important;
-                padding: 0.5rem !important;
-                border-radius: 25px !important;
-                border: 2px solid #dee2e6 !important;
-            }
-        </style>
-        """
-
-
 
 def main():
+    # Expose API call metrics when METRICS_PORT is set (started once per process)
+    start_metrics_server()
+    
     # Initialize session state for theme
     if 'dark_mode' not in st.session_state:
         st.session_state.dark_mode = False
@@ -344,20 +47,33 @@ def main():
             st.session_state.dark_mode = not st.session_state.dark_mode
             st.rerun()
     
-    # Apply theme CSS
-    st.markdown(get_theme_css(st.session_state.dark_mode), unsafe_allow_html=True)
+    # Apply theme CSS: a link to the precompiled stylesheet, or inline CSS that
+    # the client caches after the first run (see global.minCachedMessageSize)
+    st.markdown(theme_html("dark" if st.session_state.dark_mode else "light"), unsafe_allow_html=True)
     
     # Main header
     st.markdown('<h1 class="main-header">🍳 Cuisine Companion</h1>', unsafe_allow_html=True)
     st.markdown('<p class="instruction-text" style="text-align: center;">Tell me what ingredients you have, and I\'ll suggest delicious recipes you can make!</p>', unsafe_allow_html=True)
     
     # Initialize session state
-    if 'ingredients' not in st.session_state:
-        st.session_state.ingredients = []
+    if 'pantry' not in st.session_state:
+        # Restore the pantry saved under the id in the page address, so returning users keep their ingredients
+        st.session_state.pantry = open_pantry(st.query_params.get("pantry"))
+        st.query_params["pantry"] = st.session_state.pantry.user_id
     if 'current_recipe' not in st.session_state:
         st.session_state.current_recipe = None
     if 'processing' not in st.session_state:
         st.session_state.processing = False
+    if 'seen_recipes' not in st.session_state:
+        st.session_state.seen_recipes = []
+    if 'recipe_options' not in st.session_state:
+        st.session_state.recipe_options = []
+    if 'recipe_page' not in st.session_state:
+        st.session_state.recipe_page = 0
+    if 'prefetcher' not in st.session_state:
+        st.session_state.prefetcher = RecipePrefetcher()
+    if 'photo_errors' not in st.session_state:
+        st.session_state.photo_errors = []
 
     # Create tabs for different input methods
     tab1, tab2, tab3 = st.tabs(["📝 Type Ingredients", "📷 Photo of Ingredients", "🎤 Voice Input"])
@@ -372,11 +88,11 @@ def main():
         handle_voice_input()
     
     # Display current ingredients
-    if st.session_state.ingredients:
+    if st.session_state.pantry:
         display_ingredients()
     
     # Generate recipe button
-    if st.session_state.ingredients and not st.session_state.processing:
+    if st.session_state.pantry and not st.session_state.processing:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🍽️ Get Recipe Suggestions", type="primary", use_container_width=True):
@@ -386,6 +102,7 @@ def main():
     if st.session_state.current_recipe:
         display_recipe()
 
+@st.fragment
 def handle_text_input():
     st.markdown('<h2 class="section-header">Type Your Ingredients</h2>', unsafe_allow_html=True)
     st.markdown('<p class="instruction-text">Enter the ingredients you have, separated by commas (e.g., chicken, rice, onions, tomatoes)</p>', unsafe_allow_html=True)
@@ -403,55 +120,77 @@ def handle_text_input():
             if ingredient_input.strip():
                 new_ingredients = [ing.strip() for ing in ingredient_input.split(',') if ing.strip()]
                 validated_ingredients = validate_ingredients(new_ingredients)
-                st.session_state.ingredients.extend(validated_ingredients)
-                st.session_state.ingredients = list(set(st.session_state.ingredients))  # Remove duplicates
+                st.session_state.pantry.add(validated_ingredients)
                 st.rerun()
             else:
                 st.error("Please enter some ingredients first.")
     
     with col2:
         if st.button("Clear All", use_container_width=True):
-            st.session_state.ingredients = []
+            st.session_state.pantry.clear()
             st.session_state.current_recipe = None
+            st.session_state.seen_recipes = []
+            st.session_state.recipe_options = []
+            st.session_state.prefetcher.cancel()
             st.rerun()
 
+@st.fragment
 def handle_photo_input():
     st.markdown('<h2 class="section-header">Photo of Your Ingredients</h2>', unsafe_allow_html=True)
-    st.markdown('<p class="instruction-text">Take a photo of your ingredients or upload an image from your device</p>', unsafe_allow_html=True)
+    st.markdown('<p class="instruction-text">Take photos of your ingredients or upload images from your device. You can add several at once, such as the fridge, the cupboard and the freezer.</p>', unsafe_allow_html=True)
     
-    uploaded_file = st.file_uploader(
-        "Choose an image file",
+    uploaded_files = st.file_uploader(
+        "Choose image files",
         type=['png', 'jpg', 'jpeg'],
+        accept_multiple_files=True,
         label_visibility="collapsed"
     )
     
-    if uploaded_file is not None:
-        # Display the uploaded image
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Your ingredients photo", use_column_width=True)
+    if uploaded_files:
+        # Decode once per distinct upload and show small previews instead of the full images
+        photos = [decode_photo(uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+        columns = st.columns(min(len(photos), 3))
+        for i, (uploaded_file, photo) in enumerate(zip(uploaded_files, photos)):
+            with columns[i % len(columns)]:
+                st.image(photo.thumbnail, caption=uploaded_file.name, use_column_width=True)
         
-        if st.button("🔍 Recognize Ingredients from Photo", use_container_width=True):
-            with st.spinner("Analyzing your photo... This may take a moment."):
-                try:
-                    # Convert image to base64
-                    img_buffer = io.BytesIO()
-                    image.save(img_buffer, format='JPEG')
-                    img_str = base64.b64encode(img_buffer.getvalue()).decode()
-                    
-                    # Recognize ingredients using OpenAI Vision
-                    recognized_ingredients = recognize_ingredients_from_image(img_str)
-                    
-                    if recognized_ingredients:
-                        st.session_state.ingredients.extend(recognized_ingredients)
-                        st.session_state.ingredients = list(set(st.session_state.ingredients))  # Remove duplicates
-                        st.markdown(f'<div class="success-message">Found ingredients: {", ".join(recognized_ingredients)}</div>', unsafe_allow_html=True)
-                        st.rerun()
-                    else:
-                        st.markdown('<div class="error-message">Could not identify any ingredients in the photo. Please try a clearer image.</div>', unsafe_allow_html=True)
-                        
-                except Exception as e:
-                    st.markdown(f'<div class="error-message">Error analyzing photo: {str(e)}</div>', unsafe_allow_html=True)
+        button_text = "🔍 Recognize Ingredients from Photo" if len(photos) == 1 else f"🔍 Recognize Ingredients from {len(photos)} Photos"
+        if st.button(button_text, use_container_width=True):
+            st.session_state.photo_errors = []
+            with st.spinner("Analyzing your photos... This may take a moment."):
+                progress = st.progress(0.0)
+                statuses = [st.empty() for _ in photos]
+                for status, uploaded_file in zip(statuses, uploaded_files):
+                    status.markdown(f'<p class="instruction-text">⏳ {uploaded_file.name}: analyzing...</p>', unsafe_allow_html=True)
+                
+                # All photos are sent at once (or answered from the cache); each reports as it finishes
+                found = []
+                for done, (index, ingredients, error) in enumerate(recognize_ingredients_from_photos(photos), 1):
+                    name = uploaded_files[index].name
+                    progress.progress(done / len(photos))
+                    if error is not None:
+                        st.session_state.photo_errors.append((name, str(error)))
+                        statuses[index].markdown(f'<div class="error-message">Error analyzing {name}: {str(error)}</div>', unsafe_allow_html=True)
+                        continue
+                    ingredients = validate_ingredients(ingredients)
+                    found.extend(ingredients)
+                    statuses[index].markdown(f'<div class="success-message">{name}: {", ".join(ingredients) or "no ingredients found"}</div>', unsafe_allow_html=True)
+                
+                recognized_ingredients = validate_ingredients(found)
+                if recognized_ingredients:
+                    st.session_state.pantry.add(recognized_ingredients)
+                    # Rerun the whole app so the ingredient list outside this fragment updates;
+                    # any failed photos are shown again from session state
+                    st.rerun()
+                elif not st.session_state.photo_errors:
+                    st.markdown('<div class="error-message">Could not identify any ingredients in the photos. Please try clearer images.</div>', unsafe_allow_html=True)
+        else:
+            names = {uploaded_file.name for uploaded_file in uploaded_files}
+            for name, error in st.session_state.photo_errors:
+                if name in names:
+                    st.markdown(f'<div class="error-message">Error analyzing {name}: {error}</div>', unsafe_allow_html=True)
 
+@st.fragment
 def handle_voice_input():
     st.markdown('<h2 class="section-header">Voice Input</h2>', unsafe_allow_html=True)
     st.markdown('<p class="instruction-text">Record yourself saying what ingredients you have</p>', unsafe_allow_html=True)
@@ -471,26 +210,17 @@ def handle_voice_input():
         if st.button("🎧 Convert Speech to Text", use_container_width=True):
             with st.spinner("Converting your speech to text... Please wait."):
                 try:
-                    # Save uploaded file temporarily
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-                        tmp_file.write(audio_file.getvalue())
-                        tmp_file_path = tmp_file.name
-                    
-                    # Transcribe audio using OpenAI Whisper
-                    transcribed_text = transcribe_audio_to_text(tmp_file_path)
-                    
-                    # Clean up temporary file
-                    os.unlink(tmp_file_path)
+                    # Transcribe audio using OpenAI Whisper straight from the upload buffer
+                    transcribed_text = transcribe_audio_to_text(audio_file, filename=audio_file.name)
                     
                     if transcribed_text:
                         st.markdown(f'<div class="success-message">You said: "{transcribed_text}"</div>', unsafe_allow_html=True)
                         
                         # Extract ingredients from transcribed text
-                        ingredients_from_speech = extract_ingredients_from_text(transcribed_text)
+                        ingredients_from_speech = validate_ingredients(extract_ingredients_from_text(transcribed_text))
                         
                         if ingredients_from_speech:
-                            st.session_state.ingredients.extend(ingredients_from_speech)
-                            st.session_state.ingredients = list(set(st.session_state.ingredients))  # Remove duplicates
+                            st.session_state.pantry.add(ingredients_from_speech)
                             st.markdown(f'<div class="success-message">Added ingredients: {", ".join(ingredients_from_speech)}</div>', unsafe_allow_html=True)
                             st.rerun()
                         else:
@@ -510,91 +240,168 @@ def extract_ingredients_from_text(text):
         st.error(f"Error extracting ingredients: {str(e)}")
         return []
 
+@st.fragment
 def display_ingredients():
     st.markdown('<h2 class="section-header">Your Ingredients</h2>', unsafe_allow_html=True)
     
     # Display ingredients in a nice format
-    ingredients_text = ", ".join(st.session_state.ingredients)
+    ingredients = st.session_state.pantry.names
+    ingredients_text = ", ".join(ingredients)
     st.markdown(f'<div class="ingredient-list">🥕 {ingredients_text}</div>', unsafe_allow_html=True)
     
     # Option to remove individual ingredients
-    if len(st.session_state.ingredients) > 1:
+    if len(ingredients) > 1:
         st.markdown('<p class="instruction-text">Remove an ingredient:</p>', unsafe_allow_html=True)
         ingredient_to_remove = st.selectbox(
             "Select ingredient to remove:",
-            options=st.session_state.ingredients,
+            options=ingredients,
             label_visibility="collapsed"
         )
         
         if st.button(f"Remove {ingredient_to_remove}", use_container_width=True):
-            st.session_state.ingredients.remove(ingredient_to_remove)
+            st.session_state.pantry.remove(ingredient_to_remove)
             st.rerun()
 
-def generate_recipe():
+def generate_recipe(another=False, novel=False):
     st.session_state.processing = True
     
     with st.spinner("Finding delicious recipes for you... This may take a moment."):
         try:
-            recipe = generate_recipe_from_ingredients(st.session_state.ingredients)
-            st.session_state.current_recipe = recipe
+            # Skip recipes this session has already seen when asking for another one
+            exclude = st.session_state.seen_recipes if another else None
+            recipes = None
+            if not novel:
+                # Answer from the local recipe collection when it has a good match
+                recipes = find_local_recipes(st.session_state.pantry.names, limit=RECIPE_BATCH_SIZE, exclude=exclude) or None
+            if recipes is None and another and PREFETCH_RECIPES:
+                # Use a recipe prepared in the background if one is ready
+                recipe = st.session_state.prefetcher.take(st.session_state.pantry.names, exclude)
+                if recipe is not None:
+                    recipes = [recipe]
+            if recipes is None and RECIPE_BATCH_SIZE > 1:
+                if STREAM_RECIPES:
+                    recipes = stream_recipes(exclude)
+                else:
+                    recipes = generate_recipes(st.session_state.pantry.names, n=RECIPE_BATCH_SIZE, exclude=exclude)
+            elif recipes is None:
+                if STREAM_RECIPES:
+                    recipes = [stream_recipe(exclude)]
+                else:
+                    recipes = [generate_recipe_from_ingredients(st.session_state.pantry.names, exclude=exclude)]
+            
+            if not another:
+                st.session_state.recipe_options = []
+            st.session_state.recipe_options.extend(recipes)
+            show_recipe_page(len(st.session_state.recipe_options) - len(recipes))
             st.session_state.processing = False
             st.rerun()
         except Exception as e:
             st.session_state.processing = False
             st.markdown(f'<div class="error-message">Error generating recipe: {str(e)}</div>', unsafe_allow_html=True)
 
+def show_recipe_page(page):
+    """Make one of the fetched recipes the current recipe"""
+    st.session_state.recipe_page = page
+    recipe = st.session_state.recipe_options[page]
+    st.session_state.current_recipe = recipe
+    if recipe not in st.session_state.seen_recipes:
+        st.session_state.seen_recipes.append(recipe)
+
+def stream_recipe(exclude=None):
+    """Render a recipe while it streams in and return the finished recipe"""
+    placeholder = st.empty()
+    recipe = None
+    for recipe in stream_recipe_from_ingredients(st.session_state.pantry.names, exclude=exclude):
+        placeholder.markdown(recipe_markdown(recipe))
+    return recipe
+
+def stream_recipes(exclude=None):
+    """Render a batch of recipes while they stream in and return the finished list"""
+    placeholder = st.empty()
+    recipes = []
+    for recipes in stream_recipes_from_ingredients(st.session_state.pantry.names, n=RECIPE_BATCH_SIZE, exclude=exclude):
+        placeholder.markdown("\n\n---\n\n".join(recipe_markdown(recipe) for recipe in recipes))
+    return recipes
+
+def recipe_markdown(recipe):
+    """Build the markdown for a (possibly partial) structured recipe"""
+    if not isinstance(recipe, dict):
+        return str(recipe)
+    
+    lines = [f"### {recipe.get('title') or 'Suggested Recipe'}"]
+    
+    if recipe.get('description'):
+        lines.append(f"**Description:** {recipe['description']}")
+    
+    if recipe.get('prep_time'):
+        lines.append(f"**Preparation Time:** {recipe['prep_time']}")
+    
+    if recipe.get('servings'):
+        lines.append(f"**Servings:** {recipe['servings']}")
+    
+    if isinstance(recipe.get('ingredients'), list) and recipe['ingredients']:
+        lines.append("**Ingredients:**")
+        lines.extend(f"• {ingredient}" for ingredient in recipe['ingredients'])
+    
+    if isinstance(recipe.get('instructions'), list) and recipe['instructions']:
+        lines.append("**Instructions:**")
+        lines.extend(f"{i}. {instruction}" for i, instruction in enumerate(recipe['instructions'], 1))
+    
+    if isinstance(recipe.get('tips'), list) and recipe['tips']:
+        lines.append("**Tips:**")
+        lines.extend(f"💡 {tip}" for tip in recipe['tips'])
+    
+    return "\n\n".join(lines)
+
+@st.fragment
 def display_recipe():
     st.markdown('<h2 class="section-header">🍽️ Recipe Suggestions</h2>', unsafe_allow_html=True)
     
     recipe = st.session_state.current_recipe
     
-    # Display recipe in a formatted container
-    st.markdown('<div class="recipe-container">', unsafe_allow_html=True)
+    # Display the whole recipe as one block inside the formatted container; recipe text is
+    # model output, so it is rendered as plain markdown and styled through the container's key
+    with st.container(key="recipe-container"):
+        st.markdown(recipe_markdown(recipe))
     
-    if isinstance(recipe, dict):
-        # If recipe is structured JSON
-        st.markdown(f"### {recipe.get('title', 'Suggested Recipe')}")
-        
-        if recipe.get('description'):
-            st.markdown(f"**Description:** {recipe['description']}")
-        
-        if recipe.get('prep_time'):
-            st.markdown(f"**Preparation Time:** {recipe['prep_time']}")
-        
-        if recipe.get('servings'):
-            st.markdown(f"**Servings:** {recipe['servings']}")
-        
-        if recipe.get('ingredients'):
-            st.markdown("**Ingredients:**")
-            for ingredient in recipe['ingredients']:
-                st.markdown(f"• {ingredient}")
-        
-        if recipe.get('instructions'):
-            st.markdown("**Instructions:**")
-            for i, instruction in enumerate(recipe['instructions'], 1):
-                st.markdown(f"{i}. {instruction}")
-        
-        if recipe.get('tips'):
-            st.markdown("**Tips:**")
-            for tip in recipe['tips']:
-                st.markdown(f"💡 {tip}")
-    else:
-        # If recipe is plain text
-        st.markdown(recipe)
-    
-    st.markdown('</div>', unsafe_allow_html=True)
+    # Let the user page back through the recipes fetched so far
+    options = st.session_state.recipe_options
+    page = st.session_state.recipe_page
+    if len(options) > 1:
+        st.markdown(f'<p class="instruction-text" style="text-align: center;">Recipe {page + 1} of {len(options)}</p>', unsafe_allow_html=True)
     
     # Option to get another recipe
-    col1, col2 = st.columns([1, 1])
+    if page > 0:
+        col0, col1, col2 = st.columns([1, 1, 1])
+        with col0:
+            if st.button("◀️ Previous Recipe", use_container_width=True):
+                show_recipe_page(page - 1)
+                st.rerun(scope="fragment")
+    else:
+        col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("🔄 Get Another Recipe", use_container_width=True):
-            generate_recipe()
+            # Page to the next recipe of the current batch without calling the API
+            if page + 1 < len(options):
+                show_recipe_page(page + 1)
+                st.rerun(scope="fragment")
+            generate_recipe(another=True)
+        if st.button("✨ Something New", use_container_width=True):
+            generate_recipe(another=True, novel=True)
     
     with col2:
         if st.button("🆕 Start Over", use_container_width=True):
-            st.session_state.ingredients = []
+            st.session_state.pantry.clear()
             st.session_state.current_recipe = None
+            st.session_state.seen_recipes = []
+            st.session_state.recipe_options = []
+            st.session_state.prefetcher.cancel()
             st.rerun()
+    
+    # Prepare the next alternatives while the user reads this one
+    if PREFETCH_RECIPES:
+        known = st.session_state.seen_recipes + st.session_state.recipe_options
+        st.session_state.prefetcher.start(st.session_state.pantry.names, known)
 
 if __name__ == "__main__":
     main()
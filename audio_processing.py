@@ -0,0 +1,218 @@
+import io
+import os
+import shutil
+import subprocess
+import wave
+import numpy as np
+
+# Sample rate Whisper works at internally; anything higher is wasted upload
+TARGET_RATE = 16000
+# Clips longer than this (after trimming) are split and transcribed in parallel
+CHUNK_SECONDS = float(os.environ.get("AUDIO_CHUNK_SECONDS", 45))
+# How far back from a chunk boundary to look for a pause to cut at
+SPLIT_SEARCH_SECONDS = 10.0
+# Maximum number of chunks transcribed at the same time
+TRANSCRIBE_WORKERS = int(os.environ.get("AUDIO_TRANSCRIBE_WORKERS", 4))
+
+FRAME_SECONDS = 0.03
+# Frames quieter than this, relative to the loudest frame, count as silence
+SILENCE_DB = float(os.environ.get("AUDIO_SILENCE_DB", -40))
+# Silence kept around speech so words are not clipped
+PADDING_SECONDS = 0.25
+# Bitrate of chunks re-encoded as Opus when ffmpeg is available; 16 kHz PCM WAV is 256 kbit/s
+OPUS_BITRATE = os.environ.get("AUDIO_OPUS_BITRATE", "24k")
+
+
+def _decode_wav(audio_bytes):
+    with wave.open(io.BytesIO(audio_bytes), 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+
+    return samples.reshape(-1, channels), rate
+
+
+def _decode_ffmpeg(audio_bytes):
+    result = subprocess.run(
+        ["ffmpeg", "-v", "quiet", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(TARGET_RATE), "pipe:1"],
+        input=audio_bytes,
+        capture_output=True,
+        check=True
+    )
+    samples = np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768
+    return samples.reshape(-1, 1), TARGET_RATE
+
+
+def decode_audio(audio_bytes):
+    """Decode audio into a (frames, channels) float array and its sample rate
+
+    WAV is decoded directly; other formats need ffmpeg on the PATH. Returns
+    None when the audio cannot be decoded.
+    """
+    try:
+        return _decode_wav(audio_bytes)
+    except (wave.Error, EOFError, ValueError):
+        pass
+
+    if shutil.which("ffmpeg"):
+        try:
+            return _decode_ffmpeg(audio_bytes)
+        except subprocess.CalledProcessError:
+            pass
+    return None
+
+
+def to_mono(samples):
+    """Average all channels into one"""
+    if samples.ndim == 1:
+        return samples
+    return samples.mean(axis=1)
+
+
+def resample(samples, rate, target_rate=TARGET_RATE):
+    """Resample a mono signal, low-pass filtering first when downsampling"""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+
+    if target_rate < rate:
+        # Windowed-sinc low-pass at the new Nyquist frequency to avoid aliasing
+        cutoff = target_rate / rate / 2
+        taps = np.arange(-32, 33)
+        kernel = np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        samples = np.convolve(samples, kernel / kernel.sum(), mode='same')
+
+    duration = len(samples) / rate
+    target_length = int(round(duration * target_rate))
+    source_times = np.arange(len(samples)) / rate
+    target_times = np.arange(target_length) / target_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def frame_energy_db(samples, rate):
+    """RMS energy of consecutive frames in dB relative to the loudest frame"""
+    frame_length = max(1, int(rate * FRAME_SECONDS))
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.zeros(0)
+
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10
+    return 20 * np.log10(rms / rms.max())
+
+
+def trim_silence(samples, rate):
+    """Drop leading and trailing silence using a frame-energy voice activity check"""
+    energy = frame_energy_db(samples, rate)
+    voiced = np.flatnonzero(energy > SILENCE_DB)
+    if len(voiced) == 0:
+        return samples[:0]
+
+    frame_length = max(1, int(rate * FRAME_SECONDS))
+    padding = int(rate * PADDING_SECONDS)
+    start = max(0, voiced[0] * frame_length - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame_length + padding)
+    return samples[start:end]
+
+
+def split_at_silence(samples, rate, chunk_seconds=CHUNK_SECONDS):
+    """Split a signal into chunks of at most chunk_seconds, cutting at the quietest nearby frame"""
+    chunk_length = int(rate * chunk_seconds)
+    if len(samples) <= chunk_length:
+        return [samples]
+
+    frame_length = max(1, int(rate * FRAME_SECONDS))
+    energy = frame_energy_db(samples, rate)
+    search_frames = int(SPLIT_SEARCH_SECONDS / FRAME_SECONDS)
+
+    chunks = []
+    start = 0
+    while len(samples) - start > chunk_length:
+        limit_frame = (start + chunk_length) // frame_length
+        first_frame = max(start // frame_length + 1, limit_frame - search_frames)
+        window = energy[first_frame:limit_frame]
+        if len(window):
+            # Latest of the quietest frames, so chunks stay as long as allowed
+            quietest = len(window) - 1 - int(np.argmin(window[::-1]))
+            cut = (first_frame + quietest) * frame_length
+        else:
+            cut = start + chunk_length
+        chunks.append(samples[start:cut])
+        start = cut
+    chunks.append(samples[start:])
+    return chunks
+
+
+def _to_pcm16(samples):
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2')
+
+
+def encode_wav(samples, rate=TARGET_RATE):
+    """Encode a mono float signal as 16-bit PCM WAV bytes"""
+    pcm = _to_pcm16(samples)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def encode_opus(samples, rate=TARGET_RATE):
+    """Encode a mono float signal as Opus in an Ogg container with ffmpeg"""
+    result = subprocess.run(
+        ["ffmpeg", "-v", "quiet", "-f", "s16le", "-ac", "1", "-ar", str(rate), "-i", "pipe:0",
+         "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip", "-f", "ogg", "pipe:1"],
+        input=_to_pcm16(samples).tobytes(),
+        capture_output=True,
+        check=True
+    )
+    return result.stdout
+
+
+def encode_chunk(samples):
+    """Encode a chunk as compactly as possible: Opus when ffmpeg can, WAV otherwise; returns (extension, bytes)"""
+    if shutil.which("ffmpeg"):
+        try:
+            data = encode_opus(samples)
+            if data:
+                return "ogg", data
+        except subprocess.CalledProcessError:
+            # e.g. an ffmpeg build without libopus
+            pass
+    return "wav", encode_wav(samples)
+
+
+def prepare_audio_chunks(audio_bytes, filename="audio.wav"):
+    """Turn an uploaded clip into a list of (filename, audio_bytes) chunks for Whisper
+
+    Audio is downmixed to mono, resampled to 16 kHz, trimmed of leading and
+    trailing silence and split at pauses when long. If the clip cannot be
+    decoded, or a clip that needs no splitting would only grow by being
+    re-encoded, it is returned unchanged as a single chunk.
+    """
+    decoded = decode_audio(audio_bytes)
+    if decoded is None:
+        return [(filename, audio_bytes)]
+
+    samples, rate = decoded
+    samples = resample(to_mono(samples), rate)
+    samples = trim_silence(samples, TARGET_RATE)
+    if len(samples) == 0:
+        return []
+
+    chunks = [encode_chunk(chunk) for chunk in split_at_silence(samples, TARGET_RATE)]
+    if len(chunks) == 1 and len(chunks[0][1]) >= len(audio_bytes):
+        # Already compact, such as a compressed voice note, so trimming would not pay for itself
+        return [(filename, audio_bytes)]
+    return [(f"chunk{i}.{extension}", data) for i, (extension, data) in enumerate(chunks)]
@@ -0,0 +1,271 @@
+"""Local stand-in for the parts of the OpenAI HTTP API the app uses.
+
+Serves canned chat completion (JSON, vision and streamed) and Whisper
+transcription responses with configurable, randomised latency so the app
+can be benchmarked without network access. Point the OpenAI client at it
+with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_RECIPE = {
+    "title": "Chicken and Rice Skillet",
+    "description": "A gentle one-pan dinner with tender chicken, fluffy rice and soft onions.",
+    "prep_time": "35 minutes",
+    "servings": "2",
+    "ingredients": [
+        "2 chicken breasts, diced",
+        "1 cup long-grain rice",
+        "1 onion, finely chopped",
+        "2 cups low-sodium chicken stock",
+        "1 tablespoon olive oil",
+        "Salt and pepper to taste"
+    ],
+    "instructions": [
+        "Heat the olive oil in a large pan over medium heat.",
+        "Add the onion and cook for 5 minutes until soft.",
+        "Add the chicken and cook until no longer pink, about 6 minutes.",
+        "Stir in the rice and stock, then bring to a gentle simmer.",
+        "Cover and cook for 18 minutes until the rice is tender.",
+        "Season with salt and pepper and rest for 5 minutes before serving."
+    ],
+    "tips": [
+        "Use a pan with a heavy base so the rice does not stick.",
+        "Check the chicken is cooked through before serving."
+    ]
+}
+
+CANNED_INGREDIENTS = ["chicken", "rice", "onion", "tomato", "carrot", "garlic"]
+
+CANNED_TRANSCRIPT = "I have some chicken, a bag of rice, two onions, a few tomatoes and some garlic."
+
+
+class LatencyModel:
+    """Log-normal latency around a median, in seconds"""
+
+    def __init__(self, median_ms, sigma=0.3):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(random.gauss(0, self.sigma))
+
+
+class MockConfig:
+    """Latency settings for each kind of request"""
+
+    def __init__(self, chat_ms=400, vision_ms=800, whisper_ms=600, ttfb_ms=150, token_ms=5, sigma=0.3, error_rate=0.0):
+        self.chat = LatencyModel(chat_ms, sigma)
+        self.vision = LatencyModel(vision_ms, sigma)
+        self.whisper = LatencyModel(whisper_ms, sigma)
+        self.ttfb = LatencyModel(ttfb_ms, sigma)
+        self.token_delay = token_ms / 1000
+        # Fraction of requests answered with a 429 rate-limit error
+        self.error_rate = error_rate
+        self.requests = {'chat': 0, 'vision': 0, 'stream': 0, 'whisper': 0, 'rate_limited': 0}
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def count(self, kind, size):
+        with self._lock:
+            self.requests[kind] += 1
+            self.bytes_received += size
+
+
+def _message_text(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _has_image(messages):
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def canned_content(request):
+    """Pick a canned assistant reply that matches what the request asks for"""
+    messages = request.get("messages", [])
+    wants_json = (request.get("response_format") or {}).get("type") == "json_object"
+    text = " ".join(_message_text(message) for message in messages)
+
+    if _has_image(messages) or "ingredients mentioned" in text or "identifying food ingredients" in text:
+        if wants_json:
+            return json.dumps({"ingredients": CANNED_INGREDIENTS})
+        return ", ".join(CANNED_INGREDIENTS)
+
+    if not wants_json:
+        return f"{CANNED_RECIPE['title']}\n\n" + "\n".join(CANNED_RECIPE["instructions"])
+
+    if '"recipes"' in text:
+        recipes = []
+        for i in range(3):
+            recipe = dict(CANNED_RECIPE)
+            recipe["title"] = f"{CANNED_RECIPE['title']} #{i + 1}"
+            recipes.append(recipe)
+        return json.dumps({"recipes": recipes})
+
+    return json.dumps(CANNED_RECIPE)
+
+
+def _usage(request, content):
+    prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            self.config.count('rate_limited', len(body))
+            self._rate_limited()
+            return
+        if self.path.endswith("/chat/completions"):
+            self._chat(json.loads(body), len(body))
+        elif self.path.endswith("/audio/transcriptions"):
+            self.config.count('whisper', len(body))
+            time.sleep(self.config.whisper.sample())
+            self._send_json({"text": CANNED_TRANSCRIPT})
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def _rate_limited(self):
+        body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", "0.05")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chat(self, request, size):
+        content = canned_content(request)
+        if request.get("stream"):
+            self.config.count('stream', size)
+            self._stream(request, content)
+            return
+
+        is_vision = _has_image(request.get("messages", []))
+        self.config.count('vision' if is_vision else 'chat', size)
+        time.sleep((self.config.vision if is_vision else self.config.chat).sample())
+        self._send_json({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": _usage(request, content)
+        })
+
+    def _stream(self, request, content):
+        time.sleep(self.config.ttfb.sample())
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            })
+
+        send_event(chunk({"role": "assistant", "content": ""}))
+        # Roughly one token per four characters
+        for start in range(0, len(content), 4):
+            if self.config.token_delay:
+                time.sleep(self.config.token_delay)
+            send_event(chunk({"content": content[start:start + 4]}))
+        send_event(chunk({}, finish_reason="stop"))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Start the mock server on a background thread and return it
+
+    The base URL for the OpenAI client is server.base_url.
+    """
+    handler = type("ConfiguredHandler", (MockOpenAIHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.config = handler.config
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chat-ms", type=float, default=400)
+    parser.add_argument("--vision-ms", type=float, default=800)
+    parser.add_argument("--whisper-ms", type=float, default=600)
+    parser.add_argument("--ttfb-ms", type=float, default=150)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        args.chat_ms, args.vision_ms, args.whisper_ms, args.ttfb_ms, args.token_ms, args.sigma, args.error_rate
+    )
+    server = start_server(config, port=args.port)
+    print(f"Mock OpenAI API listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
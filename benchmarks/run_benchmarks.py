@@ -0,0 +1,252 @@
+"""Offline latency, throughput and allocation benchmarks for the app's API paths.
+
+Starts the local mock OpenAI server, points openai_helper at it and times
+the text, photo and voice paths. Results are printed and can be saved as
+JSON and compared against an earlier run:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import MockConfig, start_server, CANNED_TRANSCRIPT
+
+INGREDIENTS = ["chicken", "rice", "onions", "tomatoes", "garlic", "olive oil"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def make_photo():
+    """A synthetic 12 MP phone photo"""
+    from PIL import Image
+    return Image.effect_noise((4000, 3000), 60).convert("RGB")
+
+
+def make_voice_clip(seconds=20):
+    """A synthetic voice note with pauses between bursts of sound"""
+    import numpy as np
+    from audio_processing import encode_wav
+    rate = 44100
+    t = np.arange(int(rate * seconds)) / rate
+    samples = 0.4 * np.sin(2 * np.pi * 220 * t) * ((t % 4) < 3)
+    return encode_wav(samples.astype(np.float32), rate)
+
+
+def make_recipe_matrix(recipes=100_000, vocabulary=2000):
+    """A synthetic corpus of recipes with 4 to 12 ingredients each"""
+    import random
+    from recipe_matrix import RecipeMatrix
+    rng = random.Random(0)
+    names = [f"ingredient {i}" for i in range(vocabulary)]
+    required = [frozenset(rng.sample(names, rng.randint(4, 12))) for _ in range(recipes)]
+    return RecipeMatrix.build(required, ["Easy"] * recipes, staples=names[:10]), names[10:40]
+
+
+def build_scenarios():
+    import base64
+    import openai_helper
+    import recipe_index
+    import parsing
+
+    photo = make_photo()
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG")
+    raw_photo = base64.b64encode(buffer.getvalue()).decode()
+    voice_clip = make_voice_clip()
+    pantry = [f"{name} " for name in INGREDIENTS * 40] + ["and", "some", "Tomatoes!"]
+    large_matrix, large_pantry = make_recipe_matrix()
+
+    def recipe_stream():
+        start = time.perf_counter()
+        first = None
+        for _ in openai_helper.stream_recipe_from_ingredients(INGREDIENTS, use_cache=False):
+            if first is None:
+                first = time.perf_counter() - start
+        return {"first_content": first}
+
+    # Warm the recipe cache for the cached scenario
+    openai_helper.generate_recipe_from_ingredients(INGREDIENTS)
+
+    return {
+        "recipe": lambda: openai_helper.generate_recipe_from_ingredients(INGREDIENTS, use_cache=False),
+        "recipe_cached": lambda: openai_helper.generate_recipe_from_ingredients(INGREDIENTS),
+        "recipe_stream": recipe_stream,
+        "recipe_local": lambda: recipe_index.find_local_recipes(INGREDIENTS),
+        "recipe_rank_100k": lambda: large_matrix.top_k(large_pantry, 5),
+        "recipe_batch": lambda: openai_helper.generate_recipes(INGREDIENTS, n=3, use_cache=False),
+        "photo_raw": lambda: openai_helper.recognize_ingredients_from_image(raw_photo),
+        "photo": lambda: openai_helper.recognize_ingredients_from_photo(photo, use_cache=False),
+        "voice": lambda: openai_helper.transcribe_audio_to_text(voice_clip, filename="clip.wav", use_cache=False),
+        "speech_extraction": lambda: openai_helper.extract_ingredients_from_speech(CANNED_TRANSCRIPT),
+        "validate_ingredients": lambda: parsing.validate_ingredients(pantry),
+    }
+
+
+def run_latency(func, iterations):
+    samples = []
+    extras = {}
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+        if isinstance(result, dict) and "first_content" in result:
+            extras.setdefault("first_content", []).append(result["first_content"] or 0.0)
+    summary = summarize(samples)
+    for name, values in extras.items():
+        summary[f"{name}_p50_ms"] = percentile(values, 50) * 1000
+        summary[f"{name}_p95_ms"] = percentile(values, 95) * 1000
+    return summary
+
+
+def run_throughput(func, calls, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: func(), range(calls)))
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "calls": calls, "ops_per_sec": calls / elapsed if elapsed else 0.0}
+
+
+def run_allocations(func, iterations):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(iterations):
+        func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    return {"peak_kb": peak / 1024, "retained_kb_per_call": allocated / 1024 / iterations}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'scenario':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'peak KB':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        latency = result["latency"]
+        line = (
+            f"{name:<22}{latency['p50_ms']:>10.1f}{latency['p95_ms']:>10.1f}{latency['p99_ms']:>10.1f}"
+            f"{result['throughput']['ops_per_sec']:>10.1f}{result['allocations']['peak_kb']:>10.0f}"
+        )
+        if baseline and name in baseline:
+            old = baseline[name]["latency"]["p50_ms"]
+            if old:
+                line += f"  p50 {(latency['p50_ms'] - old) / old * 100:+.1f}%"
+        print(line)
+        if "first_content_p50_ms" in latency:
+            print(f"{'':<22}first content p50 {latency['first_content_p50_ms']:.1f} ms, p95 {latency['first_content_p95_ms']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app against a local mock OpenAI API")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--throughput-calls", type=int, default=40)
+    parser.add_argument("--allocation-iterations", type=int, default=5)
+    parser.add_argument("--scenario", action="append", help="Only run the named scenario (repeatable)")
+    parser.add_argument("--chat-ms", type=float, default=400)
+    parser.add_argument("--vision-ms", type=float, default=800)
+    parser.add_argument("--whisper-ms", type=float, default=600)
+    parser.add_argument("--ttfb-ms", type=float, default=150)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests the mock answers with 429")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare against results saved by an earlier run")
+    args = parser.parse_args()
+
+    mock_config = {
+        "chat_ms": args.chat_ms,
+        "vision_ms": args.vision_ms,
+        "whisper_ms": args.whisper_ms,
+        "ttfb_ms": args.ttfb_ms,
+        "token_ms": args.token_ms,
+        "sigma": args.sigma,
+        "error_rate": args.error_rate,
+    }
+    server = start_server(MockConfig(**mock_config))
+
+    # Must be set before openai_helper is imported
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+    os.environ["CACHE_DIR"] = ""
+
+    scenarios = build_scenarios()
+    if args.scenario:
+        scenarios = {name: scenarios[name] for name in args.scenario}
+
+    results = {}
+    for name, func in scenarios.items():
+        func()  # warm up connections and lazy imports
+        results[name] = {
+            "latency": run_latency(func, args.iterations),
+            "throughput": run_throughput(func, args.throughput_calls, args.concurrency),
+            "allocations": run_allocations(func, args.allocation_iterations),
+        }
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "mock": mock_config,
+            "requests": server.config.requests,
+            "request_bytes": server.config.bytes_received,
+        },
+        "results": results,
+    }
+    server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from normalization import normalize_ingredients
+
+# Directory holding the persistent cache database
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+
+
+def make_key(*parts):
+    """Build a stable hex key from JSON-serialisable parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def canonical_ingredients(ingredients):
+    """Return a sorted, de-duplicated list of canonical names for an ingredient list"""
+    return sorted(normalize_ingredients(ingredients))
+
+
+def ingredients_key(ingredients, namespace="recipe"):
+    """Order-independent cache key for an ingredient list"""
+    return make_key(namespace, canonical_ingredients(ingredients))
+
+
+def fingerprint(value):
+    """Identify a cached value so callers can ask for a different variant"""
+    return make_key(value)
+
+
+def default_db_path():
+    """Location of the shared cache database, or None when disk caching is off"""
+    if not CACHE_DIR:
+        return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, "cuisine_companion.sqlite3")
+
+
+class TwoTierCache:
+    """In-process LRU in front of a persistent SQLite table.
+
+    Each key holds up to ``max_variants`` values so that repeated requests
+    for the same input can be served different results.
+    """
+
+    def __init__(self, name, path=None, ttl=None, max_memory=256, max_disk=5000, max_variants=1):
+        self.name = name
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.max_variants = max(1, max_variants)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS cache_{name} ("
+                "key TEXT PRIMARY KEY, variants TEXT NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS cache_{name}_accessed ON cache_{name} (accessed)"
+            )
+            self._db.commit()
+
+    def _fresh(self, variants, now):
+        if not self.ttl:
+            return variants
+        return [(created, value) for created, value in variants if now - created < self.ttl]
+
+    def _load(self, key, now):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key], 'memory'
+
+        if self._db is None:
+            return [], None
+
+        row = self._db.execute(
+            f"SELECT variants FROM cache_{self.name} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return [], None
+
+        variants = [tuple(v) for v in json.loads(row[0])]
+        self._db.execute(
+            f"UPDATE cache_{self.name} SET accessed = ? WHERE key = ?", (now, key)
+        )
+        self._db.commit()
+        self._remember(key, variants)
+        return variants, 'disk'
+
+    def _remember(self, key, variants):
+        self._memory[key] = variants
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _persist(self, key, variants, now):
+        if self._db is None:
+            return
+        self._db.execute(
+            f"INSERT OR REPLACE INTO cache_{self.name} (key, variants, accessed) VALUES (?, ?, ?)",
+            (key, json.dumps(variants), now)
+        )
+        count = self._db.execute(f"SELECT COUNT(*) FROM cache_{self.name}").fetchone()[0]
+        if count > self.max_disk:
+            self._db.execute(
+                f"DELETE FROM cache_{self.name} WHERE key IN ("
+                f"SELECT key FROM cache_{self.name} ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_disk,)
+            )
+            self.stats['evictions'] += count - self.max_disk
+        self._db.commit()
+
+    def get(self, key, exclude=None):
+        """Return a cached value for key, skipping any whose fingerprint is in exclude"""
+        now = time.time()
+        with self._lock:
+            variants, tier = self._load(key, now)
+            variants = self._fresh(variants, now)
+            for _, value in variants:
+                if exclude and fingerprint(value) in exclude:
+                    continue
+                self.stats['hits'] += 1
+                self.stats[f'{tier}_hits'] += 1
+                return value
+            self.stats['misses'] += 1
+            return None
+
+    def get_many(self, key, limit, exclude=None):
+        """Return up to limit cached values for key, skipping fingerprints in exclude
+
+        Only counts as a hit when all limit values are available.
+        """
+        now = time.time()
+        with self._lock:
+            variants, tier = self._load(key, now)
+            values = [
+                value for _, value in self._fresh(variants, now)
+                if not (exclude and fingerprint(value) in exclude)
+            ][:limit]
+            if len(values) == limit:
+                self.stats['hits'] += 1
+                self.stats[f'{tier}_hits'] += 1
+            else:
+                self.stats['misses'] += 1
+            return values
+
+    def set(self, key, value):
+        """Store value as the newest variant for key"""
+        now = time.time()
+        with self._lock:
+            variants, _ = self._load(key, now)
+            variants = [v for v in self._fresh(variants, now) if v[1] != value]
+            variants.append((now, value))
+            variants = variants[-self.max_variants:]
+            self._remember(key, variants)
+            self._persist(key, variants, now)
+            self.stats['stores'] += 1
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM cache_{self.name}")
+                self._db.commit()
+
+    def get_stats(self):
+        """Return a snapshot of the hit/miss counters"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['memory_entries'] = len(self._memory)
+        return stats
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two integer hashes"""
+    return bin(a ^ b).count('1')
+
+
+class PerceptualCache:
+    """Near-duplicate lookup of values keyed on 64-bit perceptual hashes.
+
+    The hash is split into ``threshold + 1`` bands; any two hashes within
+    ``threshold`` bits must agree exactly on at least one band, so only
+    entries sharing a band need their full distance checked.
+    """
+
+    hash_bits = 64
+
+    def __init__(self, name, path=None, threshold=5, max_entries=5000):
+        self.name = name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bands = [dict() for _ in range(threshold + 1)]
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {
+            'hits': 0,
+            'exact_hits': 0,
+            'near_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+        band_count = threshold + 1
+        width, extra = divmod(self.hash_bits, band_count)
+        self._band_masks = []
+        shift = 0
+        for band in range(band_count):
+            bits = width + (1 if band < extra else 0)
+            self._band_masks.append((shift, (1 << bits) - 1))
+            shift += bits
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS phash_{name} ("
+                "hash TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                f"SELECT hash, value FROM phash_{name} ORDER BY accessed DESC LIMIT ?",
+                (max_entries,)
+            ).fetchall()
+            for hash_hex, value in reversed(rows):
+                self._index(int(hash_hex, 16), json.loads(value))
+
+    def _band_keys(self, hash_value):
+        return [(hash_value >> shift) & mask for shift, mask in self._band_masks]
+
+    def _index(self, hash_value, value):
+        if hash_value in self._entries:
+            self._entries[hash_value] = value
+            self._entries.move_to_end(hash_value)
+            return
+        self._entries[hash_value] = value
+        for band, key in zip(self._bands, self._band_keys(hash_value)):
+            band.setdefault(key, set()).add(hash_value)
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            for band, key in zip(self._bands, self._band_keys(oldest)):
+                band[key].discard(oldest)
+                if not band[key]:
+                    del band[key]
+            self.stats['evictions'] += 1
+
+    def get(self, hash_value):
+        """Return the value stored for the nearest hash within the threshold, or None"""
+        with self._lock:
+            if hash_value in self._entries:
+                self._entries.move_to_end(hash_value)
+                self.stats['hits'] += 1
+                self.stats['exact_hits'] += 1
+                return self._entries[hash_value]
+
+            candidates = set()
+            for band, key in zip(self._bands, self._band_keys(hash_value)):
+                candidates |= band.get(key, set())
+
+            best, best_distance = None, self.threshold + 1
+            for candidate in candidates:
+                distance = hamming_distance(hash_value, candidate)
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+
+            if best is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(best)
+            self.stats['hits'] += 1
+            self.stats['near_hits'] += 1
+            return self._entries[best]
+
+    def set(self, hash_value, value):
+        """Store value under a perceptual hash"""
+        with self._lock:
+            self._index(hash_value, value)
+            self.stats['stores'] += 1
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO phash_{self.name} (hash, value, accessed) VALUES (?, ?, ?)",
+                    (f"{hash_value:016x}", json.dumps(value), time.time())
+                )
+                self._db.execute(
+                    f"DELETE FROM phash_{self.name} WHERE hash NOT IN ("
+                    f"SELECT hash FROM phash_{self.name} ORDER BY accessed DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+                self._db.commit()
+
+    def get_stats(self):
+        """Return a snapshot of the hit/miss counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+
+class SizedMemoryCache:
+    """In-process LRU bounded by the approximate memory its values use
+
+    For values that are expensive to rebuild but cannot be stored on disk,
+    such as decoded images. Values must have a ``size_bytes`` attribute,
+    which is read again on each access because it may grow as derived
+    forms are computed.
+    """
+
+    def __init__(self, name, max_bytes, max_entries=64):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def get_or_create(self, key, factory):
+        """Return the value for key, calling factory() to build it on a miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                self._evict()
+                return value
+            self.stats['misses'] += 1
+
+        value = factory()
+        with self._lock:
+            # Another session may have built the same value meanwhile
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            self._evict()
+        return value
+
+    def _evict(self):
+        total = sum(value.size_bytes for value in self._entries.values())
+        while self._entries and len(self._entries) > 1 and (
+            total > self.max_bytes or len(self._entries) > self.max_entries
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.size_bytes
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = sum(value.size_bytes for value in self._entries.values())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+recipe_cache = TwoTierCache(
+    "recipes",
+    path=default_db_path(),
+    ttl=float(os.environ.get("RECIPE_CACHE_TTL", 7 * 24 * 3600)),
+    max_memory=int(os.environ.get("RECIPE_CACHE_SIZE", 256)),
+    max_disk=int(os.environ.get("RECIPE_CACHE_DISK_SIZE", 5000)),
+    max_variants=int(os.environ.get("RECIPE_CACHE_VARIANTS", 3)),
+)
+
+transcript_cache = TwoTierCache(
+    "transcripts",
+    path=default_db_path(),
+    ttl=float(os.environ.get("TRANSCRIPT_CACHE_TTL", 30 * 24 * 3600)),
+    max_memory=int(os.environ.get("TRANSCRIPT_CACHE_SIZE", 256)),
+    max_disk=int(os.environ.get("TRANSCRIPT_CACHE_DISK_SIZE", 5000)),
+)
+
+photo_cache = PerceptualCache(
+    "photos",
+    path=default_db_path(),
+    threshold=int(os.environ.get("PHOTO_CACHE_THRESHOLD", 5)),
+    max_entries=int(os.environ.get("PHOTO_CACHE_SIZE", 5000)),
+)
+
+decoded_photo_cache = SizedMemoryCache(
+    "decoded_photos",
+    max_bytes=int(float(os.environ.get("PHOTO_MEMORY_CACHE_MB", 128)) * 1024 * 1024),
+    max_entries=int(os.environ.get("PHOTO_MEMORY_CACHE_SIZE", 32)),
+)
@@ -0,0 +1,210 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from resilience import DeadlineExceededError
+from telemetry import note, register_metrics
+
+_flights = []
+
+
+class AbandonedCallError(Exception):
+    """Raised to callers waiting on a call whose caller stopped before it finished"""
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers asking for the same key meanwhile share its outcome
+
+    Keys must identify everything the result depends on, so any caller can
+    use another's result. Errors are passed on to every waiting caller.
+    Waiters stop waiting after their timeout, but the call itself carries on.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.stats = {
+            'calls': 0,
+            'coalesced': 0,
+            'errors': 0,
+            'timeouts': 0,
+        }
+        _flights.append(self)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _begin(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.stats['calls'] += 1
+            return future, True
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            raise DeadlineExceededError(f"Timed out waiting for an identical {self.name} request")
+
+    def join(self, key, timeout=None):
+        """Become the caller for key, or wait for the call already in flight
+
+        Returns (future, True) to the caller that must make the call and pass
+        its outcome to finish, or (result, False) to a caller that shared
+        another's result.
+        """
+        while True:
+            future, leader = self._begin(key)
+            if leader:
+                return future, True
+            try:
+                result = self._wait(future, timeout)
+            except AbandonedCallError:
+                # Nobody is making the call any more; try to make it ourselves
+                continue
+            note(branch="coalesced")
+            return result, False
+
+    def finish(self, key, future, result=None, error=None):
+        """Hand the outcome of a call started by join to everyone waiting on it"""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            if error is not None and not isinstance(error, AbandonedCallError):
+                self.stats['errors'] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _abandon(self, key, future):
+        self.finish(key, future, error=AbandonedCallError(f"The {self.name} request was cancelled"))
+
+    def do(self, key, call, timeout=None):
+        """Return call(), or the result of an identical call already in flight"""
+        future, leader = self.join(key, timeout)
+        if not leader:
+            return future
+        try:
+            result = call()
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._abandon(key, future)
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    def stream(self, key, start, timeout=None):
+        """Like do for a generator: its values are passed through, and waiting callers get only the last one"""
+        future, leader = self.join(key, timeout)
+        if not leader:
+            yield future
+            return
+        last = None
+        try:
+            for last in start():
+                yield last
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        except BaseException:
+            # Closed early or interrupted: let a waiting caller make the call instead
+            self._abandon(key, future)
+            raise
+        self.finish(key, future, result=last)
+
+    async def do_async(self, key, call, timeout=None):
+        """Await call(), or the task of an identical call already in flight on this event loop
+
+        The call runs as its own task, so it finishes for the other callers
+        even if the caller that started it is cancelled.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda done: self._settled(key, done))
+            self._count('calls')
+        else:
+            self._count('coalesced')
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self._count('timeouts')
+            raise DeadlineExceededError(f"Timed out waiting for an identical {self.name} request")
+
+    async def stream_async(self, key, start, timeout=None):
+        """stream for async generators on this event loop: waiting callers get only the last value"""
+        while True:
+            shared = self._tasks.get(key)
+            if shared is None:
+                break
+            self._count('coalesced')
+            try:
+                result = await asyncio.wait_for(asyncio.shield(shared), timeout)
+            except asyncio.TimeoutError:
+                self._count('timeouts')
+                raise DeadlineExceededError(f"Timed out waiting for an identical {self.name} request")
+            except AbandonedCallError:
+                # Nobody is making the call any more; try to make it ourselves
+                continue
+            note(branch="coalesced")
+            yield result
+            return
+
+        future = self._tasks[key] = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda done: self._settled(key, done))
+        self._count('calls')
+        generator = start()
+        last = None
+        try:
+            async for last in generator:
+                yield last
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Closed early or cancelled: let a waiting caller make the call instead
+            future.set_exception(AbandonedCallError(f"The {self.name} request was cancelled"))
+            raise
+        finally:
+            await generator.aclose()
+        future.set_result(last)
+
+    def _settled(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None and not isinstance(error, AbandonedCallError):
+            self._count('errors')
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls) + len(self._tasks)
+        return stats
+
+
+def _coalesce_metrics():
+    lines = [
+        "# HELP model_calls_coalesced_total Model calls made, and requests that shared an identical call in flight",
+        "# TYPE model_calls_coalesced_total counter",
+    ]
+    for flight in _flights:
+        stats = flight.get_stats()
+        for name in ('calls', 'coalesced', 'errors', 'timeouts'):
+            lines.append(f'model_calls_coalesced_total{{operation="{flight.name}",result="{name}"}} {stats[name]}')
+    return lines
+
+
+register_metrics(_coalesce_metrics)
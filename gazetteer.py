@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+from normalization import ALIASES, DESCRIPTORS, canonical_name, display_name, singularize, rules_signature
+
+# Bundled list of ingredient names matched against transcripts
+VOCABULARY_FILE = os.environ.get(
+    "INGREDIENT_VOCABULARY_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingredient_vocabulary.txt")
+)
+# Share of meaningful words that must be recognised before the local result is trusted
+MIN_CONFIDENCE = float(os.environ.get("GAZETTEER_MIN_CONFIDENCE", 0.7))
+
+_TOKEN = re.compile(r"[a-z]+(?:['-][a-z]+)*|\d+(?:[./]\d+)?|[.,;:!?]")
+
+# Words that put the ingredients after them into the "don't have" list
+NEGATIONS = frozenset({
+    'no', 'not', 'without', 'none', 'never', 'except', 'minus', 'allergic',
+    "don't", 'dont', "didn't", 'didnt', "haven't", 'havent', "hasn't", 'hasnt', "can't", 'cant',
+})
+# Words and punctuation that end the reach of a negation
+BOUNDARIES = frozenset({
+    '.', ',', ';', ':', '!', '?', 'but', 'however', 'though', 'although', 'plus', 'also', 'yet',
+    'i', 'we', 'you', 'they',
+})
+# Words that carry no ingredient information and do not count against confidence
+FILLER = frozenset({
+    'have', 'has', 'had', 'got', 'get', 'is', 'are', 'was', 'there', 'there\'s', 'it\'s', 'i\'ve',
+    'we\'ve', 'i\'m', 'um', 'uh', 'er', 'erm', 'like', 'just', 'in', 'on', 'at', 'to', 'for', 'from',
+    'it', 'that', 'this', 'these', 'those', 'what', 'about', 'maybe', 'think', 'know', 'let', 'me',
+    'see', 'so', 'well', 'okay', 'ok', 'oh', 'yeah', 'yes', 'really', 'too', 'as', 'can', 'could',
+    'would', 'want', 'make', 'cook', 'something', 'dinner', 'lunch', 'breakfast', 'tonight', 'today',
+    'use', 'using', 'up', 'need', 'all', 'more', 'much', 'many', 'half', 'quarter', 'pack', 'tub',
+    'handful', 'pinch', 'slice', 'slices', 'bit', 'lot', 'lots', 'plenty', 'fridge', 'freezer',
+    'pantry', 'cupboard', 'kitchen', 'left', 'out', 'do', 'does', 'am', 'be', 'been', 'if',
+    'then', 'else', 'other', 'another', 'kind', 'sort', 'type', 'actually', 'only', 'still', 'any',
+    'stuff', 'things', 'thing', 'ingredients', 'ingredient', 'food', 'here', 'hi', 'hello', 'please',
+    'thanks', 'thank', 'our', 'your', 'their', 'his', 'her', 'them', 'us', 'ran', 'run', 'enough',
+    'container', 'containers', 'tray', 'pot', 'pots', 'leftovers', 'bought', 'buy', 'store', 'shop',
+    'around',
+}) | DESCRIPTORS | NEGATIONS | BOUNDARIES
+
+
+def tokenize(text):
+    """Lower-case words, numbers and clause punctuation from a transcript"""
+    return _TOKEN.findall(str(text).lower())
+
+
+def _terms(tokens):
+    # Match on singular forms so plurals in speech find singular vocabulary entries
+    return tuple(singularize(token) for token in tokens)
+
+
+def load_vocabulary(path=VOCABULARY_FILE):
+    """Read the vocabulary file plus every alias known to normalization"""
+    names = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    names.append(line)
+    except OSError:
+        pass
+    for canonical, aliases in ALIASES.items():
+        names.append(canonical)
+        names.extend(aliases)
+    return names
+
+
+def build_trie(names):
+    """Word-level trie mapping token sequences to canonical ingredient keys"""
+    root = {}
+    for name in names:
+        key = canonical_name(name)
+        terms = _terms(tokenize(name))
+        if key is None or not terms:
+            continue
+        node = root
+        for term in terms:
+            node = node.setdefault(term, {})
+        node[None] = key
+    return root
+
+
+# Built once at import time
+TRIE = build_trie(load_vocabulary())
+
+
+def vocabulary_signature(trie=TRIE):
+    """Hex digest of the vocabulary and matching rules, which decide what find_matches returns"""
+    entries = []
+    pending = [((), trie)]
+    while pending:
+        terms, node = pending.pop()
+        for term, child in node.items():
+            if term is None:
+                entries.append((terms, child))
+            else:
+                pending.append((terms + (term,), child))
+    payload = json.dumps([rules_signature(), _TOKEN.pattern, sorted(entries)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def find_matches(tokens, trie=TRIE):
+    """Leftmost-longest vocabulary matches as (start, end, key) token spans"""
+    terms = _terms(tokens)
+    matches = []
+    i = 0
+    while i < len(terms):
+        node = trie
+        match = None
+        j = i
+        while j < len(terms) and terms[j] in node:
+            node = node[terms[j]]
+            j += 1
+            if None in node:
+                match = (i, j, node[None])
+        if match is None:
+            i += 1
+        else:
+            matches.append(match)
+            i = match[1]
+    return matches
+
+
+def head_matches(matches):
+    """Matches that name an ingredient, skipping any that directly follow another match
+
+    "feta cheese" is feta: a match straight after another one only qualifies it.
+    """
+    previous_end = None
+    for start, end, key in matches:
+        if start != previous_end:
+            yield start, end, key
+        previous_end = end
+
+
+def extract_ingredients(text):
+    """Find ingredients mentioned in a transcript without calling the API
+
+    Returns (ingredients, excluded, confidence): display names the speaker
+    has, names they said they do not have ("no eggs"), and the share of
+    meaningful words that were recognised, between 0 and 1.
+    """
+    tokens = tokenize(text)
+    matches = find_matches(tokens)
+
+    # The last mention of an ingredient decides whether it is negated
+    negated = {}
+    covered = set()
+    for start, end, key in matches:
+        covered.update(range(start, end))
+    starts = {start: (end, key) for start, end, key in head_matches(matches)}
+    in_negation = False
+    clause = []
+    # Ingredients in a question just asked, which a bare "no" answers ("Do I have tomatoes? No.")
+    question = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if i in starts:
+            end, key = starts[i]
+            negated[key] = in_negation
+            clause.append(key)
+            question = []
+            i = end
+            continue
+        if token in NEGATIONS and question and (following is None or following in BOUNDARIES):
+            for key in question:
+                negated[key] = True
+            question = []
+        if token in BOUNDARIES:
+            in_negation = False
+            if token == '?':
+                question = clause
+            clause = []
+        elif token in NEGATIONS or (token == 'out' and following == 'of'):
+            in_negation = True
+        elif token not in FILLER:
+            question = []
+        i += 1
+
+    unknown = 0
+    for i, token in enumerate(tokens):
+        if i in covered or token in FILLER or token[0].isdigit():
+            continue
+        unknown += 1
+    meaningful = len(covered) + unknown
+    confidence = len(covered) / meaningful if meaningful else 0.0
+
+    ingredients = [display_name(key) for key, is_negated in negated.items() if not is_negated]
+    excluded = [display_name(key) for key, is_negated in negated.items() if is_negated]
+    return ingredients, excluded, confidence
@@ -0,0 +1,168 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+from PIL import Image, ImageOps
+from cache import decoded_photo_cache
+
+# Longest side, in pixels, of images sent to the vision model
+VISION_MAX_EDGE = int(os.environ.get("VISION_MAX_EDGE", 1024))
+# Target size of the encoded JPEG sent to the vision model
+VISION_MAX_BYTES = int(os.environ.get("VISION_MAX_BYTES", 300_000))
+# "auto" picks low/high per image; "low" or "high" forces a level
+VISION_DETAIL = os.environ.get("VISION_DETAIL", "auto")
+
+# Longest side, in pixels, of the preview shown in the browser
+THUMBNAIL_EDGE = int(os.environ.get("THUMBNAIL_EDGE", 800))
+
+# Images no larger than this are fully covered by a single low-detail tile
+LOW_DETAIL_EDGE = 512
+
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+
+
+def normalize_image(image):
+    """Apply EXIF orientation and convert to RGB, flattening any transparency onto white"""
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def downscale(image, max_edge):
+    """Shrink an image so its longest side is at most max_edge pixels"""
+    if max(image.size) <= max_edge:
+        return image
+    image = image.copy()
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return image
+
+
+def _encode_jpeg(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def encode_within_budget(image, max_bytes):
+    """Encode as JPEG at the highest quality that fits max_bytes
+
+    Binary-searches the quality setting; if even the lowest quality is too
+    large the image is shrunk further and the search repeated.
+    """
+    while True:
+        low, high = MIN_QUALITY, MAX_QUALITY
+        best = None
+        while low <= high:
+            quality = (low + high) // 2
+            data = _encode_jpeg(image, quality)
+            if len(data) <= max_bytes:
+                best = data
+                low = quality + 1
+            else:
+                high = quality - 1
+
+        if best is not None:
+            return best
+        if max(image.size) <= LOW_DETAIL_EDGE // 2:
+            return _encode_jpeg(image, MIN_QUALITY)
+        image = downscale(image, int(max(image.size) * 0.75))
+
+
+def choose_detail(image):
+    """Pick the vision detail level for a preprocessed image"""
+    if VISION_DETAIL in ('low', 'high'):
+        return VISION_DETAIL
+    # High detail only pays off when there is more than one low-detail tile of pixels
+    return 'low' if max(image.size) <= LOW_DETAIL_EDGE else 'high'
+
+
+def prepare_image_for_vision(image, max_edge=None, max_bytes=None):
+    """Preprocess an uploaded image for the vision API
+
+    Returns the base64-encoded JPEG and the detail level to request.
+    """
+    image = normalize_image(image)
+    image = downscale(image, max_edge or VISION_MAX_EDGE)
+    data = encode_within_budget(image, max_bytes or VISION_MAX_BYTES)
+    return base64.b64encode(data).decode(), choose_detail(image)
+
+
+def dhash(image, hash_size=8):
+    """Compute a 64-bit difference hash, robust to resizing and re-compression"""
+    image = ImageOps.exif_transpose(image).convert('L')
+    image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(image.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class DecodedPhoto:
+    """A photo decoded and normalised once, with its preview, vision payload and hash built on first use
+
+    Only a copy downscaled to what the preview and the vision model need is
+    kept, so a cached photo costs a few MB rather than tens for a full-size
+    camera image.
+    """
+
+    def __init__(self, image):
+        image = normalize_image(image)
+        image.load()
+        self.image = downscale(image, max(VISION_MAX_EDGE, THUMBNAIL_EDGE))
+        self._thumbnail = None
+        self._vision_payload = None
+        self._hash = None
+        self._lock = threading.Lock()
+
+    @property
+    def thumbnail(self):
+        """JPEG bytes of a downscaled copy for display"""
+        with self._lock:
+            if self._thumbnail is None:
+                self._thumbnail = _encode_jpeg(downscale(self.image, THUMBNAIL_EDGE), 85)
+            return self._thumbnail
+
+    @property
+    def vision_payload(self):
+        """The (base64 JPEG, detail) pair from prepare_image_for_vision"""
+        with self._lock:
+            if self._vision_payload is None:
+                self._vision_payload = prepare_image_for_vision(self.image)
+            return self._vision_payload
+
+    @property
+    def hash(self):
+        """Perceptual hash used by the photo result cache"""
+        with self._lock:
+            if self._hash is None:
+                self._hash = dhash(self.image)
+            return self._hash
+
+    @property
+    def size_bytes(self):
+        size = self.image.width * self.image.height * len(self.image.getbands())
+        if self._thumbnail is not None:
+            size += len(self._thumbnail)
+        if self._vision_payload is not None:
+            size += len(self._vision_payload[0])
+        return size
+
+
+def decode_photo(data):
+    """Decode uploaded image bytes, reusing the result for identical uploads across reruns"""
+    key = hashlib.sha256(data).hexdigest()
+    return decoded_photo_cache.get_or_create(key, lambda: DecodedPhoto(Image.open(io.BytesIO(data))))
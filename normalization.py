@@ -0,0 +1,192 @@
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+# Words that are never ingredients on their own
+SKIP_WORDS = frozenset({
+    'and', 'or', 'the', 'a', 'an', 'some', 'any', 'with', 'have', 'got', 'i', 'we', 'my', 'our'
+})
+
+# Leading words that describe an ingredient's state rather than what it is
+DESCRIPTORS = frozenset({
+    'fresh', 'frozen', 'organic', 'ripe', 'raw', 'large', 'small', 'medium', 'big', 'little',
+    'chopped', 'diced', 'sliced', 'whole', 'leftover', 'few', 'couple', 'of', 'bag', 'bags',
+    'can', 'cans', 'tin', 'tins', 'jar', 'jars', 'bunch', 'bunches', 'packet', 'packets',
+    'box', 'boxes', 'bottle', 'bottles', 'carton', 'cartons', 'head', 'heads', 'piece',
+    'pieces', 'pound', 'pounds', 'lb', 'lbs', 'kg', 'g', 'cup', 'cups', 'dozen', 'one',
+    'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten', 'dried', 'canned',
+    'tinned', 'grated', 'shredded', 'cooked', 'crushed', 'peeled',
+}) | SKIP_WORDS
+
+# Canonical name -> other names for the same ingredient
+ALIASES = {
+    'tomato': ['roma tomato', 'cherry tomato', 'plum tomato', 'vine tomato', 'beefsteak tomato', 'grape tomato'],
+    'green onion': ['scallion', 'spring onion', 'salad onion'],
+    'onion': ['yellow onion', 'white onion', 'brown onion'],
+    'red onion': ['purple onion'],
+    'cilantro': ['coriander leaf', 'fresh coriander', 'chinese parsley'],
+    'chickpea': ['garbanzo bean', 'garbanzo', 'chick pea'],
+    'zucchini': ['courgette'],
+    'eggplant': ['aubergine', 'brinjal'],
+    'bell pepper': ['capsicum', 'red bell pepper', 'green bell pepper', 'yellow bell pepper', 'sweet pepper', 'red pepper', 'green pepper'],
+    'ground beef': ['minced beef', 'beef mince', 'mince', 'hamburger meat'],
+    'chicken': ['chicken breast', 'chicken thigh', 'chicken leg', 'chicken drumstick', 'chicken wing', 'chicken fillet'],
+    'olive oil': ['extra virgin olive oil', 'evoo'],
+    'yogurt': ['yoghurt', 'plain yogurt', 'natural yogurt', 'greek yogurt'],
+    'corn': ['maize', 'sweetcorn', 'sweet corn', 'corn on the cob'],
+    'shrimp': ['prawn', 'king prawn'],
+    'potato': ['russet potato', 'yukon gold potato', 'white potato', 'baby potato', 'new potato'],
+    'sweet potato': ['yam'],
+    'spring greens': ['collard greens', 'collard green', 'collard'],
+    'arugula': ['rocket'],
+    'beet': ['beetroot'],
+    'rutabaga': ['swede'],
+    'snow pea': ['mangetout'],
+    'heavy cream': ['double cream', 'whipping cream'],
+    'all-purpose flour': ['plain flour', 'flour', 'all purpose flour'],
+    'powdered sugar': ['icing sugar', "confectioners sugar"],
+    'cornstarch': ['cornflour', 'corn starch'],
+    'garlic': ['garlic clove', 'clove of garlic'],
+    'egg': ['hen egg', 'chicken egg'],
+    'milk': ['whole milk', 'semi-skimmed milk', 'skim milk', 'cow milk'],
+    'butter': ['salted butter', 'unsalted butter'],
+    'cheese': ['cheddar cheese', 'cheddar'],
+    'pasta': ['spaghetti', 'penne', 'macaroni', 'fusilli', 'linguine'],
+    'rice': ['white rice', 'long grain rice', 'short grain rice', 'basmati rice', 'jasmine rice', 'risotto rice', 'arborio rice'],
+    'oats': ['rolled oats', 'porridge oats', 'oatmeal'],
+    'lentil': ['red lentil', 'green lentil', 'brown lentil'],
+    'beef': ['beef stew meat', 'stewing beef', 'braising steak'],
+    'noodle': ['egg noodle'],
+    'bread': ['loaf', 'white bread', 'sliced bread'],
+}
+
+# Plurals that do not follow the simple suffix rules
+IRREGULAR_PLURALS = {
+    'tomatoes': 'tomato',
+    'potatoes': 'potato',
+    'mangoes': 'mango',
+    'avocados': 'avocado',
+    'leaves': 'leaf',
+    'loaves': 'loaf',
+    'halves': 'half',
+    'knives': 'knife',
+    'geese': 'goose',
+    'teeth': 'tooth',
+    'mice': 'mouse',
+    'cookies': 'cookie',
+    'pies': 'pie',
+    'ties': 'tie',
+    'brownies': 'brownie',
+    'smoothies': 'smoothie',
+    'veggies': 'veggie',
+    'chilies': 'chili',
+    'chillies': 'chilli',
+}
+
+# Words ending in "s" that are not plurals
+UNCOUNTABLE = frozenset({
+    'hummus', 'couscous', 'asparagus', 'molasses', 'swiss', 'lemongrass', 'watercress', 'bass',
+    'oats', 'grits', 'greens', 'brussels', 'citrus', 'chives', 'cress', 'hibiscus', 'octopus',
+    'haggis', 'schnapps', 'grass', 'fries',
+})
+
+_PUNCTUATION = re.compile(r'[^\w\s-]')
+_DIGITS = re.compile(r'\b\d+(?:[./]\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+_IES = re.compile(r'([^aeiou])ies$')
+_ES = re.compile(r'(ch|sh|ss|x|z)es$')
+_S = re.compile(r'([^su])s$')
+
+
+def singularize(word):
+    """Return the singular form of a single English word used as an ingredient"""
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word in UNCOUNTABLE or len(word) <= 3:
+        return word
+    if _IES.search(word):
+        return _IES.sub(r'\1y', word)
+    if _ES.search(word):
+        return _ES.sub(r'\1', word)
+    return _S.sub(r'\1', word)
+
+
+def _build_alias_index():
+    index = {}
+    for canonical, aliases in ALIASES.items():
+        for name in [canonical] + aliases:
+            index[name] = canonical
+            words = name.split()
+            words[-1] = singularize(words[-1])
+            index[' '.join(words)] = canonical
+    return index
+
+
+# Every known spelling -> canonical name, built once at import time
+ALIAS_INDEX = _build_alias_index()
+
+# Bump when canonical_name or singularize change in ways the tables do not show
+RULES_VERSION = 2
+
+
+def rules_signature():
+    """Hex digest identifying the normalization tables and rules, for data built from canonical names"""
+    rules = [
+        RULES_VERSION, sorted(ALIAS_INDEX.items()), sorted(DESCRIPTORS), sorted(UNCOUNTABLE),
+        sorted(IRREGULAR_PLURALS.items()), [_IES.pattern, _ES.pattern, _S.pattern, _PUNCTUATION.pattern],
+    ]
+    return hashlib.sha256(json.dumps(rules).encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def canonical_name(name):
+    """Return the canonical lower-case key for an ingredient name, or None if it is not one"""
+    cleaned = _PUNCTUATION.sub('', str(name).lower())
+    cleaned = _DIGITS.sub(' ', cleaned)
+    words = _WHITESPACE.split(cleaned.strip())
+
+    # Drop quantities and descriptors such as "a bag of" or "fresh", unless the
+    # rest is a known name that starts with one, such as "fresh coriander"
+    while words and words[0] in DESCRIPTORS:
+        alias = _alias(words)
+        if alias is not None:
+            return alias
+        words.pop(0)
+    if not words or not words[0]:
+        return None
+
+    alias = _alias(words)
+    if alias is not None:
+        return alias
+
+    words[-1] = singularize(words[-1])
+    phrase = ' '.join(words)
+    if len(phrase) < 2 or phrase in SKIP_WORDS:
+        return None
+    return phrase
+
+
+def _alias(words):
+    """Canonical name for a known spelling, as written or with its last word singular"""
+    phrase = ' '.join(words)
+    if phrase in ALIAS_INDEX:
+        return ALIAS_INDEX[phrase]
+    return ALIAS_INDEX.get(' '.join(words[:-1] + [singularize(words[-1])]))
+
+
+def display_name(key):
+    """Capitalise a canonical key for display"""
+    return key.capitalize()
+
+
+def normalize_ingredients(names):
+    """Canonicalise a list of ingredient names in one pass, keeping first-seen order without duplicates"""
+    seen = set()
+    result = []
+    for name in names:
+        key = canonical_name(name)
+        if key is not None and key not in seen:
+            seen.add(key)
+            result.append(key)
+    return result
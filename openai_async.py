@@ -0,0 +1,412 @@
+import asyncio
+import json
+import os
+import httpx
+from openai import AsyncOpenAI
+from cache import recipe_cache, photo_cache, transcript_cache, ingredients_key, fingerprint
+from audio_processing import prepare_audio_chunks
+from parsing import PartialJSONParser, salvage_ingredients
+from resilience import acall_with_resilience, DEADLINES
+from gazetteer import extract_ingredients, MIN_CONFIDENCE as GAZETTEER_MIN_CONFIDENCE
+from normalization import canonical_name
+from telemetry import instrumented, note, note_usage, on_request, on_response, register_metrics
+from scheduler import scheduled_call_async, estimate_tokens, observe_response
+from openai_helper import (
+    OPENAI_API_KEY,
+    OPERATION_TIMEOUTS,
+    CONNECT_TIMEOUT,
+    VISION_PROMPT,
+    VISION_FALLBACK_PROMPT,
+    SPEECH_SYSTEM_PROMPT,
+    connection_limits,
+    transcript_key,
+    flight_key,
+    recipe_batch_flights,
+    photo_flights,
+    transcript_flights,
+    speech_flights,
+    _recipes_messages,
+    _clean_recipes,
+    _parse_json_reply,
+    _vision_messages,
+    _split_ingredient_list,
+    _speech_prompt,
+    _speech_fallback_prompt
+)
+
+# Model calls in flight at once from this event loop; further calls wait for a slot
+OPENAI_ASYNC_MAX_CONCURRENCY = int(os.environ.get("OPENAI_ASYNC_MAX_CONCURRENCY", 200))
+
+_client = None
+_slots = None
+async_stats = {
+    'in_flight': 0,
+    'waiting': 0,
+}
+
+
+async def _on_request(request):
+    on_request(request)
+
+async def _on_response(response):
+    on_response(response)
+    observe_response(response)
+
+def _build_client():
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+    # One connection per slot, so calls only ever queue on the semaphore
+    http_client = httpx.AsyncClient(
+        limits=connection_limits(OPENAI_ASYNC_MAX_CONCURRENCY),
+        timeout=httpx.Timeout(OPERATION_TIMEOUTS["chat"], connect=CONNECT_TIMEOUT),
+        event_hooks={"request": [_on_request], "response": [_on_response]}
+    )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+
+def get_client(operation="chat", budget=None):
+    """Return the async OpenAI client, creating it on first use, with the timeout for operation"""
+
+    global _client
+    if _client is None:
+        _client = _build_client()
+    seconds = OPERATION_TIMEOUTS[operation]
+    if budget is not None:
+        seconds = min(seconds, budget)
+    return _client.with_options(timeout=httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT, seconds)))
+
+class _Slot:
+    """Holds one of the OPENAI_ASYNC_MAX_CONCURRENCY call slots for the duration of a block"""
+
+    async def __aenter__(self):
+        global _slots
+        if _slots is None:
+            _slots = asyncio.Semaphore(OPENAI_ASYNC_MAX_CONCURRENCY)
+        async_stats['waiting'] += 1
+        try:
+            await _slots.acquire()
+        finally:
+            async_stats['waiting'] -= 1
+        async_stats['in_flight'] += 1
+
+    async def __aexit__(self, *exc_info):
+        async_stats['in_flight'] -= 1
+        _slots.release()
+
+def calls_waiting():
+    """Model calls queued behind the concurrency limit"""
+    return async_stats['waiting']
+
+async def _chat_completion(operation, **kwargs):
+    """Create a non-streaming chat completion with retries, circuit breaking and a deadline"""
+
+    tokens = estimate_tokens(kwargs)
+    async with _Slot():
+        return await acall_with_resilience(
+            operation,
+            lambda timeout: scheduled_call_async(
+                operation,
+                tokens,
+                timeout,
+                lambda budget: get_client(operation, budget).chat.completions.create(**kwargs)
+            )
+        )
+
+@instrumented("recipe_batch")
+async def generate_recipes(ingredients, n=3, exclude=None, use_cache=True):
+    """Generate n different recipes for the same ingredients in a single request"""
+
+    cache_key = ingredients_key(ingredients)
+    excluded = {fingerprint(recipe) for recipe in exclude or []}
+    if use_cache:
+        cached = await asyncio.to_thread(recipe_cache.get_many, cache_key, n, excluded)
+        if len(cached) == n:
+            note(cache_hit=True, branch="cache")
+            return cached
+
+    # Identical requests arriving meanwhile share this call
+    return await recipe_batch_flights.do_async(
+        flight_key(cache_key, excluded, n),
+        lambda: _request_recipes(ingredients, n, exclude, excluded, cache_key, use_cache),
+        DEADLINES["chat"]
+    )
+
+async def _request_recipes(ingredients, n, exclude, excluded, cache_key, use_cache):
+    try:
+        response = await _chat_completion("chat",
+            model="gpt-4o",
+            messages=_recipes_messages(ingredients, n, exclude),
+            response_format={"type": "json_object"},
+            max_tokens=1500 * n,
+            temperature=0.8
+        )
+        note_usage(response)
+        result = _parse_json_reply(response.choices[0].message.content)
+    except Exception as e:
+        raise Exception(f"Failed to generate recipes: {str(e)}")
+
+    recipes = _clean_recipes(result, excluded)
+    if not recipes:
+        raise Exception("Failed to generate recipes: no recipes in response")
+
+    if use_cache:
+        await asyncio.to_thread(_store_recipes, cache_key, recipes)
+    return recipes
+
+@instrumented("recipe_batch_stream")
+async def stream_recipes(ingredients, n=3, exclude=None, use_cache=True):
+    """Stream n recipes generated in a single request, yielding partial recipe lists
+
+    The last yielded list holds the complete, cleaned recipes. The call
+    slot is held until the stream ends, and the response is only read as
+    fast as the caller consumes it.
+    """
+
+    cache_key = ingredients_key(ingredients)
+    excluded = {fingerprint(recipe) for recipe in exclude or []}
+    if use_cache:
+        cached = await asyncio.to_thread(recipe_cache.get_many, cache_key, n, excluded)
+        if len(cached) == n:
+            note(cache_hit=True, branch="cache")
+            yield cached
+            return
+
+    # Identical requests arriving meanwhile wait for this stream's final recipes
+    flight = recipe_batch_flights.stream_async(
+        flight_key(cache_key, excluded, n),
+        lambda: _stream_recipes(ingredients, n, exclude, excluded, cache_key, use_cache),
+        DEADLINES["chat"]
+    )
+    try:
+        async for recipes in flight:
+            yield recipes
+    finally:
+        await flight.aclose()
+
+async def _stream_recipes(ingredients, n, exclude, excluded, cache_key, use_cache):
+    result = None
+    parser = PartialJSONParser()
+    try:
+        async with _Slot():
+            request = dict(
+                model="gpt-4o",
+                messages=_recipes_messages(ingredients, n, exclude),
+                response_format={"type": "json_object"},
+                max_tokens=1500 * n,
+                temperature=0.8,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            tokens = estimate_tokens(request)
+            stream = await acall_with_resilience(
+                "chat",
+                lambda timeout: scheduled_call_async(
+                    "chat",
+                    tokens,
+                    timeout,
+                    lambda budget: get_client("chat", budget).chat.completions.create(**request)
+                )
+            )
+            try:
+                async for chunk in stream:
+                    note_usage(chunk)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    parser.feed(delta)
+                    if not any(char in delta for char in ',]}"'):
+                        continue
+                    partial = parser.snapshot()
+                    if isinstance(partial, dict) and isinstance(partial.get("recipes"), list):
+                        result = partial
+                        recipes = [recipe for recipe in partial["recipes"] if isinstance(recipe, dict)]
+                        if recipes:
+                            yield recipes
+            finally:
+                # Release the upstream connection now if the caller stopped reading early
+                await stream.close()
+        result = json.loads(parser.text)
+    except json.JSONDecodeError:
+        # Keep whatever complete recipes arrived before the stream was cut off
+        note(branch="salvaged")
+    except Exception as e:
+        raise Exception(f"Failed to generate recipes: {str(e)}")
+
+    recipes = _clean_recipes(result, excluded)
+    if not recipes:
+        raise Exception("Failed to generate recipes: no recipes in response")
+
+    if use_cache:
+        await asyncio.to_thread(_store_recipes, cache_key, recipes)
+    yield recipes
+
+def _store_recipes(cache_key, recipes):
+    for recipe in recipes:
+        recipe_cache.set(cache_key, recipe)
+
+@instrumented("photo")
+async def recognize_ingredients_from_photo(photo, use_cache=True):
+    """Recognize ingredients in a DecodedPhoto, reusing results for near-duplicate photos"""
+
+    # Hashing and compressing the image are CPU work, kept off the event loop
+    photo_hash = await asyncio.to_thread(lambda: photo.hash)
+    if use_cache:
+        cached = await asyncio.to_thread(photo_cache.get, photo_hash)
+        if cached is not None:
+            note(cache_hit=True, branch="cache")
+            return cached
+
+    return await photo_flights.do_async(photo_hash, lambda: _recognize(photo, photo_hash, use_cache), DEADLINES["vision"])
+
+async def _recognize(photo, photo_hash, use_cache):
+    base64_image, detail = await asyncio.to_thread(lambda: photo.vision_payload)
+    ingredients = await recognize_ingredients_from_image(base64_image, detail)
+    if use_cache and ingredients:
+        await asyncio.to_thread(photo_cache.set, photo_hash, ingredients)
+    return ingredients
+
+@instrumented("vision")
+async def recognize_ingredients_from_image(base64_image, detail="auto"):
+    """Recognize ingredients from a base64 JPEG using OpenAI Vision API"""
+
+    try:
+        response = await _chat_completion("vision",
+            model="gpt-4o",
+            messages=_vision_messages(VISION_PROMPT, base64_image, detail),
+            response_format={"type": "json_object"},
+            max_tokens=500
+        )
+        note_usage(response)
+        return json.loads(response.choices[0].message.content).get("ingredients", [])
+
+    except json.JSONDecodeError:
+        ingredients = salvage_ingredients(response.choices[0].message.content, limit=10)
+        if ingredients is not None:
+            note(branch="salvaged")
+            return ingredients
+
+        note(branch="fallback")
+        response = await _chat_completion("vision",
+            model="gpt-4o",
+            messages=_vision_messages(VISION_FALLBACK_PROMPT, base64_image, detail),
+            max_tokens=300
+        )
+        note_usage(response)
+        return _split_ingredient_list(response.choices[0].message.content)
+
+    except Exception as e:
+        raise Exception(f"Failed to analyze image: {str(e)}")
+
+@instrumented("whisper")
+async def transcribe_audio_to_text(audio_bytes, filename, use_cache=True):
+    """Transcribe an audio file's bytes with Whisper, transcribing long clips in parallel chunks"""
+
+    try:
+        cache_key = transcript_key(audio_bytes)
+        if use_cache:
+            cached = await asyncio.to_thread(transcript_cache.get, cache_key)
+            if cached is not None:
+                note(cache_hit=True, branch="cache")
+                return cached
+
+        return await transcript_flights.do_async(
+            cache_key,
+            lambda: _transcribe(audio_bytes, filename, cache_key, use_cache),
+            DEADLINES["whisper"]
+        )
+
+    except Exception as e:
+        raise Exception(f"Failed to transcribe audio: {str(e)}")
+
+async def _transcribe(audio_bytes, filename, cache_key, use_cache):
+    chunks = await asyncio.to_thread(prepare_audio_chunks, audio_bytes, filename or "audio.wav")
+    if len(chunks) > 1:
+        note(branch="chunked")
+    parts = await asyncio.gather(*(_transcribe_chunk(*chunk) for chunk in chunks))
+    text = " ".join(part.strip() for part in parts if part.strip())
+
+    if use_cache and text:
+        await asyncio.to_thread(transcript_cache.set, cache_key, text)
+    return text
+
+@instrumented("whisper_request")
+async def _transcribe_chunk(filename, audio_bytes):
+    async with _Slot():
+        response = await acall_with_resilience(
+            "whisper",
+            lambda timeout: scheduled_call_async(
+                "whisper",
+                0,
+                timeout,
+                lambda budget: get_client("whisper", budget).audio.transcriptions.create(
+                    model="whisper-1",
+                    file=(filename, audio_bytes),
+                    language="en"
+                )
+            )
+        )
+    note_usage(response)
+    return response.text
+
+@instrumented("speech_extraction")
+async def extract_ingredients_from_speech(transcribed_text):
+    """Extract ingredients from transcribed speech, asking OpenAI only when the local match is unsure"""
+
+    ingredients, excluded, confidence = extract_ingredients(transcribed_text)
+    if ingredients and confidence >= GAZETTEER_MIN_CONFIDENCE:
+        note(branch="local")
+        return ingredients
+
+    excluded_keys = {canonical_name(name) for name in excluded}
+    found = await speech_flights.do_async(
+        transcribed_text.strip(),
+        lambda: _extract_ingredients_with_model(transcribed_text),
+        DEADLINES["chat"]
+    )
+    return [ingredient for ingredient in found if canonical_name(ingredient) not in excluded_keys]
+
+async def _extract_ingredients_with_model(transcribed_text):
+    try:
+        response = await _chat_completion("chat",
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": SPEECH_SYSTEM_PROMPT},
+                {"role": "user", "content": _speech_prompt(transcribed_text)}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=300
+        )
+        note_usage(response)
+        return json.loads(response.choices[0].message.content).get("ingredients", [])
+
+    except json.JSONDecodeError:
+        ingredients = salvage_ingredients(response.choices[0].message.content, limit=10)
+        if ingredients is not None:
+            note(branch="salvaged")
+            return ingredients
+
+        note(branch="fallback")
+        response = await _chat_completion("chat",
+            model="gpt-4o",
+            messages=[
+                {"role": "user", "content": _speech_fallback_prompt(transcribed_text)}
+            ],
+            max_tokens=200
+        )
+        note_usage(response)
+        return _split_ingredient_list(response.choices[0].message.content)
+
+    except Exception as e:
+        raise Exception(f"Failed to extract ingredients from speech: {str(e)}")
+
+def _async_metrics():
+    return [
+        "# HELP openai_async_calls Async model calls in flight and waiting for a slot",
+        "# TYPE openai_async_calls gauge",
+        f'openai_async_calls{{state="in_flight"}} {async_stats["in_flight"]}',
+        f'openai_async_calls{{state="waiting"}} {async_stats["waiting"]}',
+    ]
+
+register_metrics(_async_metrics)
@@ -1,27 +1,431 @@
+import hashlib
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import httpx
 from openai import OpenAI
+from cache import (
+    recipe_cache,
+    photo_cache,
+    transcript_cache,
+    decoded_photo_cache,
+    ingredients_key,
+    fingerprint,
+    make_key
+)
+from image_processing import DecodedPhoto
+from audio_processing import prepare_audio_chunks, TRANSCRIBE_WORKERS
+from parsing import (
+    PartialJSONParser,
+    clean_recipe_json,
+    salvage_reply,
+    salvage_recipe,
+    salvage_ingredients,
+    get_salvage_stats
+)
+from telemetry import instrumented, note, note_usage, on_request, on_response, register_metrics
+from resilience import call_with_resilience, DEADLINES
+from coalesce import SingleFlight
+from scheduler import scheduled_call, estimate_tokens, observe_response, bind
+from gazetteer import extract_ingredients, MIN_CONFIDENCE as GAZETTEER_MIN_CONFIDENCE
+from normalization import canonical_name
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Connection pool shared by every API call
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", 10))
+OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 120))
+# One client for the whole process, or one per thread when set to 0
+OPENAI_SHARED_CLIENT = os.environ.get("OPENAI_SHARED_CLIENT", "1") != "0"
 
-def generate_recipe_from_ingredients(ingredients):
-    """Generate recipe suggestions based on available ingredients using OpenAI GPT-4o"""
+# Photos recognised at once across all sessions when several are uploaded together
+PHOTO_WORKERS = int(os.environ.get("PHOTO_WORKERS", 8))
+
+# Timeouts in seconds per kind of call
+OPERATION_TIMEOUTS = {
+    "chat": float(os.environ.get("OPENAI_CHAT_TIMEOUT", 60)),
+    "vision": float(os.environ.get("OPENAI_VISION_TIMEOUT", 90)),
+    "whisper": float(os.environ.get("OPENAI_WHISPER_TIMEOUT", 120)),
+}
+CONNECT_TIMEOUT = 10.0
+
+_client = None
+_client_lock = threading.Lock()
+_thread_clients = threading.local()
+_photo_pool = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix="photo")
+
+# Identical requests made while one is already in flight wait for its result
+recipe_flights = SingleFlight("recipe")
+recipe_batch_flights = SingleFlight("recipe_batch")
+photo_flights = SingleFlight("photo")
+transcript_flights = SingleFlight("transcript")
+speech_flights = SingleFlight("speech_extraction")
+
+def connection_limits(max_connections=OPENAI_MAX_CONNECTIONS):
+    """Connection pool limits for an httpx client talking to the API"""
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(OPENAI_MAX_KEEPALIVE, max_connections),
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+
+def _build_client():
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+    
+    http_client = httpx.Client(
+        limits=connection_limits(),
+        timeout=httpx.Timeout(OPERATION_TIMEOUTS["chat"], connect=CONNECT_TIMEOUT),
+        event_hooks={"request": [on_request], "response": [on_response, observe_response]}
+    )
+    # Retries are handled by the resilience layer
+    return OpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+
+def get_client(operation="chat", budget=None):
+    """Return the OpenAI client, creating it on first use, with the timeout for operation
+
+    budget caps the timeout to the time left in the caller's deadline.
+    """
+    
+    global _client
+    if OPENAI_SHARED_CLIENT:
+        if _client is None:
+            with _client_lock:
+                if _client is None:
+                    _client = _build_client()
+        client = _client
+    else:
+        client = getattr(_thread_clients, "client", None)
+        if client is None:
+            client = _thread_clients.client = _build_client()
+    
+    # with_options shares the underlying connection pool
+    seconds = OPERATION_TIMEOUTS[operation]
+    if budget is not None:
+        seconds = min(seconds, budget)
+    timeout = httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT, seconds))
+    return client.with_options(timeout=timeout)
+
+def _chat_completion(operation, **kwargs):
+    """Create a chat completion with retries, circuit breaking and a deadline
+
+    Non-streaming calls may also be hedged; streams are only retried until
+    the response starts.
+    """
+    
+    # Each attempt waits its turn for rate limit capacity, sized by the prompt and max_tokens
+    tokens = estimate_tokens(kwargs)
+    return call_with_resilience(
+        operation,
+        lambda timeout: scheduled_call(
+            operation,
+            tokens,
+            timeout,
+            lambda budget: get_client(operation, budget).chat.completions.create(**kwargs)
+        ),
+        hedge=not kwargs.get("stream")
+    )
+
+def _cache_metrics():
+    """Prometheus lines for the result caches' hit/miss counters"""
+    
+    lines = ["# HELP cache_lookups_total Result cache lookups by outcome", "# TYPE cache_lookups_total counter"]
+    caches = (
+        ("recipes", recipe_cache),
+        ("transcripts", transcript_cache),
+        ("photos", photo_cache),
+        ("decoded_photos", decoded_photo_cache),
+    )
+    for name, cache in caches:
+        stats = cache.get_stats()
+        lines.append(f'cache_lookups_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+        lines.append(f'cache_lookups_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+    return lines
+
+register_metrics(_cache_metrics)
+
+def _salvage_metrics():
+    """Prometheus lines counting local repairs of malformed JSON replies"""
+    
+    lines = ["# HELP json_salvage_total Local repairs of malformed model JSON by outcome", "# TYPE json_salvage_total counter"]
+    for outcome, count in get_salvage_stats().items():
+        lines.append(f'json_salvage_total{{outcome="{outcome}"}} {count}')
+    return lines
+
+register_metrics(_salvage_metrics)
+
+RECIPE_SYSTEM_PROMPT = "You are a helpful cooking assistant specialized in creating simple, healthy recipes for elderly people."
+
+@instrumented("recipe")
+def generate_recipe_from_ingredients(ingredients, exclude=None, use_cache=True):
+    """Generate recipe suggestions based on available ingredients using OpenAI GPT-4o
+
+    Results are served from the recipe cache when possible. Pass the recipes
+    already shown to the user as exclude to get a different one.
+    """
+    
+    cache_key = ingredients_key(ingredients)
+    excluded = {fingerprint(recipe) for recipe in exclude or []}
+    if use_cache:
+        cached = recipe_cache.get(cache_key, exclude=excluded)
+        if cached is not None:
+            note(cache_hit=True, branch="cache")
+            return cached
+    
+    def request():
+        recipe = _request_recipe(ingredients, exclude)
+        if _is_repeat(recipe, excluded, exclude):
+            # The prompt asked for something new; give the model one more try before giving up
+            note(branch="repeat")
+            recipe = _request_recipe(ingredients, exclude, temperature=1.0)
+            if _is_repeat(recipe, excluded, exclude):
+                raise Exception("Failed to generate recipe: the suggestion repeated a recipe already shown")
+        if use_cache and _is_complete_recipe(recipe):
+            recipe_cache.set(cache_key, recipe)
+        return recipe
+    
+    return recipe_flights.do(flight_key(cache_key, excluded), request, DEADLINES["chat"])
+
+@instrumented("recipe_stream")
+def stream_recipe_from_ingredients(ingredients, exclude=None, use_cache=True):
+    """Stream a recipe as it is generated, yielding partial recipe dicts
+
+    Each yielded value is the best parse of the response so far; the last one
+    is the complete recipe. Cache hits are yielded once without a model call.
+    """
+    
+    cache_key = ingredients_key(ingredients)
+    excluded = {fingerprint(recipe) for recipe in exclude or []}
+    if use_cache:
+        cached = recipe_cache.get(cache_key, exclude=excluded)
+        if cached is not None:
+            note(cache_hit=True, branch="cache")
+            yield cached
+            return
+    
+    # Callers asking for the same recipe meanwhile get only the finished one
+    yield from recipe_flights.stream(
+        flight_key(cache_key, excluded),
+        lambda: _stream_recipe(ingredients, exclude, excluded, cache_key, use_cache),
+        DEADLINES["chat"]
+    )
+
+def _stream_recipe(ingredients, exclude, excluded, cache_key, use_cache):
+    messages = _recipes_messages(ingredients, 1, exclude)
+    
+    recipe = None
+    try:
+        for partial in _stream_json(messages, max_tokens=1500):
+            if isinstance(partial, dict):
+                recipe = partial
+                yield partial
+    except json.JSONDecodeError:
+        # Truncated stream: keep what arrived if it is usable, else make a regular request
+        if isinstance(recipe, dict) and recipe.get("title") and recipe.get("instructions"):
+            note(branch="salvaged")
+            recipe = clean_recipe_json(recipe)
+        else:
+            note(branch="fallback")
+            recipe = _request_recipe(ingredients, exclude)
+    except Exception as e:
+        raise Exception(f"Failed to generate recipe: {str(e)}")
+    
+    # A repeat has already been shown as it streamed, but is not worth caching as a new variant
+    if use_cache and _is_complete_recipe(recipe) and not _is_repeat(recipe, excluded, exclude):
+        recipe_cache.set(cache_key, recipe)
+    yield recipe
+
+@instrumented("recipe_batch")
+def generate_recipes(ingredients, n=3, exclude=None, use_cache=True):
+    """Generate n different recipes for the same ingredients in a single request"""
+    
+    cache_key = ingredients_key(ingredients)
+    excluded = {fingerprint(recipe) for recipe in exclude or []}
+    if use_cache:
+        cached = recipe_cache.get_many(cache_key, n, exclude=excluded)
+        if len(cached) == n:
+            note(cache_hit=True, branch="cache")
+            return cached
+    
+    return recipe_batch_flights.do(
+        flight_key(cache_key, excluded, n),
+        lambda: _request_recipes(ingredients, n, exclude, excluded, cache_key, use_cache),
+        DEADLINES["chat"]
+    )
+
+def _request_recipes(ingredients, n, exclude, excluded, cache_key, use_cache):
+    try:
+        response = _chat_completion("chat",
+            model="gpt-4o",
+            messages=_recipes_messages(ingredients, n, exclude),
+            response_format={"type": "json_object"},
+            max_tokens=1500 * n,
+            temperature=0.8
+        )
+        note_usage(response)
+        result = _parse_json_reply(response.choices[0].message.content)
+    except Exception as e:
+        raise Exception(f"Failed to generate recipes: {str(e)}")
+    
+    recipes = _clean_recipes(result, excluded)
+    if not recipes:
+        raise Exception("Failed to generate recipes: no recipes in response")
+    
+    if use_cache:
+        for recipe in recipes:
+            recipe_cache.set(cache_key, recipe)
+    return recipes
+
+@instrumented("recipe_batch_stream")
+def stream_recipes_from_ingredients(ingredients, n=3, exclude=None, use_cache=True):
+    """Stream n recipes generated in a single request, yielding partial recipe lists
+
+    The last yielded list holds the complete, cleaned recipes.
+    """
+    
+    cache_key = ingredients_key(ingredients)
+    excluded = {fingerprint(recipe) for recipe in exclude or []}
+    if use_cache:
+        cached = recipe_cache.get_many(cache_key, n, exclude=excluded)
+        if len(cached) == n:
+            note(cache_hit=True, branch="cache")
+            yield cached
+            return
+    
+    yield from recipe_batch_flights.stream(
+        flight_key(cache_key, excluded, n),
+        lambda: _stream_recipes(ingredients, n, exclude, excluded, cache_key, use_cache),
+        DEADLINES["chat"]
+    )
+
+def _stream_recipes(ingredients, n, exclude, excluded, cache_key, use_cache):
+    result = None
+    try:
+        for partial in _stream_json(_recipes_messages(ingredients, n, exclude), max_tokens=1500 * n, temperature=0.8):
+            if isinstance(partial, dict) and isinstance(partial.get("recipes"), list):
+                result = partial
+                recipes = [recipe for recipe in partial["recipes"] if isinstance(recipe, dict)]
+                if recipes:
+                    yield recipes
+    except json.JSONDecodeError:
+        # Keep whatever complete recipes arrived before the stream was cut off
+        note(branch="salvaged")
+    except Exception as e:
+        raise Exception(f"Failed to generate recipes: {str(e)}")
+    
+    recipes = _clean_recipes(result, excluded)
+    if not recipes:
+        raise Exception("Failed to generate recipes: no recipes in response")
+    
+    if use_cache:
+        for recipe in recipes:
+            recipe_cache.set(cache_key, recipe)
+    yield recipes
+
+def _is_complete_recipe(recipe):
+    """Whether a reply is a structured recipe worth caching, rather than fallback text or a fragment"""
+    return (
+        isinstance(recipe, dict)
+        and isinstance(recipe.get("title"), str) and recipe["title"].strip() != ""
+        and isinstance(recipe.get("ingredients"), list) and len(recipe["ingredients"]) > 0
+        and isinstance(recipe.get("instructions"), list) and len(recipe["instructions"]) > 0
+    )
+
+def _excluded_titles(exclude):
+    return [recipe.get("title") for recipe in exclude or [] if isinstance(recipe, dict) and recipe.get("title")]
+
+def _is_repeat(recipe, excluded, exclude):
+    """Whether a generated recipe is one of those the caller asked to avoid"""
+    if not isinstance(recipe, dict):
+        return False
+    titles = {title.strip().lower() for title in _excluded_titles(exclude)}
+    return fingerprint(recipe) in excluded or str(recipe.get("title", "")).strip().lower() in titles
+
+def flight_key(cache_key, excluded, n=1):
+    """Key identifying a recipe request by its ingredients, count and excluded recipes"""
+    return make_key(cache_key, n, sorted(excluded))
+
+def _recipes_messages(ingredients, n, exclude=None):
+    """Build the chat messages asking for n different recipes"""
     
     ingredients_text = ", ".join(ingredients)
+    prompt = _recipe_prompt(ingredients_text, n)
+    titles = _excluded_titles(exclude)
+    if titles:
+        prompt += f"\n    Do not suggest any of these recipes again: {', '.join(titles)}\n"
+    return [
+        {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def _parse_json_reply(content):
+    """Parse a JSON reply, repairing it locally if it is malformed"""
     
-    prompt = f"""
-    You are a helpful cooking assistant for elderly people. Based on the following ingredients: {ingredients_text}
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        note(branch="salvaged")
+        return salvage_reply(content)
+
+def _clean_recipes(result, excluded):
+    """Validate the recipes in a batch response, dropping duplicates and excluded ones"""
     
-    Please suggest a simple, healthy, and delicious recipe that can be made with most or all of these ingredients.
+    # A request for one recipe is answered with the bare recipe object
+    if isinstance(result, dict) and "recipes" not in result and result.get("title"):
+        result = {"recipes": [result]}
+    if not isinstance(result, dict) or not isinstance(result.get("recipes"), list):
+        return []
     
-    Provide your response in JSON format with the following structure:
-    {{
+    recipes = []
+    seen = set(excluded)
+    for recipe in result["recipes"]:
+        if not isinstance(recipe, dict):
+            continue
+        recipe = clean_recipe_json(recipe)
+        key = fingerprint(recipe)
+        if key not in seen:
+            seen.add(key)
+            recipes.append(recipe)
+    return recipes
+
+def _stream_json(messages, max_tokens, temperature=0.7):
+    """Stream a JSON chat completion, yielding the best parse of the response so far
+
+    Raises json.JSONDecodeError if the finished response is not valid JSON.
+    """
+    
+    parser = PartialJSONParser()
+    stream = _chat_completion("chat",
+        model="gpt-4o",
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    
+    for chunk in stream:
+        note_usage(chunk)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parser.feed(delta)
+        # Only re-parse once a value may have completed
+        if any(char in delta for char in ',]}"'):
+            partial = parser.snapshot()
+            if partial is not None:
+                yield partial
+    
+    yield json.loads(parser.text)
+
+RECIPE_SCHEMA = """{
         "title": "Recipe name",
         "description": "Brief description of the dish",
         "prep_time": "Estimated preparation time",
@@ -29,7 +433,25 @@ def generate_recipe_from_ingredients(ingredients):
         "ingredients": ["List of ingredients with measurements"],
         "instructions": ["Step-by-step cooking instructions"],
         "tips": ["Helpful cooking tips for elderly cooks"]
-    }}
+    }"""
+
+def _recipe_prompt(ingredients_text, n=1):
+    """Build the JSON recipe prompt for an ingredient list, asking for n recipes when n > 1"""
+    
+    if n == 1:
+        request = "Please suggest a simple, healthy, and delicious recipe that can be made with most or all of these ingredients."
+        structure = RECIPE_SCHEMA
+    else:
+        request = f"Please suggest {n} different simple, healthy, and delicious recipes that can each be made with most or all of these ingredients. Make each recipe a distinct dish."
+        structure = f'{{"recipes": [{RECIPE_SCHEMA}, ...]}}'
+    
+    return f"""
+    You are a helpful cooking assistant for elderly people. Based on the following ingredients: {ingredients_text}
+    
+    {request}
+    
+    Provide your response in JSON format with the following structure:
+    {structure}
     
     Make sure the recipe is:
     - Easy to follow with clear, simple steps
@@ -38,51 +460,75 @@ def generate_recipe_from_ingredients(ingredients):
     - Uses common cooking methods
     - Includes safety tips if needed
     """
+
+def _request_recipe(ingredients, exclude=None, temperature=0.7):
+    """Call GPT-4o for a single recipe, different from any in exclude"""
+    
+    ingredients_text = ", ".join(ingredients)
+    titles = _excluded_titles(exclude)
     
     try:
-        response = client.chat.completions.create(
+        response = _chat_completion("chat",
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful cooking assistant specialized in creating simple, healthy recipes for elderly people."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=_recipes_messages(ingredients, 1, exclude),
             response_format={"type": "json_object"},
             max_tokens=1500,
-            temperature=0.7
+            temperature=temperature
         )
         
+        note_usage(response)
         recipe_json = json.loads(response.choices[0].message.content)
-        return recipe_json
+        return clean_recipe_json(recipe_json)
         
     except json.JSONDecodeError as e:
+        # Try to repair the reply locally before paying for a second request
+        recipe = salvage_recipe(response.choices[0].message.content)
+        if recipe is not None:
+            note(branch="salvaged")
+            return recipe
+        
         # Fallback to text response if JSON parsing fails
-        response = client.chat.completions.create(
+        note(branch="fallback")
+        fallback_prompt = f"Based on these ingredients: {ingredients_text}, suggest a simple, healthy recipe with clear step-by-step instructions suitable for elderly people."
+        if titles:
+            fallback_prompt += f" Do not suggest any of these recipes again: {', '.join(titles)}"
+        response = _chat_completion("chat",
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": "You are a helpful cooking assistant specialized in creating simple, healthy recipes for elderly people."},
-                {"role": "user", "content": f"Based on these ingredients: {ingredients_text}, suggest a simple, healthy recipe with clear step-by-step instructions suitable for elderly people."}
+                {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+                {"role": "user", "content": fallback_prompt}
             ],
             max_tokens=1500,
-            temperature=0.7
+            temperature=temperature
         )
+        note_usage(response)
         return response.choices[0].message.content
         
     except Exception as e:
         raise Exception(f"Failed to generate recipe: {str(e)}")
 
-def recognize_ingredients_from_image(base64_image):
-    """Recognize ingredients from an image using OpenAI Vision API"""
+@instrumented("photo")
+def recognize_ingredients_from_photo(image, use_cache=True):
+    """Recognize ingredients from a PIL image or DecodedPhoto, reusing results for near-duplicate photos"""
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """
+    photo = image if isinstance(image, DecodedPhoto) else DecodedPhoto(image)
+    photo_hash = photo.hash
+    if use_cache:
+        cached = photo_cache.get(photo_hash)
+        if cached is not None:
+            note(cache_hit=True, branch="cache")
+            return cached
+    
+    def request():
+        base64_image, detail = photo.vision_payload
+        ingredients = recognize_ingredients_from_image(base64_image, detail=detail)
+        if use_cache and ingredients:
+            photo_cache.set(photo_hash, ingredients)
+        return ingredients
+    
+    return photo_flights.do(photo_hash, request, DEADLINES["vision"])
+
+VISION_PROMPT = """
                             Look at this image and identify all the food ingredients you can see.
                             Return only a JSON object with an array of ingredient names.
                             Focus on identifying common cooking ingredients like vegetables, fruits, meats, dairy products, grains, spices, etc.
@@ -93,69 +539,190 @@ def recognize_ingredients_from_image(base64_image):
                             
                             If you cannot identify any food ingredients, return: {"ingredients": []}
                             """
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
+
+VISION_FALLBACK_PROMPT = "Look at this image and list all the food ingredients you can see, separated by commas. Use simple ingredient names."
+
+def _vision_messages(prompt, base64_image, detail):
+    """Build the chat messages sending one JPEG image with a prompt"""
+    
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}", "detail": detail}
                 }
-            ],
+            ]
+        }
+    ]
+
+def _split_ingredient_list(text, limit=10):
+    """Parse a comma-separated ingredient reply"""
+    
+    ingredients = [ing.strip() for ing in text.split(',') if ing.strip()]
+    return ingredients[:limit]
+
+def recognize_ingredients_from_photos(photos, use_cache=True):
+    """Recognize ingredients in several photos concurrently
+
+    Yields (index, ingredients, error) for each photo as soon as it is done,
+    so callers can report progress; error is None on success.
+    """
+    
+    futures = {
+        _photo_pool.submit(bind(recognize_ingredients_from_photo), photo, use_cache): index
+        for index, photo in enumerate(photos)
+    }
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], [], e
+
+@instrumented("vision")
+def recognize_ingredients_from_image(base64_image, detail="auto"):
+    """Recognize ingredients from an image using OpenAI Vision API"""
+    
+    try:
+        response = _chat_completion("vision",
+            model="gpt-4o",
+            messages=_vision_messages(VISION_PROMPT, base64_image, detail),
             response_format={"type": "json_object"},
             max_tokens=500
         )
         
+        note_usage(response)
         result = json.loads(response.choices[0].message.content)
         return result.get("ingredients", [])
         
     except json.JSONDecodeError:
+        # Recover the list locally rather than uploading the image again
+        ingredients = salvage_ingredients(response.choices[0].message.content, limit=10)
+        if ingredients is not None:
+            note(branch="salvaged")
+            return ingredients
+        
         # Fallback to text parsing if JSON fails
-        response = client.chat.completions.create(
+        note(branch="fallback")
+        response = _chat_completion("vision",
             model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Look at this image and list all the food ingredients you can see, separated by commas. Use simple ingredient names."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
+            messages=_vision_messages(VISION_FALLBACK_PROMPT, base64_image, detail),
             max_tokens=300
         )
         
-        text_result = response.choices[0].message.content
-        ingredients = [ing.strip() for ing in text_result.split(',') if ing.strip()]
-        return ingredients[:10]  # Limit to 10 ingredients
+        note_usage(response)
+        return _split_ingredient_list(response.choices[0].message.content)
         
     except Exception as e:
         raise Exception(f"Failed to analyze image: {str(e)}")
 
-def transcribe_audio_to_text(audio_file_path):
-    """Transcribe audio file to text using OpenAI Whisper"""
+def transcript_key(audio_bytes):
+    """Transcript cache key for the content of an audio file"""
+    return make_key("transcript", hashlib.sha256(audio_bytes).hexdigest())
+
+@instrumented("whisper")
+def transcribe_audio_to_text(audio, filename=None, use_cache=True):
+    """Transcribe audio to text using OpenAI Whisper
+
+    audio may be a file path, raw bytes or a file-like object. Transcripts are
+    cached on a hash of the audio content.
+    """
     
     try:
-        with open(audio_file_path, "rb") as audio_file:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="en"
-            )
-        return response.text
+        if isinstance(audio, (str, os.PathLike)):
+            filename = filename or os.path.basename(audio)
+            with open(audio, "rb") as audio_file:
+                audio_bytes = audio_file.read()
+        elif isinstance(audio, (bytes, bytearray)):
+            audio_bytes = bytes(audio)
+        else:
+            filename = filename or os.path.basename(getattr(audio, "name", "") or "")
+            audio_bytes = audio.getvalue() if hasattr(audio, "getvalue") else audio.read()
+        
+        cache_key = transcript_key(audio_bytes)
+        if use_cache:
+            cached = transcript_cache.get(cache_key)
+            if cached is not None:
+                note(cache_hit=True, branch="cache")
+                return cached
+        
+        return transcript_flights.do(
+            cache_key,
+            lambda: _transcribe(audio_bytes, filename, cache_key, use_cache),
+            DEADLINES["whisper"]
+        )
         
     except Exception as e:
         raise Exception(f"Failed to transcribe audio: {str(e)}")
 
+def _transcribe(audio_bytes, filename, cache_key, use_cache):
+    chunks = prepare_audio_chunks(audio_bytes, filename or "audio.wav")
+    if len(chunks) > 1:
+        # Long clips are split at pauses and transcribed in parallel, in order
+        note(branch="chunked")
+        with ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS) as pool:
+            parts = list(pool.map(bind(lambda chunk: _transcribe_chunk(*chunk)), chunks))
+        text = " ".join(part.strip() for part in parts if part.strip())
+    elif chunks:
+        text = _transcribe_chunk(*chunks[0])
+    else:
+        text = ""
+
+    if use_cache and text:
+        transcript_cache.set(cache_key, text)
+    return text
+
+@instrumented("whisper_request")
+def _transcribe_chunk(filename, audio_bytes):
+    """Send one audio file to Whisper"""
+    
+    # Whisper detects the format from the file name, so keep the real extension
+    response = call_with_resilience(
+        "whisper",
+        lambda timeout: scheduled_call(
+            "whisper",
+            0,
+            timeout,
+            lambda budget: get_client("whisper", budget).audio.transcriptions.create(
+                model="whisper-1",
+                file=(filename, audio_bytes),
+                language="en"
+            )
+        )
+    )
+    note_usage(response)
+    return response.text
+
+@instrumented("speech_extraction")
 def extract_ingredients_from_speech(transcribed_text):
-    """Extract ingredients from transcribed speech using OpenAI"""
+    """Extract ingredients from transcribed speech, asking OpenAI only when the local match is unsure"""
     
-    prompt = f"""
+    ingredients, excluded, confidence = extract_ingredients(transcribed_text)
+    if ingredients and confidence >= GAZETTEER_MIN_CONFIDENCE:
+        note(branch="local")
+        return ingredients
+    
+    # Ingredients the speaker said they do not have stay out of the model's answer
+    excluded_keys = {canonical_name(name) for name in excluded}
+    found = speech_flights.do(
+        transcribed_text.strip(),
+        lambda: _extract_ingredients_with_model(transcribed_text),
+        DEADLINES["chat"]
+    )
+    return [ingredient for ingredient in found if canonical_name(ingredient) not in excluded_keys]
+
+
+SPEECH_SYSTEM_PROMPT = "You are an expert at identifying food ingredients from spoken text."
+
+def _speech_prompt(transcribed_text):
+    """Build the JSON prompt asking for the ingredients in a transcript"""
+    
+    return f"""
     From the following text that was spoken by someone describing their available ingredients:
     "{transcribed_text}"
     
@@ -167,36 +734,45 @@ def extract_ingredients_from_speech(transcribed_text):
     Use simple, common names for ingredients.
     If no ingredients are mentioned, return: {{"ingredients": []}}
     """
-    
+
+def _speech_fallback_prompt(transcribed_text):
+    return f"From this text: '{transcribed_text}', list only the food ingredients mentioned, separated by commas:"
+
+def _extract_ingredients_with_model(transcribed_text):
     try:
-        response = client.chat.completions.create(
+        response = _chat_completion("chat",
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": "You are an expert at identifying food ingredients from spoken text."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SPEECH_SYSTEM_PROMPT},
+                {"role": "user", "content": _speech_prompt(transcribed_text)}
             ],
             response_format={"type": "json_object"},
             max_tokens=300
         )
         
+        note_usage(response)
         result = json.loads(response.choices[0].message.content)
         return result.get("ingredients", [])
         
     except json.JSONDecodeError:
-        # Fallback method
-        fallback_prompt = f"From this text: '{transcribed_text}', list only the food ingredients mentioned, separated by commas:"
+        # Recover the list locally before asking again
+        ingredients = salvage_ingredients(response.choices[0].message.content, limit=10)
+        if ingredients is not None:
+            note(branch="salvaged")
+            return ingredients
         
-        response = client.chat.completions.create(
+        # Fallback method
+        note(branch="fallback")
+        response = _chat_completion("chat",
             model="gpt-4o",
             messages=[
-                {"role": "user", "content": fallback_prompt}
+                {"role": "user", "content": _speech_fallback_prompt(transcribed_text)}
             ],
             max_tokens=200
         )
         
-        text_result = response.choices[0].message.content
-        ingredients = [ing.strip() for ing in text_result.split(',') if ing.strip()]
-        return ingredients[:10]  # Limit to 10 ingredients
+        note_usage(response)
+        return _split_ingredient_list(response.choices[0].message.content)
         
     except Exception as e:
         raise Exception(f"Failed to extract ingredients from speech: {str(e)}")
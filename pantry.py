@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from normalization import canonical_name, display_name
+
+# SQLite file holding every user's saved ingredients; empty keeps pantries for the session only
+PANTRY_DB = os.environ.get("PANTRY_DB", os.path.join(".data", "pantry.sqlite3"))
+
+
+class PantryStore:
+    """Saved ingredient lists, one per user, in a SQLite table keyed on (user, canonical name)
+
+    Every change is written as a single-row insert, update or delete, so a
+    pantry never has to be rewritten as a whole.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pantry ("
+            "user_id TEXT NOT NULL, key TEXT NOT NULL, name TEXT NOT NULL, "
+            "position INTEGER NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (user_id, key)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS pantry_order ON pantry (user_id, position)")
+        self._db.commit()
+
+    def load(self, user_id):
+        """Return (key, name, position) rows for a user in the order they were added"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT key, name, position FROM pantry WHERE user_id = ? ORDER BY position",
+                (user_id,)
+            ).fetchall()
+
+    def add(self, user_id, items):
+        """Insert (key, name, position) rows, ignoring keys the user already has"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pantry (user_id, key, name, position, updated) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, key, name, position, now) for key, name, position in items]
+            )
+            self._db.commit()
+
+    def rename(self, user_id, old_key, new_key, name):
+        """Point an existing row at a different ingredient, keeping its position"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE pantry SET key = ?, name = ?, updated = ? WHERE user_id = ? AND key = ?",
+                (new_key, name, time.time(), user_id, old_key)
+            )
+            self._db.commit()
+
+    def remove(self, user_id, key):
+        with self._lock:
+            self._db.execute("DELETE FROM pantry WHERE user_id = ? AND key = ?", (user_id, key))
+            self._db.commit()
+
+    def clear(self, user_id):
+        with self._lock:
+            self._db.execute("DELETE FROM pantry WHERE user_id = ?", (user_id,))
+            self._db.commit()
+
+
+class Pantry:
+    """One user's ingredients, de-duplicated by canonical name and kept in the order they were added
+
+    Lookups and de-duplication happen in memory; each change is also written
+    to the store, when there is one, so the list survives the session.
+    """
+
+    def __init__(self, user_id=None, store=None):
+        self.user_id = user_id or uuid.uuid4().hex
+        self.store = store
+        self._items = OrderedDict()
+        self._next_position = 0
+        if store is not None:
+            for key, name, position in store.load(self.user_id):
+                self._items[key] = name
+                self._next_position = position + 1
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __contains__(self, name):
+        return canonical_name(name) in self._items
+
+    @property
+    def names(self):
+        """Display names in the order they were added"""
+        return list(self._items.values())
+
+    def add(self, names):
+        """Add ingredients, skipping any already present under another spelling; returns those added"""
+        rows = []
+        for name in names:
+            key = canonical_name(name)
+            if key is None or key in self._items:
+                continue
+            self._items[key] = display_name(key)
+            rows.append((key, self._items[key], self._next_position))
+            self._next_position += 1
+        if rows and self.store is not None:
+            self.store.add(self.user_id, rows)
+        return [name for _, name, _ in rows]
+
+    def remove(self, name):
+        """Remove an ingredient by any of its spellings; returns whether it was present"""
+        key = canonical_name(name)
+        if key not in self._items:
+            return False
+        del self._items[key]
+        if self.store is not None:
+            self.store.remove(self.user_id, key)
+        return True
+
+    def update(self, old_name, new_name):
+        """Replace an ingredient in place, or drop it if the new one is already in the pantry"""
+        old_key = canonical_name(old_name)
+        new_key = canonical_name(new_name)
+        if old_key not in self._items or old_key == new_key:
+            return
+        if new_key is None or new_key in self._items:
+            self.remove(old_name)
+            return
+        # Rebuild the order around the renamed entry; pantries are short
+        self._items = OrderedDict(
+            (new_key, display_name(new_key)) if key == old_key else (key, name)
+            for key, name in self._items.items()
+        )
+        if self.store is not None:
+            self.store.rename(self.user_id, old_key, new_key, self._items[new_key])
+
+    def clear(self):
+        self._items.clear()
+        self._next_position = 0
+        if self.store is not None:
+            self.store.clear(self.user_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide pantry store, opened on first use, or None when persistence is off"""
+    global _store
+    if _store is None and PANTRY_DB:
+        with _store_lock:
+            if _store is None:
+                _store = PantryStore(PANTRY_DB)
+    return _store
+
+
+def open_pantry(user_id=None):
+    """Load a user's saved pantry, or start an empty one under a new id"""
+    return Pantry(user_id, get_store())
@@ -0,0 +1,304 @@
+import json
+import re
+import threading
+from normalization import canonical_name, display_name, normalize_ingredients
+
+def validate_ingredients(ingredients):
+    """Validate and clean ingredient list, merging spellings of the same ingredient"""
+    return [display_name(key) for key in normalize_ingredients(ingredients)]
+
+def merge_ingredients(existing, new):
+    """Append new ingredients to an existing list, skipping any already present under another spelling"""
+    merged = list(existing)
+    seen = {canonical_name(ingredient) for ingredient in existing}
+    for ingredient in new:
+        key = canonical_name(ingredient)
+        if key is not None and key not in seen:
+            seen.add(key)
+            merged.append(display_name(key))
+    return merged
+
+def is_valid_ingredient(ingredient):
+    """Check if a string looks like a valid ingredient"""
+    if not ingredient or len(ingredient.strip()) < 2:
+        return False
+    
+    # Check if it contains mostly letters
+    letter_count = sum(1 for c in ingredient if c.isalpha())
+    total_count = len(ingredient.replace(' ', ''))
+    
+    if total_count == 0:
+        return False
+    
+    letter_ratio = letter_count / total_count
+    return letter_ratio > 0.5
+
+def clean_recipe_json(recipe_data):
+    """Clean and validate recipe JSON data"""
+    if not isinstance(recipe_data, dict):
+        return recipe_data
+    
+    # Ensure required fields exist
+    required_fields = ['title', 'ingredients', 'instructions']
+    for field in required_fields:
+        if field not in recipe_data:
+            recipe_data[field] = f"No {field} provided"
+    
+    # Clean ingredients list
+    if isinstance(recipe_data.get('ingredients'), list):
+        recipe_data['ingredients'] = [ing for ing in recipe_data['ingredients'] if ing and ing.strip()]
+    
+    # Clean instructions list
+    if isinstance(recipe_data.get('instructions'), list):
+        recipe_data['instructions'] = [inst for inst in recipe_data['instructions'] if inst and inst.strip()]
+    
+    return recipe_data
+
+def estimate_cooking_difficulty(recipe_data):
+    """Estimate cooking difficulty based on recipe complexity"""
+    if not isinstance(recipe_data, dict):
+        return "Medium"
+    
+    ingredients_count = len(recipe_data.get('ingredients', []))
+    instructions_count = len(recipe_data.get('instructions', []))
+    
+    if ingredients_count <= 5 and instructions_count <= 5:
+        return "Easy"
+    elif ingredients_count <= 10 and instructions_count <= 10:
+        return "Medium"
+    else:
+        return "Advanced"
+
+class PartialJSONParser:
+    """Incrementally parse a JSON document that is still being streamed.
+
+    Chunks are scanned once as they arrive to track open strings and
+    brackets, so a best-effort snapshot of the document so far can be
+    produced cheaply at any point.
+    """
+
+    _closers = {'{': '}', '[': ']'}
+
+    def __init__(self):
+        self.text = ''
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._last_good = None
+        # Position of the last comma outside strings, and the brackets open there
+        self._cut = None
+
+    def feed(self, chunk):
+        """Add a chunk of streamed text"""
+        offset = len(self.text)
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in self._closers:
+                self._stack.append(self._closers[char])
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+            elif char == ',':
+                self._cut = (offset + i, tuple(self._stack))
+        self.text += chunk
+
+    def snapshot(self):
+        """Return the most complete value that can be parsed so far, or None"""
+        start = self.text.find('{')
+        if start == -1:
+            start = self.text.find('[')
+        if start == -1:
+            return self._last_good
+
+        candidate = self.text[start:]
+        if self._in_string:
+            if self._escape:
+                candidate = candidate[:-1]
+            candidate += '"'
+        candidate = candidate.rstrip()
+        if candidate.endswith(','):
+            candidate = candidate[:-1]
+        elif candidate.endswith(':'):
+            candidate += ' null'
+        candidate += ''.join(reversed(self._stack))
+
+        try:
+            self._last_good = json.loads(candidate)
+        except json.JSONDecodeError:
+            # Cut off inside an object key or a literal such as "tr": drop the unfinished member
+            if self._cut is not None and self._cut[0] > start:
+                cut, stack = self._cut
+                try:
+                    self._last_good = json.loads(self.text[start:cut] + ''.join(reversed(stack)))
+                except json.JSONDecodeError:
+                    pass
+        return self._last_good
+
+_salvage_lock = threading.Lock()
+salvage_stats = {
+    'attempts': 0,
+    'json_recovered': 0,
+    'list_recovered': 0,
+    'failed': 0,
+}
+
+def _count_salvage(outcome):
+    with _salvage_lock:
+        salvage_stats[outcome] += 1
+
+def get_salvage_stats():
+    """Snapshot of local JSON repair counts by outcome"""
+    with _salvage_lock:
+        return dict(salvage_stats)
+
+_CODE_FENCE = re.compile(r'```(?:json|JSON)?\s*(.*?)(?:```|$)', re.DOTALL)
+_LIST_MARKER = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+# An introduction such as "Here are the ingredients I can see:" that names what follows
+_LIST_INTRO = re.compile(r'^[^:]*\b(?:ingredients?|items?|foods?)\b[^:]*:\s*', re.IGNORECASE | re.DOTALL)
+# Words that mark a sentence about the request rather than an ingredient
+_PROSE_WORDS = {
+    'i', 'is', 'are', 'was', 'be', 'it', 'this', 'there', 'not', 'no', 'cannot', "can't",
+    'unable', 'sorry', 'image', 'photo', 'picture', 'recording', 'audio', 'tell', 'see',
+}
+
+def _strip_trailing_commas(text):
+    """Remove commas that directly precede a closing bracket, outside strings"""
+    result = []
+    in_string = False
+    escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '}]':
+            # Drop a trailing comma (and the whitespace after it)
+            end = len(result)
+            while end and result[end - 1].isspace():
+                end -= 1
+            if end and result[end - 1] == ',':
+                del result[end - 1:]
+        result.append(char)
+    return ''.join(result)
+
+def salvage_json(text):
+    """Recover a JSON value from malformed or truncated model output, or return None
+
+    Strips code fences and surrounding prose, removes trailing commas and
+    closes any strings and brackets left open by truncation.
+    """
+    if not text:
+        return None
+    
+    fenced = _CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        return None
+    text = _strip_trailing_commas(text[min(starts):])
+    
+    # Take the first complete value, ignoring any prose after it
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except json.JSONDecodeError:
+        pass
+    
+    parser = PartialJSONParser()
+    parser.feed(text)
+    return parser.snapshot()
+
+def salvage_reply(text):
+    """Recover a JSON value from a malformed model reply, counting the outcome"""
+    _count_salvage('attempts')
+    value = salvage_json(text)
+    _count_salvage('failed' if value is None else 'json_recovered')
+    return value
+
+def extract_list_from_prose(text, limit=None):
+    """Pull a list of ingredient-like items out of free text such as bullets or a comma-separated sentence
+
+    Without bullets the text must introduce its list as ingredients or items,
+    or be an obvious list of three or more. Items that read like part of a
+    sentence are dropped.
+    """
+    if not text:
+        return []
+    
+    lines = [line for line in text.splitlines() if line.strip()]
+    bullets = [_LIST_MARKER.sub('', line).strip() for line in lines if _LIST_MARKER.match(line)]
+    if bullets:
+        items = bullets
+    else:
+        sentence = ' '.join(lines)
+        has_intro = _LIST_INTRO.match(sentence) is not None
+        sentence = _LIST_INTRO.sub('', sentence, count=1)
+        sentence = re.sub(r'\s+and\s+', ', ', sentence.rstrip('.'))
+        items = [item.strip() for item in re.split(r'[,;.]', sentence)]
+        # Without bullets or an introduction, only trust an obvious list
+        if not has_intro and len(items) < 3:
+            return []
+    
+    items = [item.strip(' .*"\'') for item in items]
+    items = [item for item in items if item]
+    kept = [item for item in items if _looks_like_ingredient(item)]
+    # An unintroduced sentence only counts if every part of it is an ingredient
+    if not bullets and not has_intro and len(kept) < len(items):
+        return []
+    return kept[:limit] if limit else kept
+
+def _looks_like_ingredient(item):
+    words = item.lower().split()
+    return (
+        0 < len(words) <= 4
+        and not _PROSE_WORDS.intersection(words)
+        and is_valid_ingredient(item)
+        and canonical_name(item) is not None
+    )
+
+def salvage_ingredients(text, limit=None):
+    """Recover an ingredient list from a malformed model reply, or return None"""
+    _count_salvage('attempts')
+    
+    value = salvage_json(text)
+    if isinstance(value, dict):
+        value = value.get('ingredients')
+    if isinstance(value, list):
+        ingredients = [str(item) for item in value if item and is_valid_ingredient(str(item))]
+        if ingredients:
+            _count_salvage('json_recovered')
+            return ingredients[:limit] if limit else ingredients
+    
+    # Reading JSON as prose would only produce fragments of it
+    ingredients = extract_list_from_prose(text, limit) if value is None else []
+    if ingredients:
+        _count_salvage('list_recovered')
+        return ingredients
+    
+    _count_salvage('failed')
+    return None
+
+def salvage_recipe(text):
+    """Recover a recipe dict from a malformed model reply, or return None"""
+    _count_salvage('attempts')
+    
+    value = salvage_json(text)
+    if isinstance(value, dict) and value.get('title'):
+        _count_salvage('json_recovered')
+        return clean_recipe_json(value)
+    
+    _count_salvage('failed')
+    return None
@@ -0,0 +1,145 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cache import ingredients_key, fingerprint
+from openai_helper import generate_recipe_from_ingredients
+from scheduler import scheduling, bind, BACKGROUND
+from telemetry import register_metrics
+
+# Generate alternative recipes in the background while the user reads one
+PREFETCH_RECIPES = os.environ.get("PREFETCH_RECIPES", "0") == "1"
+# How many alternatives to keep ready per session
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", 2))
+# Background generations running at once across all sessions
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 4))
+
+_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+_stats_lock = threading.Lock()
+prefetch_stats = {
+    'started': 0,
+    'generated': 0,
+    'used': 0,
+    'discarded': 0,
+    'empty': 0,
+    'errors': 0,
+}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        prefetch_stats[name] += amount
+
+
+def get_prefetch_stats():
+    """Return a snapshot of the prefetch counters"""
+    with _stats_lock:
+        stats = dict(prefetch_stats)
+    served = stats['used'] + stats['empty']
+    stats['hit_rate'] = stats['used'] / served if served else 0.0
+    return stats
+
+
+class RecipePrefetcher:
+    """Per-session queue of recipes generated ahead of "Get Another Recipe".
+
+    Each session runs at most one background task, which fills the queue one
+    recipe at a time so every prefetched recipe differs from the ones before
+    it. Changing the ingredients cancels the task and drops the queue.
+    """
+
+    def __init__(self, depth=PREFETCH_DEPTH):
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._key = None
+        self._queue = deque()
+        self._generation = 0
+        self._future = None
+
+    def start(self, ingredients, seen):
+        """Top up the queue with alternatives to the recipes already seen"""
+        key = ingredients_key(ingredients)
+        with self._lock:
+            if key != self._key:
+                self._reset(key)
+            if self._future is not None and not self._future.done():
+                return
+            if len(self._queue) >= self.depth:
+                return
+            generation = self._generation
+            exclude = list(seen)
+            self._future = _pool.submit(bind(self._fill), generation, list(ingredients), exclude)
+        _count('started')
+
+    def take(self, ingredients, seen):
+        """Pop a prefetched recipe for these ingredients that has not been seen, or None"""
+        key = ingredients_key(ingredients)
+        seen_keys = {fingerprint(recipe) for recipe in seen}
+        with self._lock:
+            if key != self._key:
+                self._reset(key)
+            while self._queue:
+                recipe = self._queue.popleft()
+                if fingerprint(recipe) not in seen_keys:
+                    _count('used')
+                    return recipe
+                _count('discarded')
+        _count('empty')
+        return None
+
+    def cancel(self):
+        """Stop background work and drop any queued recipes"""
+        with self._lock:
+            self._reset(None)
+
+    def _reset(self, key):
+        # Bumping the generation makes a running task stop and discard its result
+        self._generation += 1
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+        _count('discarded', len(self._queue))
+        self._queue.clear()
+        self._key = key
+
+    def _fill(self, generation, ingredients, exclude):
+        while True:
+            with self._lock:
+                if generation != self._generation or len(self._queue) >= self.depth:
+                    return
+                exclude = exclude + list(self._queue)
+
+            try:
+                # Wait behind anyone actively asking for a recipe
+                with scheduling(priority=BACKGROUND):
+                    recipe = generate_recipe_from_ingredients(ingredients, exclude=exclude)
+            except Exception:
+                _count('errors')
+                return
+
+            with self._lock:
+                if generation != self._generation:
+                    _count('discarded')
+                    return
+                self._queue.append(recipe)
+            _count('generated')
+
+
+def _prefetch_metrics():
+    stats = get_prefetch_stats()
+    lines = [
+        "# HELP recipe_prefetch_total Background recipe generations and what became of them",
+        "# TYPE recipe_prefetch_total counter",
+    ]
+    for name in ('started', 'generated', 'used', 'discarded', 'empty', 'errors'):
+        lines.append(f'recipe_prefetch_total{{result="{name}"}} {stats[name]}')
+    lines += [
+        "# HELP recipe_prefetch_hit_ratio Share of \"Get Another Recipe\" clicks answered by a prefetched recipe",
+        "# TYPE recipe_prefetch_hit_ratio gauge",
+        f"recipe_prefetch_hit_ratio {stats['hit_rate']}",
+    ]
+    return lines
+
+
+register_metrics(_prefetch_metrics)
@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import warnings
+from cache import CACHE_DIR, fingerprint, make_key
+from gazetteer import find_matches, head_matches, tokenize, vocabulary_signature
+from normalization import normalize_ingredients
+from recipe_matrix import RecipeMatrix, DIFFICULTY_LEVELS
+from telemetry import register_metrics
+from parsing import estimate_cooking_difficulty
+
+# Recipes answered locally before asking the model; a .jsonl file or a SQLite
+# database with a recipes(recipe) table of JSON text. Empty disables the index.
+RECIPE_CORPUS = os.environ.get(
+    "RECIPE_CORPUS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "recipes.jsonl")
+)
+# Most ingredients a local recipe may need that the user does not have
+MAX_MISSING = int(os.environ.get("RECIPE_INDEX_MAX_MISSING", 1))
+# Fewest of the user's ingredients a local recipe must use
+MIN_MATCHED = int(os.environ.get("RECIPE_INDEX_MIN_MATCHED", 2))
+# Hardest local recipe to suggest: Easy, Medium or Advanced; unset allows all
+MAX_DIFFICULTY = os.environ.get("RECIPE_MAX_DIFFICULTY", "").strip().capitalize() or None
+if MAX_DIFFICULTY is not None and MAX_DIFFICULTY not in DIFFICULTY_LEVELS:
+    # A typo here would otherwise break every local search, and recipe generation with it
+    warnings.warn(
+        f"Ignoring RECIPE_MAX_DIFFICULTY={MAX_DIFFICULTY!r}; expected one of {', '.join(DIFFICULTY_LEVELS)}"
+    )
+    MAX_DIFFICULTY = None
+
+# Assumed to be in every kitchen, so never counted as missing
+STAPLES = frozenset({'salt', 'pepper', 'black pepper', 'water', 'oil', 'olive oil', 'vegetable oil'})
+
+_stats_lock = threading.Lock()
+index_stats = {
+    'hits': 0,
+    'misses': 0,
+}
+
+
+def _count(name):
+    with _stats_lock:
+        index_stats[name] += 1
+
+
+def recipe_ingredient_keys(recipe):
+    """Canonical names of the ingredients a recipe needs, from lines such as "2 onions, chopped" """
+    keys = []
+    for line in recipe.get('ingredients') or []:
+        keys.extend(key for _, _, key in head_matches(find_matches(tokenize(line))))
+    return frozenset(keys)
+
+
+def load_corpus(path):
+    """Read recipes from a JSONL file or a SQLite database"""
+    if path.endswith((".sqlite", ".sqlite3", ".db")):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT recipe FROM recipes").fetchall()
+        finally:
+            conn.close()
+        return [json.loads(row[0]) for row in rows]
+
+    recipes = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                recipes.append(json.loads(line))
+    return recipes
+
+
+class RecipeIndex:
+    """Recipe collection with a bitset matrix over canonical ingredient names
+
+    Each column of the matrix is the inverted list of recipes using one
+    ingredient; a pantry is scored against every recipe in one vectorised pass.
+    """
+
+    def __init__(self, recipes, matrix=None):
+        self.recipes = recipes
+        if matrix is None:
+            matrix = RecipeMatrix.build(
+                [_required(recipe) for recipe in recipes],
+                [_difficulty(recipe) for recipe in recipes],
+                STAPLES
+            )
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def search(self, ingredients, limit=3, exclude=None, max_missing=MAX_MISSING, min_matched=MIN_MATCHED,
+               max_difficulty=MAX_DIFFICULTY):
+        """Recipes best covered by the given ingredients, fewest missing first"""
+        pantry = set(normalize_ingredients(ingredients)) - STAPLES
+        excluded = {fingerprint(recipe) for recipe in exclude or []}
+        rows = self.matrix.top_k(
+            pantry,
+            limit + len(excluded),
+            max_missing=max_missing,
+            min_matched=min(min_matched, len(pantry)),
+            max_difficulty=max_difficulty
+        )
+
+        results = []
+        for row in rows:
+            recipe = self.recipes[row]
+            if excluded and fingerprint(recipe) in excluded:
+                continue
+            results.append(dict(recipe))
+            if len(results) >= limit:
+                break
+        return results
+
+
+def _required(recipe):
+    if not isinstance(recipe, dict) or not recipe.get('title'):
+        return frozenset()
+    return recipe_ingredient_keys(recipe)
+
+
+def _difficulty(recipe):
+    if not isinstance(recipe, dict):
+        return "Advanced"
+    return estimate_cooking_difficulty(recipe)
+
+
+def _matrix_prefix(path):
+    """Where the matrix for a corpus file is kept, so worker processes can share it"""
+    if not CACHE_DIR:
+        return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    stat = os.stat(path)
+    # The vocabulary decides the matrix's columns and the bits set in each row
+    signature = make_key(
+        os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sorted(STAPLES), vocabulary_signature()
+    )
+    return os.path.join(CACHE_DIR, f"recipe_matrix_{signature[:16]}")
+
+
+def load_index(path):
+    """Load a corpus, memory-mapping its saved matrix or building and saving one"""
+    recipes = load_corpus(path)
+    prefix = _matrix_prefix(path)
+    matrix = RecipeMatrix.load(prefix, STAPLES) if prefix else None
+    if matrix is not None and len(matrix) == len(recipes):
+        return RecipeIndex(recipes, matrix)
+
+    index = RecipeIndex(recipes)
+    if prefix:
+        try:
+            index.matrix.save(prefix)
+        except OSError:
+            pass
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index over RECIPE_CORPUS, loaded on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if RECIPE_CORPUS and os.path.exists(RECIPE_CORPUS):
+                    _index = load_index(RECIPE_CORPUS)
+                else:
+                    _index = RecipeIndex([])
+    return _index
+
+
+def find_local_recipes(ingredients, limit=3, exclude=None):
+    """Recipes from the local corpus that suit the ingredients, or an empty list"""
+    results = get_index().search(ingredients, limit=limit, exclude=exclude)
+    _count('hits' if results else 'misses')
+    return results
+
+
+def _index_metrics():
+    lines = [
+        "# HELP recipe_index_lookups_total Local recipe index lookups by outcome",
+        "# TYPE recipe_index_lookups_total counter",
+    ]
+    with _stats_lock:
+        for name, value in index_stats.items():
+            lines.append(f'recipe_index_lookups_total{{result="{name}"}} {value}')
+    return lines
+
+
+register_metrics(_index_metrics)
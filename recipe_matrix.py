@@ -0,0 +1,160 @@
+import json
+import os
+import numpy as np
+
+# Rows scored per vectorised step, bounding temporary memory for large corpora
+CHUNK_ROWS = 65536
+
+DIFFICULTY_LEVELS = ("Easy", "Medium", "Advanced")
+METRICS = ("coverage", "jaccard", "weighted")
+
+
+def _popcount_rows(words):
+    """Set bits per row of a packed uint64 matrix"""
+    return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+
+
+def _row_bits(vocabulary_size):
+    return max(1, (vocabulary_size + 63) // 64) * 64
+
+
+class RecipeMatrix:
+    """Recipes as packed bitsets over an ingredient vocabulary, scored against a pantry in one pass
+
+    Row i has bit j set when recipe i needs vocabulary[j]; rows are padded
+    to whole 64-bit words so they can be scored a word at a time. Staples
+    are kept in the rows but left out of the weighted score and the
+    missing count.
+    """
+
+    def __init__(self, bits, difficulty, vocabulary, staples=()):
+        self.bits = bits
+        self.words = bits.view(np.uint64)
+        self.difficulty = difficulty
+        self.vocabulary = list(vocabulary)
+        self.positions = {key: i for i, key in enumerate(self.vocabulary)}
+        self.core_mask = np.bitwise_not(self.encode(staples))
+        self.sizes = np.empty(len(bits), dtype=np.int32)
+        self.core_sizes = np.empty(len(bits), dtype=np.int32)
+        for start in range(0, len(bits), CHUNK_ROWS):
+            chunk = self.words[start:start + CHUNK_ROWS]
+            self.sizes[start:start + CHUNK_ROWS] = _popcount_rows(chunk)
+            self.core_sizes[start:start + CHUNK_ROWS] = _popcount_rows(chunk & self.core_mask)
+
+    def __len__(self):
+        return len(self.bits)
+
+    def encode(self, keys):
+        """Packed bitset of the vocabulary entries among keys, as uint64 words; unknown keys are ignored"""
+        row = np.zeros(_row_bits(len(self.vocabulary)), dtype=bool)
+        for key in keys:
+            position = self.positions.get(key)
+            if position is not None:
+                row[position] = True
+        return np.packbits(row).view(np.uint64)
+
+    @classmethod
+    def build(cls, required, difficulty, staples=()):
+        """Build from one set of canonical ingredient keys and one difficulty label per recipe"""
+        vocabulary = sorted(set().union(*required)) if required else []
+        positions = {key: i for i, key in enumerate(vocabulary)}
+        dense = np.zeros((len(required), _row_bits(len(vocabulary))), dtype=bool)
+        for row, keys in enumerate(required):
+            dense[row, [positions[key] for key in keys]] = True
+        bits = np.packbits(dense, axis=1)
+        levels = np.array([DIFFICULTY_LEVELS.index(level) for level in difficulty], dtype=np.int8)
+        return cls(bits, levels, vocabulary, staples)
+
+    def save(self, prefix):
+        """Write the matrix so other processes can memory-map it; replaces files atomically"""
+        for suffix, array in ((".bits.npy", self.bits), (".difficulty.npy", self.difficulty)):
+            temporary = f"{prefix}{suffix}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(temporary, prefix + suffix)
+        temporary = f"{prefix}.vocab.json.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f)
+        os.replace(temporary, prefix + ".vocab.json")
+
+    @classmethod
+    def load(cls, prefix, staples=()):
+        """Memory-map a matrix written by save, or return None if it is missing"""
+        try:
+            with open(prefix + ".vocab.json", encoding="utf-8") as f:
+                vocabulary = json.load(f)
+            bits = np.load(prefix + ".bits.npy", mmap_mode="r")
+            difficulty = np.load(prefix + ".difficulty.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return cls(bits, difficulty, vocabulary, staples)
+
+    def score(self, keys):
+        """Overlap between a pantry and every recipe
+
+        Returns a dict of arrays: matched and core_matched (ingredients the
+        pantry covers, all / excluding staples), missing (non-staple
+        ingredients the pantry lacks), coverage, jaccard and weighted scores.
+        """
+        keys = set(keys)
+        pantry = self.encode(keys)
+        # Only the words where the pantry has bits can contribute to the overlap
+        columns = np.flatnonzero(pantry)
+        pantry = pantry[columns]
+        core_pantry = pantry & self.core_mask[columns]
+        has_staples = bool(np.any(core_pantry != pantry))
+        matched = np.empty(len(self), dtype=np.int32)
+        core_matched = np.empty(len(self), dtype=np.int32) if has_staples else matched
+        for start in range(0, len(self), CHUNK_ROWS):
+            overlap = self.words[start:start + CHUNK_ROWS, columns] & pantry
+            matched[start:start + CHUNK_ROWS] = _popcount_rows(overlap)
+            if has_staples:
+                core_matched[start:start + CHUNK_ROWS] = _popcount_rows(overlap & core_pantry)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            coverage = np.where(self.sizes > 0, matched / self.sizes, 0.0)
+            union = self.sizes + len(keys) - matched
+            jaccard = np.where(union > 0, matched / union, 0.0)
+            weighted = np.where(self.core_sizes > 0, core_matched / self.core_sizes, 0.0)
+        return {
+            'matched': matched,
+            'core_matched': core_matched,
+            'missing': self.core_sizes - core_matched,
+            'coverage': coverage,
+            'jaccard': jaccard,
+            'weighted': weighted,
+        }
+
+    def top_k(self, keys, k, metric="weighted", max_missing=None, min_matched=0, max_difficulty=None):
+        """Row numbers of the k best recipes for a pantry, best first
+
+        Recipes are ordered by fewest missing ingredients, then by the chosen
+        metric, then by how many pantry ingredients they use.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+        if max_difficulty is not None and max_difficulty not in DIFFICULTY_LEVELS:
+            raise ValueError(f"Unknown difficulty {max_difficulty!r}; expected one of {', '.join(DIFFICULTY_LEVELS)}")
+        if k <= 0 or len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        scores = self.score(keys)
+        mask = scores['core_matched'] >= max(min_matched, 1)
+        if max_missing is not None:
+            mask &= scores['missing'] <= max_missing
+        if max_difficulty is not None:
+            mask &= self.difficulty <= DIFFICULTY_LEVELS.index(max_difficulty)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return candidates
+
+        # Missing count dominates; the metric is in [0, 1] and matched breaks ties
+        rank = (
+            -scores['missing'][candidates].astype(np.float64)
+            + scores[metric][candidates]
+            + scores['matched'][candidates] * 1e-6
+        )
+        if len(candidates) > k:
+            best = np.argpartition(-rank, k - 1)[:k]
+            candidates, rank = candidates[best], rank[best]
+        return candidates[np.argsort(-rank, kind="stable")]
@@ -0,0 +1,304 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import openai
+import telemetry
+
+# Attempts per call, including the first
+MAX_ATTEMPTS = max(1, int(os.environ.get("OPENAI_MAX_ATTEMPTS", 4)))
+BACKOFF_BASE = float(os.environ.get("OPENAI_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("OPENAI_BACKOFF_MAX", 20))
+
+# Consecutive failures that open an operation's circuit, and how long it stays open
+BREAKER_THRESHOLD = int(os.environ.get("OPENAI_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("OPENAI_BREAKER_COOLDOWN", 30))
+
+# Send a duplicate request when the first is slower than the recent p95
+HEDGE_REQUESTS = os.environ.get("OPENAI_HEDGE_REQUESTS", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.5
+
+# Total time budget in seconds per call, across all attempts
+DEADLINES = {
+    "chat": float(os.environ.get("OPENAI_CHAT_DEADLINE", 90)),
+    "vision": float(os.environ.get("OPENAI_VISION_DEADLINE", 120)),
+    "whisper": float(os.environ.get("OPENAI_WHISPER_DEADLINE", 180)),
+}
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+_stats_lock = threading.Lock()
+resilience_stats = {
+    'retries': 0,
+    'hedges': 0,
+    'hedge_wins': 0,
+    'breaker_rejections': 0,
+    'deadline_exceeded': 0,
+}
+
+
+def _count(name):
+    with _stats_lock:
+        resilience_stats[name] += 1
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an operation whose circuit breaker is open"""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a call's time budget runs out before it succeeds"""
+
+
+class CircuitBreaker:
+    """Stops calling an operation after repeated failures, then lets one trial call through"""
+
+    def __init__(self, operation, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.operation = operation
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go ahead now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # Let a single trial call decide whether to close again; a trial that
+            # never reported back is given up on after another cooldown
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def release(self):
+        """Report a call that ended without an answer from the API, e.g. one that ran out of time in a local queue
+
+        Nothing was learned about the service, so the counts are left alone; a
+        trial call gives its place to the next caller straight away.
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic() - self.cooldown
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful call latencies, used to pick a hedging delay"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+_breakers = {operation: CircuitBreaker(operation) for operation in DEADLINES}
+_latencies = {operation: LatencyTracker() for operation in DEADLINES}
+
+
+def retry_delay(attempt, error=None):
+    """Seconds to wait before the next attempt, honouring Retry-After when the API sends it"""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    # Full jitter: uniform between zero and the exponential cap
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _hedged(operation, attempt_call, timeout):
+    """Run attempt_call, starting a duplicate if the first has not answered by the p95 latency"""
+    delay = _latencies[operation].p95()
+    record = telemetry.current_call()
+
+    def run():
+        telemetry.attach(record)
+        try:
+            return attempt_call(timeout)
+        finally:
+            telemetry.detach(record)
+
+    if delay is None:
+        return attempt_call(timeout)
+
+    # Copy the caller's context so both attempts keep its scheduling priority and session
+    first = _hedge_pool.submit(contextvars.copy_context().run, run)
+    done, _ = wait([first], timeout=max(delay, HEDGE_MIN_DELAY))
+    if done:
+        return first.result()
+
+    _count('hedges')
+    second = _hedge_pool.submit(contextvars.copy_context().run, run)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    _count('hedge_wins')
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_resilience(operation, attempt_call, hedge=True):
+    """Call attempt_call(timeout) with retries, a circuit breaker, a deadline and optional hedging
+
+    attempt_call receives the seconds left in the call's budget and should
+    use them as its request timeout.
+    """
+    breaker = _breakers[operation]
+    deadline = time.monotonic() + DEADLINES[operation]
+    error = None
+
+    for attempt in range(MAX_ATTEMPTS):
+        if not breaker.allow():
+            _count('breaker_rejections')
+            raise CircuitOpenError(f"The {operation} service is temporarily unavailable. Please try again shortly.")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        start = time.monotonic()
+        try:
+            if hedge and HEDGE_REQUESTS:
+                result = _hedged(operation, attempt_call, remaining)
+            else:
+                result = attempt_call(remaining)
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            error = e
+        except openai.APIStatusError:
+            # Client errors such as a bad request will not succeed on retry
+            breaker.record_success()
+            raise
+        except BaseException:
+            # Not the service's fault, e.g. running out of time waiting for rate limit capacity
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            _latencies[operation].add(time.monotonic() - start)
+            return result
+
+        if attempt + 1 < MAX_ATTEMPTS:
+            delay = retry_delay(attempt, error)
+            if time.monotonic() + delay >= deadline:
+                break
+            _count('retries')
+            time.sleep(delay)
+
+    if error is not None and attempt + 1 >= MAX_ATTEMPTS:
+        raise error
+    _count('deadline_exceeded')
+    raise DeadlineExceededError(f"The {operation} request did not finish within {DEADLINES[operation]:.0f} seconds") from error
+
+
+async def acall_with_resilience(operation, attempt_call):
+    """Async counterpart of call_with_resilience for coroutine-based clients, without hedging
+
+    attempt_call(timeout) must return an awaitable. Shares the breakers,
+    latency samples and counters of the synchronous path.
+    """
+    breaker = _breakers[operation]
+    deadline = time.monotonic() + DEADLINES[operation]
+    error = None
+
+    for attempt in range(MAX_ATTEMPTS):
+        if not breaker.allow():
+            _count('breaker_rejections')
+            raise CircuitOpenError(f"The {operation} service is temporarily unavailable. Please try again shortly.")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        start = time.monotonic()
+        try:
+            result = await attempt_call(remaining)
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            error = e
+        except openai.APIStatusError:
+            breaker.record_success()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            _latencies[operation].add(time.monotonic() - start)
+            return result
+
+        if attempt + 1 < MAX_ATTEMPTS:
+            delay = retry_delay(attempt, error)
+            if time.monotonic() + delay >= deadline:
+                break
+            _count('retries')
+            await asyncio.sleep(delay)
+
+    if error is not None and attempt + 1 >= MAX_ATTEMPTS:
+        raise error
+    _count('deadline_exceeded')
+    raise DeadlineExceededError(f"The {operation} request did not finish within {DEADLINES[operation]:.0f} seconds") from error
+
+
+def _resilience_metrics():
+    lines = [
+        "# HELP openai_resilience_events_total Retries, hedges and breaker events",
+        "# TYPE openai_resilience_events_total counter",
+    ]
+    with _stats_lock:
+        for name, value in resilience_stats.items():
+            lines.append(f'openai_resilience_events_total{{event="{name}"}} {value}')
+    lines.append("# HELP openai_circuit_open Whether an operation's circuit breaker is open")
+    lines.append("# TYPE openai_circuit_open gauge")
+    for operation, breaker in _breakers.items():
+        lines.append(f'openai_circuit_open{{operation="{operation}"}} {int(breaker.state == "open")}')
+    return lines
+
+
+telemetry.register_metrics(_resilience_metrics)
@@ -0,0 +1,399 @@
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, suppress
+import openai
+from resilience import DeadlineExceededError, retry_delay
+from telemetry import register_metrics
+
+# Requests and tokens per minute allowed by the OpenAI account; 0 learns them from response headers
+OPENAI_RPM_LIMIT = int(os.environ.get("OPENAI_RPM_LIMIT", 0))
+OPENAI_TPM_LIMIT = int(os.environ.get("OPENAI_TPM_LIMIT", 0))
+OPENAI_WHISPER_RPM_LIMIT = int(os.environ.get("OPENAI_WHISPER_RPM_LIMIT", 0))
+# Share of each limit to use, leaving room for other clients and estimation error
+OPENAI_RATE_HEADROOM = float(os.environ.get("OPENAI_RATE_HEADROOM", 0.9))
+
+# Lower numbers are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+BATCH = 2
+PRIORITY_NAMES = ("interactive", "background", "batch")
+
+# Tokens charged for one image, by vision detail level
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+DEFAULT_MAX_TOKENS = 1000
+# Longest a queued call sleeps between checks when nothing wakes it
+MAX_POLL = 0.25
+
+_priority = contextvars.ContextVar("scheduler_priority", default=INTERACTIVE)
+_session = contextvars.ContextVar("scheduler_session", default=None)
+
+
+@contextmanager
+def scheduling(priority=None, session=None):
+    """Run the calls made inside the block at a priority and on behalf of a session"""
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if session is not None:
+        tokens.append((_session, _session.set(session)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+def current_session():
+    """The session calls are attributed to: the one set for this context, else the Streamlit session"""
+    session = _session.get()
+    # Only look for a Streamlit session inside the Streamlit app, so the API server never imports it
+    scriptrunner = sys.modules.get("streamlit.runtime.scriptrunner")
+    if session is None and scriptrunner is not None:
+        ctx = scriptrunner.get_script_run_ctx(suppress_warning=True)
+        session = ctx.session_id if ctx is not None else None
+    return session or "default"
+
+
+def set_session(session):
+    """Attribute later calls in this thread or task to a session, for fair queuing"""
+    _session.set(str(session))
+
+
+def bind(func):
+    """Wrap func so it runs with the caller's priority and session, e.g. on a worker thread"""
+    priority, session = _priority.get(), current_session()
+
+    def run(*args, **kwargs):
+        with scheduling(priority, session):
+            return func(*args, **kwargs)
+    return run
+
+
+def estimate_tokens(request):
+    """Tokens a chat completion counts against the TPM limit: prompt size plus max_tokens"""
+    characters = 0
+    images = 0
+    for message in request.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                characters += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += IMAGE_TOKENS.get(part.get("image_url", {}).get("detail", "auto"), 765)
+    # About four characters per token in English, plus a few tokens of framing per message
+    prompt = characters // 4 + 4 * len(request.get("messages") or []) + images
+    return prompt + (request.get("max_tokens") or DEFAULT_MAX_TOKENS)
+
+
+class TokenBucket:
+    """Allowance that refills continuously up to a per-minute capacity; a capacity of 0 means unlimited"""
+
+    def __init__(self, per_minute=0):
+        self.capacity = 0
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.set_limit(per_minute)
+
+    def set_limit(self, per_minute):
+        per_minute = per_minute * OPENAI_RATE_HEADROOM
+        if per_minute != self.capacity:
+            # Keep the same share of the allowance when the limit changes
+            share = self.level / self.capacity if self.capacity else 1.0
+            self.capacity = per_minute
+            self.level = per_minute * share
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken"""
+        self._refill(now)
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) * 60 / self.capacity)
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+    def limit_remaining(self, remaining):
+        """Lower the level to what the server says is left, scaled by the headroom"""
+        if self.capacity:
+            self.level = min(self.level, remaining * OPENAI_RATE_HEADROOM)
+
+
+class _Ticket:
+    """A call waiting for capacity"""
+
+    __slots__ = ('priority', 'session', 'tokens', 'granted', 'wake')
+
+    def __init__(self, tokens, wake=None):
+        self.priority = _priority.get()
+        self.session = current_session()
+        self.tokens = tokens
+        self.granted = False
+        self.wake = wake
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Admits calls to one rate-limited API under request and token budgets
+
+    Waiting calls are served by priority; within a priority, sessions take
+    turns, so one busy session cannot hold everyone else up.
+    """
+
+    def __init__(self, name, rpm=0, tpm=0):
+        self.name = name
+        self.buckets = {'requests': TokenBucket(rpm), 'tokens': TokenBucket(tpm)}
+        self.configured = {'requests': bool(rpm), 'tokens': bool(tpm)}
+        self._cond = threading.Condition()
+        self._queues = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._paused_until = 0.0
+        self.stats = {
+            name: {'granted': 0, 'wait_seconds': 0.0, 'timeouts': 0}
+            for name in PRIORITY_NAMES
+        }
+
+    def _enqueue(self, ticket):
+        self._queues[ticket.priority].setdefault(ticket.session, deque()).append(ticket)
+
+    def _dequeue(self, ticket):
+        sessions = self._queues[ticket.priority]
+        queue = sessions.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del sessions[ticket.session]
+
+    def _head(self):
+        for sessions in self._queues:
+            for queue in sessions.values():
+                return queue[0]
+        return None
+
+    def _dispatch(self):
+        """Admit waiting calls in turn while the budgets allow
+
+        Returns the seconds until the next waiting call can be admitted, or
+        None when nobody is waiting.
+        """
+        admitted = False
+        try:
+            while True:
+                ticket = self._head()
+                if ticket is None:
+                    return None
+                now = time.monotonic()
+                delay = max(
+                    self._paused_until - now,
+                    self.buckets['requests'].wait_time(1, now),
+                    self.buckets['tokens'].wait_time(ticket.tokens, now)
+                )
+                if delay > 0:
+                    return delay
+
+                self.buckets['requests'].take(1)
+                self.buckets['tokens'].take(ticket.tokens)
+                sessions = self._queues[ticket.priority]
+                sessions[ticket.session].popleft()
+                if sessions[ticket.session]:
+                    # Round robin: this session goes behind the others at its priority
+                    sessions.move_to_end(ticket.session)
+                else:
+                    del sessions[ticket.session]
+                ticket.granted = True
+                admitted = True
+                if ticket.wake is not None:
+                    ticket.wake()
+        finally:
+            if admitted:
+                self._cond.notify_all()
+
+    def _finish(self, ticket, start):
+        stats = self.stats[PRIORITY_NAMES[ticket.priority]]
+        stats['granted'] += 1
+        stats['wait_seconds'] += time.monotonic() - start
+        return time.monotonic() - start
+
+    def _give_up(self, ticket, timed_out=False):
+        self._dequeue(ticket)
+        if timed_out:
+            self.stats[PRIORITY_NAMES[ticket.priority]]['timeouts'] += 1
+        # Whoever was behind this call may be able to go now
+        self._dispatch()
+        self._cond.notify_all()
+
+    def acquire(self, tokens=0, timeout=None):
+        """Block until the call may go ahead; returns the seconds spent waiting"""
+        ticket = _Ticket(tokens)
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        with self._cond:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    delay = self._dispatch()
+                    if ticket.granted:
+                        return self._finish(ticket, start)
+                    delay = MAX_POLL if delay is None else min(delay, MAX_POLL)
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._give_up(ticket, timed_out=True)
+                            raise DeadlineExceededError(f"Waited too long for {self.name} rate limit capacity")
+                        delay = min(delay, remaining)
+                    self._cond.wait(delay)
+            except BaseException:
+                if not ticket.granted:
+                    self._give_up(ticket)
+                raise
+
+    async def acquire_async(self, tokens=0, timeout=None):
+        """acquire for coroutines: waits without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        ticket = _Ticket(tokens, wake=lambda: loop.call_soon_threadsafe(_set_done, woken))
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        try:
+            with self._cond:
+                self._enqueue(ticket)
+            while True:
+                with self._cond:
+                    delay = self._dispatch()
+                    if ticket.granted:
+                        return self._finish(ticket, start)
+                    delay = MAX_POLL if delay is None else min(delay, MAX_POLL)
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._give_up(ticket, timed_out=True)
+                            raise DeadlineExceededError(f"Waited too long for {self.name} rate limit capacity")
+                        delay = min(delay, remaining)
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(asyncio.shield(woken), delay)
+        except BaseException:
+            with self._cond:
+                if not ticket.granted:
+                    self._give_up(ticket)
+            raise
+
+    def pause(self, seconds):
+        """Admit nothing for a while, e.g. after the API answered 429"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe(self, headers):
+        """Adopt the limits and remaining allowance reported in x-ratelimit-* response headers"""
+        with self._cond:
+            for bucket, suffix in (('requests', 'requests'), ('tokens', 'tokens')):
+                limit = _header_number(headers, f"x-ratelimit-limit-{suffix}")
+                remaining = _header_number(headers, f"x-ratelimit-remaining-{suffix}")
+                if limit and not self.configured[bucket]:
+                    self.buckets[bucket].set_limit(limit)
+                if remaining is not None:
+                    self.buckets[bucket].limit_remaining(remaining)
+            self._cond.notify_all()
+
+    def queue_depths(self):
+        with self._cond:
+            return {
+                name: sum(len(queue) for queue in sessions.values())
+                for name, sessions in zip(PRIORITY_NAMES, self._queues)
+            }
+
+
+def _header_number(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+limiters = {
+    'chat': RateLimiter('chat', OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT),
+    'whisper': RateLimiter('whisper', OPENAI_WHISPER_RPM_LIMIT),
+}
+
+
+def _limiter_for(operation):
+    return limiters['whisper' if operation == 'whisper' else 'chat']
+
+
+def scheduled_call(operation, tokens, timeout, call):
+    """Wait for rate limit capacity, then call(seconds_left); 429 replies pause the limiter"""
+    limiter = _limiter_for(operation)
+    waited = limiter.acquire(tokens, timeout)
+    try:
+        return call(max(timeout - waited, 0.001))
+    except openai.RateLimitError as e:
+        limiter.pause(retry_delay(0, e))
+        raise
+
+
+async def scheduled_call_async(operation, tokens, timeout, call):
+    """scheduled_call for coroutine calls"""
+    limiter = _limiter_for(operation)
+    waited = await limiter.acquire_async(tokens, timeout)
+    try:
+        return await call(max(timeout - waited, 0.001))
+    except openai.RateLimitError as e:
+        limiter.pause(retry_delay(0, e))
+        raise
+
+
+def observe_response(response):
+    """httpx response hook: learn rate limits from API responses"""
+    limiter = limiters['whisper' if '/audio/' in response.request.url.path else 'chat']
+    limiter.observe(response.headers)
+
+
+def _scheduler_metrics():
+    snapshots = {}
+    for name, limiter in limiters.items():
+        depths = limiter.queue_depths()
+        with limiter._cond:
+            stats = {priority: dict(values) for priority, values in limiter.stats.items()}
+            levels = {bucket: (b.level, b.capacity) for bucket, b in limiter.buckets.items()}
+        snapshots[name] = (depths, stats, levels)
+
+    lines = []
+    for metric, kind, description, field in (
+        ("openai_scheduler_queue_depth", "gauge", "Calls waiting for rate limit capacity", None),
+        ("openai_scheduler_granted_total", "counter", "Calls admitted by the rate limit scheduler", "granted"),
+        ("openai_scheduler_wait_seconds_total", "counter", "Time calls spent queued for rate limit capacity", "wait_seconds"),
+        ("openai_scheduler_timeouts_total", "counter", "Calls that gave up waiting for rate limit capacity", "timeouts"),
+    ):
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, (depths, stats, _) in snapshots.items():
+            for priority in PRIORITY_NAMES:
+                value = depths[priority] if field is None else stats[priority][field]
+                lines.append(f'{metric}{{limiter="{name}",priority="{priority}"}} {value:g}')
+
+    lines.append("# HELP openai_scheduler_available Allowance left in each limited bucket")
+    lines.append("# TYPE openai_scheduler_available gauge")
+    for name, (_, _, levels) in snapshots.items():
+        for bucket, (level, capacity) in levels.items():
+            if capacity:
+                lines.append(f'openai_scheduler_available{{limiter="{name}",bucket="{bucket}"}} {level:.0f}')
+    return lines
+
+
+register_metrics(_scheduler_metrics)
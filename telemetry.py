@@ -0,0 +1,328 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port for the Prometheus /metrics endpoint; unset means no endpoint
+METRICS_PORT = os.environ.get("METRICS_PORT")
+# File to append one JSON line per API call to; unset means no log
+TELEMETRY_LOG_FILE = os.environ.get("TELEMETRY_LOG_FILE")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['counts'][i] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = _format_labels(self.labels, label_values)
+            for bound, count in zip(self.buckets, series['counts']):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series['sum']}")
+            lines.append(f"{self.name}_count{{{labels}}} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, amount, *label_values):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+_lock = threading.Lock()
+_metrics = {
+    'duration': Histogram(
+        "openai_call_duration_seconds", "Wall time of helper calls, including cache hits and fallbacks",
+        DURATION_BUCKETS, ("operation", "branch")
+    ),
+    'ttfb': Histogram(
+        "openai_time_to_first_byte_seconds", "Time from call start until the first API response headers",
+        DURATION_BUCKETS, ("operation",)
+    ),
+    'request_bytes': Histogram(
+        "openai_request_bytes", "Bytes uploaded to the API per call",
+        BYTES_BUCKETS, ("operation",)
+    ),
+    'tokens': Counter("openai_tokens_total", "Tokens used by API calls", ("operation", "kind")),
+    'calls': Counter("openai_calls_total", "Helper calls by outcome", ("operation", "branch", "cache", "status")),
+}
+_extra_renderers = []
+# Calls being recorded, innermost last; a context variable so it follows asyncio tasks as well as threads
+_active = contextvars.ContextVar("telemetry_calls", default=())
+
+
+class CallRecord:
+    """Measurements for one instrumented call"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.start = time.perf_counter()
+        self.first_byte = None
+        self.request_bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.branch = "primary"
+        self.cache_hit = False
+        self.status = "ok"
+
+
+def _push(record):
+    _active.set(_active.get() + (record,))
+
+
+def _remove(record):
+    # Generators may be closed out of order, so remove by identity
+    stack = _active.get()
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i] is record:
+            _active.set(stack[:i] + stack[i + 1:])
+            break
+
+
+def current_call():
+    """Return the innermost call being recorded in this thread or task, or None"""
+    stack = _active.get()
+    return stack[-1] if stack else None
+
+
+def attach(record):
+    """Make record the current call in this thread or task, e.g. in a worker running part of it"""
+    if record is not None:
+        _push(record)
+
+
+def detach(record):
+    """Undo attach without finishing the record"""
+    stack = _active.get()
+    if record is not None and stack and stack[-1] is record:
+        _active.set(stack[:-1])
+
+
+def note(**fields):
+    """Set fields such as branch or cache_hit on the current call"""
+    record = current_call()
+    if record is not None:
+        for name, value in fields.items():
+            setattr(record, name, value)
+
+
+def note_usage(response):
+    """Add the token usage reported by an API response to the current call"""
+    record = current_call()
+    usage = getattr(response, 'usage', None)
+    if record is not None and usage is not None:
+        record.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+        record.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+
+def on_request(request):
+    """httpx request hook: count bytes uploaded for the current call"""
+    record = current_call()
+    if record is not None:
+        record.request_bytes += int(request.headers.get("Content-Length", 0) or 0)
+
+
+def on_response(response):
+    """httpx response hook: note when the first response headers arrived"""
+    record = current_call()
+    if record is not None and record.first_byte is None:
+        record.first_byte = time.perf_counter() - record.start
+
+
+def _finish(record):
+    wall = time.perf_counter() - record.start
+    cache = "hit" if record.cache_hit else "miss"
+    with _lock:
+        _metrics['duration'].observe(wall, record.operation, record.branch)
+        _metrics['calls'].inc(1, record.operation, record.branch, cache, record.status)
+        if record.first_byte is not None:
+            _metrics['ttfb'].observe(record.first_byte, record.operation)
+        if record.request_bytes:
+            _metrics['request_bytes'].observe(record.request_bytes, record.operation)
+        if record.prompt_tokens:
+            _metrics['tokens'].inc(record.prompt_tokens, record.operation, "prompt")
+        if record.completion_tokens:
+            _metrics['tokens'].inc(record.completion_tokens, record.operation, "completion")
+
+    if TELEMETRY_LOG_FILE:
+        entry = {
+            "ts": time.time(),
+            "operation": record.operation,
+            "wall_s": round(wall, 4),
+            "ttfb_s": round(record.first_byte, 4) if record.first_byte is not None else None,
+            "request_bytes": record.request_bytes,
+            "prompt_tokens": record.prompt_tokens,
+            "completion_tokens": record.completion_tokens,
+            "branch": record.branch,
+            "cache_hit": record.cache_hit,
+            "status": record.status,
+        }
+        with _lock:
+            with open(TELEMETRY_LOG_FILE, "a") as log_file:
+                log_file.write(json.dumps(entry) + "\n")
+
+
+def _enter(operation):
+    record = CallRecord(operation)
+    _push(record)
+    return record
+
+
+def _exit(record):
+    _remove(record)
+    _finish(record)
+
+
+def instrumented(operation):
+    """Decorator recording wall time, first byte, payload size and tokens for a helper call
+
+    Works on plain functions, generators, coroutine functions and async generators.
+    """
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_generator_wrapper(*args, **kwargs):
+                record = _enter(operation)
+                generator = func(*args, **kwargs)
+                try:
+                    async for value in generator:
+                        yield value
+                except BaseException:
+                    record.status = "error"
+                    raise
+                finally:
+                    # Close the inner generator now, as yield from would, rather than when it is collected
+                    await generator.aclose()
+                    _exit(record)
+            return async_generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def coroutine_wrapper(*args, **kwargs):
+                record = _enter(operation)
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    record.status = "error"
+                    raise
+                finally:
+                    _exit(record)
+            return coroutine_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                record = _enter(operation)
+                try:
+                    yield from func(*args, **kwargs)
+                except BaseException:
+                    record.status = "error"
+                    raise
+                finally:
+                    _exit(record)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = _enter(operation)
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                record.status = "error"
+                raise
+            finally:
+                _exit(record)
+        return wrapper
+
+    return decorator
+
+
+def register_metrics(renderer):
+    """Add a callable returning extra Prometheus text lines to the /metrics output"""
+    _extra_renderers.append(renderer)
+
+
+def render_metrics():
+    """Return all metrics in Prometheus text format"""
+    with _lock:
+        lines = []
+        for metric in _metrics.values():
+            lines.extend(metric.render())
+    for renderer in _extra_renderers:
+        lines.extend(renderer())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on a background thread; does nothing if already running or no port is set"""
+    global _server
+    port = port or METRICS_PORT
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
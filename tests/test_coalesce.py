@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+import pytest
+from coalesce import SingleFlight
+from resilience import DeadlineExceededError
+
+WAITERS = 8
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def run_together(flight, call, count=WAITERS):
+    """Start count threads asking for the same key while the first call is held; returns (results, errors)"""
+    release = threading.Event()
+    results = [None] * count
+    errors = [None] * count
+
+    def held():
+        release.wait(5)
+        return call()
+
+    def worker(index):
+        try:
+            results[index] = flight.do("key", held)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flight.get_stats()['coalesced'] == count - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_do_shares_one_result_across_threads():
+    flight = SingleFlight("test")
+    calls = []
+    results, errors = run_together(flight, lambda: calls.append(1) or object())
+
+    assert len(calls) == 1
+    assert errors == [None] * WAITERS
+    assert all(result is results[0] for result in results)
+    stats = flight.get_stats()
+    assert (stats['calls'], stats['coalesced'], stats['in_flight']) == (1, WAITERS - 1, 0)
+
+
+def test_do_passes_the_error_to_every_waiter():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise ValueError("upstream failed")
+
+    results, errors = run_together(flight, fail)
+
+    assert results == [None] * WAITERS
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert all(error is errors[0] for error in errors)
+    assert flight.get_stats()['errors'] == 1
+    # The failed call is not remembered: the next caller makes a new one
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_waiter_times_out_while_the_call_carries_on():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("key", lambda: release.wait(5)))
+    leader.start()
+    wait_until(lambda: flight.get_stats()['in_flight'] == 1)
+
+    with pytest.raises(DeadlineExceededError):
+        flight.do("key", lambda: "unused", timeout=0.05)
+    release.set()
+    leader.join(5)
+    assert flight.get_stats()['timeouts'] == 1
+
+
+def test_abandoned_stream_hands_the_call_to_a_waiter():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+    outcome = []
+
+    def partial():
+        yield "first"
+        started.set()
+        release.wait(5)
+        yield "second"
+
+    stream = flight.stream("key", partial)
+    assert next(stream) == "first"
+    waiter = threading.Thread(target=lambda: outcome.append(flight.do("key", lambda: "made by waiter")))
+    waiter.start()
+    wait_until(lambda: flight.get_stats()['coalesced'] == 1)
+    stream.close()
+    waiter.join(5)
+    assert outcome == ["made by waiter"]
+
+
+def test_do_async_shares_one_task():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", call) for _ in range(WAITERS)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_do_async_passes_the_error_to_every_waiter():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", fail) for _ in range(WAITERS)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.get_stats()['errors'] == 1
@@ -0,0 +1,75 @@
+import pytest
+from normalization import ALIASES, ALIAS_INDEX, canonical_name, normalize_ingredients, singularize
+
+NAMES = [
+    "Tomatoes", "2 large tomatoes", "cherry tomatoes", "a bag of fresh spinach", "Fresh coriander",
+    "spring onions", "Collard Greens", "greens", "apple pies", "french fries", "berries", "leaves",
+    "chickpeas", "Garbanzo beans", "hummus", "couscous", "oats", "eggs", "Extra-virgin olive oil",
+    "chillies", "cookies", "potatoes", "brussels sprouts", "glasses", "peaches",
+]
+
+
+@pytest.mark.parametrize("name", NAMES + [name for aliases in ALIASES.values() for name in aliases])
+def test_canonical_name_is_idempotent(name):
+    key = canonical_name(name)
+    assert key is not None
+    assert canonical_name(key) == key
+
+
+@pytest.mark.parametrize("word, singular", [
+    ("tomatoes", "tomato"),
+    ("potatoes", "potato"),
+    ("berries", "berry"),
+    ("cherries", "cherry"),
+    ("pies", "pie"),
+    ("ties", "tie"),
+    ("brownies", "brownie"),
+    ("cookies", "cookie"),
+    ("fries", "fries"),
+    ("leaves", "leaf"),
+    ("peaches", "peach"),
+    ("boxes", "box"),
+    ("glasses", "glass"),
+    ("eggs", "egg"),
+    ("greens", "greens"),
+    ("hummus", "hummus"),
+    ("asparagus", "asparagus"),
+    ("peas", "pea"),
+    ("gas", "gas"),
+])
+def test_singularize(word, singular):
+    assert singularize(word) == singular
+
+
+@pytest.mark.parametrize("name, key", [
+    ("Tomatoes", "tomato"),
+    ("2 large tomatoes", "tomato"),
+    ("cherry tomatoes", "tomato"),
+    ("a bag of fresh spinach", "spinach"),
+    ("Fresh coriander", "cilantro"),
+    ("spring onions", "green onion"),
+    ("collard greens", "spring greens"),
+    ("collards", "spring greens"),
+    ("apple pies", "apple pie"),
+    ("french fries", "french fries"),
+    ("Extra virgin olive oil", "olive oil"),
+    ("Garbanzo beans", "chickpea"),
+])
+def test_canonical_name_plurals_and_aliases(name, key):
+    assert canonical_name(name) == key
+
+
+@pytest.mark.parametrize("name", ["", "   ", "a", "the", "fresh", "2", "some of the"])
+def test_canonical_name_rejects_non_ingredients(name):
+    assert canonical_name(name) is None
+
+
+def test_alias_index_points_at_canonical_names():
+    for canonical in set(ALIAS_INDEX.values()):
+        assert canonical_name(canonical) == canonical
+
+
+def test_normalize_ingredients_merges_spellings_in_order():
+    assert normalize_ingredients(["Eggs", "tomatoes", "egg", "Roma tomato", "scallions", "spring onion"]) == [
+        "egg", "tomato", "green onion",
+    ]
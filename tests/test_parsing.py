@@ -0,0 +1,68 @@
+import json
+import pytest
+from parsing import PartialJSONParser, salvage_json, salvage_ingredients, salvage_recipe, salvage_reply, get_salvage_stats
+
+RECIPE = {
+    "title": "Leek and Potato Soup",
+    "ingredients": ["2 leeks", "3 potatoes", "1 litre stock"],
+    "instructions": ["Slice the leeks.", "Simmer everything for 20 minutes.", "Blend until smooth."],
+}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"title": "Soup", "ingredients": ["leek", "pota', {"title": "Soup", "ingredients": ["leek", "pota"]}),
+    ('{"title": "Soup", "ingredients": ["leek",', {"title": "Soup", "ingredients": ["leek"]}),
+    ('{"title": "Soup", "servings":', {"title": "Soup", "servings": None}),
+    ('```json\n{"a": [1, 2,],}\n```', {"a": [1, 2]}),
+    ('Here you go: ["x", "y"] hope it helps', ["x", "y"]),
+    ('{"quote": "say \\"hi', {"quote": 'say "hi'}),
+])
+def test_salvage_json_repairs_truncated_and_wrapped_replies(text, expected):
+    assert salvage_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", None, "no json here", "I could not see any food."])
+def test_salvage_json_without_json(text):
+    assert salvage_json(text) is None
+
+
+def test_salvage_json_recovers_every_prefix_of_a_reply():
+    reply = json.dumps(RECIPE)
+    for end in range(reply.index("[") + 1, len(reply) + 1):
+        value = salvage_json(reply[:end])
+        assert value is not None, reply[:end]
+        assert value["title"] == RECIPE["title"]
+    assert salvage_json(reply) == RECIPE
+
+
+def test_partial_parser_snapshots_grow_as_chunks_arrive():
+    reply = json.dumps({"recipes": [RECIPE, dict(RECIPE, title="Potato Cakes")]})
+    parser = PartialJSONParser()
+    counts = []
+    for start in range(0, len(reply), 7):
+        parser.feed(reply[start:start + 7])
+        snapshot = parser.snapshot()
+        counts.append(len(snapshot["recipes"]) if snapshot else 0)
+    assert counts == sorted(counts)
+    assert parser.snapshot() == json.loads(reply)
+
+
+def test_partial_parser_keeps_last_good_value_mid_token():
+    parser = PartialJSONParser()
+    parser.feed('{"recipes": [{"title": "A"}, {"ti')
+    first = parser.snapshot()
+    parser.feed('tle": tr')
+    assert parser.snapshot() == first
+
+
+def test_salvage_helpers_count_outcomes():
+    before = get_salvage_stats()
+    assert salvage_reply('{"a": [1') == {"a": [1]}
+    assert salvage_reply("nothing") is None
+    assert salvage_ingredients("Ingredients: eggs, milk and flour") == ["eggs", "milk", "flour"]
+    assert salvage_recipe('{"title": "Soup", "ingredients": ["leek"') is not None
+    after = get_salvage_stats()
+    assert after["attempts"] - before["attempts"] == 4
+    assert after["json_recovered"] - before["json_recovered"] == 2
+    assert after["list_recovered"] - before["list_recovered"] == 1
+    assert after["failed"] - before["failed"] == 1
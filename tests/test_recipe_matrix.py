@@ -0,0 +1,87 @@
+import random
+import pytest
+from recipe_matrix import RecipeMatrix, DIFFICULTY_LEVELS, METRICS
+
+VOCABULARY = [f"ingredient {i}" for i in range(150)]
+STAPLES = {"ingredient 0", "ingredient 1", "ingredient 2"}
+
+
+def make_recipes(count, seed):
+    rng = random.Random(seed)
+    required = [frozenset(rng.sample(VOCABULARY, rng.randint(1, 12))) for _ in range(count)]
+    difficulty = [rng.choice(DIFFICULTY_LEVELS) for _ in range(count)]
+    return required, difficulty
+
+
+def brute_force(required, difficulty, pantry, metric, max_missing=None, min_matched=0, max_difficulty=None):
+    """(missing, -score, -matched) for every recipe top_k may return, scored one set at a time"""
+    pantry = set(pantry)
+    ranked = {}
+    for row, keys in enumerate(required):
+        core = keys - STAPLES
+        matched = len(keys & pantry)
+        core_matched = len(core & pantry)
+        missing = len(core) - core_matched
+        if core_matched < max(min_matched, 1):
+            continue
+        if max_missing is not None and missing > max_missing:
+            continue
+        if max_difficulty is not None and DIFFICULTY_LEVELS.index(difficulty[row]) > DIFFICULTY_LEVELS.index(max_difficulty):
+            continue
+        score = {
+            'coverage': matched / len(keys),
+            'jaccard': matched / len(keys | pantry),
+            'weighted': core_matched / len(core) if core else 0.0,
+        }[metric]
+        ranked[row] = (missing, -score, -matched)
+    return ranked
+
+
+@pytest.mark.parametrize("metric", METRICS)
+@pytest.mark.parametrize("seed", range(5))
+def test_top_k_matches_brute_force(metric, seed):
+    required, difficulty = make_recipes(500, seed)
+    matrix = RecipeMatrix.build(required, difficulty, STAPLES)
+    pantry = random.Random(seed + 100).sample(VOCABULARY, 25) + ["not in any recipe"]
+
+    top = [int(row) for row in matrix.top_k(pantry, 20, metric=metric)]
+    ranked = brute_force(required, difficulty, pantry, metric)
+    expected = sorted(ranked.values())[:20]
+
+    assert len(top) == len(expected)
+    # Ties may come back in any order, so compare the ranking keys rather than row numbers
+    assert [ranked[row] for row in top] == pytest.approx(expected)
+
+
+def test_top_k_applies_filters():
+    required, difficulty = make_recipes(500, 7)
+    matrix = RecipeMatrix.build(required, difficulty, STAPLES)
+    pantry = random.Random(8).sample(VOCABULARY, 40)
+
+    top = [int(row) for row in matrix.top_k(pantry, 500, max_missing=2, min_matched=2, max_difficulty="Medium")]
+    ranked = brute_force(required, difficulty, pantry, "weighted", max_missing=2, min_matched=2, max_difficulty="Medium")
+
+    assert set(top) == set(ranked)
+    assert [ranked[row] for row in top] == pytest.approx(sorted(ranked.values()))
+
+
+def test_top_k_with_no_overlap_or_no_recipes():
+    required, difficulty = make_recipes(50, 3)
+    matrix = RecipeMatrix.build(required, difficulty, STAPLES)
+    assert len(matrix.top_k(["not in any recipe"], 5)) == 0
+    assert len(RecipeMatrix.build([], []).top_k(["ingredient 3"], 5)) == 0
+
+
+def test_top_k_rejects_unknown_metric():
+    required, difficulty = make_recipes(10, 1)
+    with pytest.raises(ValueError):
+        RecipeMatrix.build(required, difficulty).top_k(VOCABULARY, 5, metric="cosine")
+
+
+def test_saved_matrix_ranks_the_same(tmp_path):
+    required, difficulty = make_recipes(300, 11)
+    matrix = RecipeMatrix.build(required, difficulty, STAPLES)
+    matrix.save(str(tmp_path / "matrix"))
+    loaded = RecipeMatrix.load(str(tmp_path / "matrix"), STAPLES)
+    pantry = VOCABULARY[:30]
+    assert list(loaded.top_k(pantry, 25)) == list(matrix.top_k(pantry, 25))
@@ -0,0 +1,130 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, call_with_resilience, acall_with_resilience
+
+COOLDOWN = 0.05
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def opened(threshold=2):
+    breaker = CircuitBreaker("test", threshold=threshold, cooldown=COOLDOWN)
+    for _ in range(threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = CircuitBreaker("test", threshold=3, cooldown=COOLDOWN)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", threshold=2, cooldown=COOLDOWN)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through_then_closes_on_success():
+    breaker = opened()
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only the trial call goes ahead until it reports back
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_opens_the_breaker_again():
+    breaker = opened()
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_trial_that_never_reports_is_replaced_after_a_cooldown():
+    breaker = opened()
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_released_trial_hands_its_place_to_the_next_caller():
+    breaker = opened()
+    time.sleep(COOLDOWN)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+@pytest.fixture
+def chat_breaker(monkeypatch):
+    breaker = CircuitBreaker("chat", threshold=2, cooldown=COOLDOWN)
+    monkeypatch.setitem(resilience._breakers, "chat", breaker)
+    monkeypatch.setattr(resilience, "MAX_ATTEMPTS", 1)
+    return breaker
+
+
+def test_call_with_resilience_drives_the_breaker(chat_breaker):
+    def fail(timeout):
+        raise connection_error()
+
+    for _ in range(2):
+        with pytest.raises(openai.APIConnectionError):
+            call_with_resilience("chat", fail, hedge=False)
+    assert chat_breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_with_resilience("chat", lambda timeout: "unused", hedge=False)
+
+    time.sleep(COOLDOWN)
+    assert call_with_resilience("chat", lambda timeout: "ok", hedge=False) == "ok"
+    assert chat_breaker.state == "closed"
+
+
+def test_local_deadlines_are_not_counted_as_failures(chat_breaker):
+    def queued_too_long(timeout):
+        raise DeadlineExceededError("Waited too long for chat rate limit capacity")
+
+    for _ in range(3):
+        with pytest.raises(DeadlineExceededError):
+            call_with_resilience("chat", queued_too_long, hedge=False)
+    assert chat_breaker.state == "closed"
+
+
+def test_async_trial_that_runs_out_of_time_is_released(chat_breaker):
+    for _ in range(2):
+        chat_breaker.record_failure()
+    time.sleep(COOLDOWN)
+
+    async def queued_too_long(timeout):
+        raise DeadlineExceededError("Waited too long for chat rate limit capacity")
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(acall_with_resilience("chat", queued_too_long))
+    assert chat_breaker.state == "open"
+    # The next caller becomes the trial straight away instead of waiting another cooldown
+    assert chat_breaker.allow()
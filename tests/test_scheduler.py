@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+import pytest
+from resilience import DeadlineExceededError
+from scheduler import RateLimiter, scheduling, bind, current_session, _Ticket, INTERACTIVE, BACKGROUND, BATCH
+
+
+def drained(rpm=60):
+    """A limiter with its request allowance used up"""
+    limiter = RateLimiter("test", rpm=rpm)
+    bucket = limiter.buckets['requests']
+    bucket._refill(time.monotonic())
+    bucket.level = 0.0
+    return limiter
+
+
+def queue(limiter, priority, session):
+    with scheduling(priority, session):
+        ticket = _Ticket(0)
+    limiter._enqueue(ticket)
+    return ticket
+
+
+def grant_one(limiter, tickets):
+    """Allow exactly one more request and return the name of the ticket admitted"""
+    bucket = limiter.buckets['requests']
+    bucket.updated = time.monotonic()
+    bucket.level = 1.0
+    before = {name for name, ticket in tickets.items() if ticket.granted}
+    with limiter._cond:
+        limiter._dispatch()
+    admitted = {name for name, ticket in tickets.items() if ticket.granted} - before
+    assert len(admitted) == 1
+    return admitted.pop()
+
+
+def test_higher_priorities_are_admitted_first():
+    limiter = drained()
+    tickets = {
+        'batch': queue(limiter, BATCH, "a"),
+        'background': queue(limiter, BACKGROUND, "a"),
+        'interactive': queue(limiter, INTERACTIVE, "a"),
+    }
+    order = [grant_one(limiter, tickets) for _ in tickets]
+    assert order == ['interactive', 'background', 'batch']
+
+
+def test_sessions_take_turns_within_a_priority():
+    limiter = drained()
+    tickets = {
+        'a1': queue(limiter, INTERACTIVE, "a"),
+        'a2': queue(limiter, INTERACTIVE, "a"),
+        'a3': queue(limiter, INTERACTIVE, "a"),
+        'b1': queue(limiter, INTERACTIVE, "b"),
+        'c1': queue(limiter, INTERACTIVE, "c"),
+    }
+    order = [grant_one(limiter, tickets) for _ in tickets]
+    assert order == ['a1', 'b1', 'c1', 'a2', 'a3']
+
+
+def test_nothing_is_admitted_without_capacity():
+    limiter = drained()
+    ticket = queue(limiter, INTERACTIVE, "a")
+    with limiter._cond:
+        delay = limiter._dispatch()
+    assert not ticket.granted
+    assert delay == pytest.approx(60 / limiter.buckets['requests'].capacity, rel=0.01)
+
+
+def test_acquire_gives_up_at_its_deadline():
+    limiter = drained()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        limiter.acquire(timeout=0.1)
+    assert 0.1 <= time.monotonic() - start < 1
+    assert limiter.queue_depths() == {'interactive': 0, 'background': 0, 'batch': 0}
+    assert limiter.stats['interactive']['timeouts'] == 1
+
+
+def test_acquire_async_gives_up_at_its_deadline():
+    limiter = drained()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(limiter.acquire_async(timeout=0.1))
+    assert limiter.queue_depths() == {'interactive': 0, 'background': 0, 'batch': 0}
+    assert limiter.stats['interactive']['timeouts'] == 1
+
+
+def test_expired_call_lets_the_next_one_through():
+    limiter = drained(rpm=6000)
+    with scheduling(BATCH, "slow"):
+        with pytest.raises(DeadlineExceededError):
+            limiter.acquire(timeout=0.001)
+    # About 11 ms until the next request is allowed at 6000 rpm with 10% headroom
+    assert limiter.acquire(timeout=1) < 0.5
+    assert limiter.stats['interactive']['granted'] == 1
+
+
+def test_waiting_threads_are_woken_in_priority_order():
+    # One request every ~0.55s, long enough for all three to queue before the first is admitted
+    limiter = drained(rpm=120)
+    order = []
+    lock = threading.Lock()
+
+    def worker(priority):
+        with scheduling(priority, str(priority)):
+            limiter.acquire(timeout=5)
+            with lock:
+                order.append(priority)
+
+    threads = [threading.Thread(target=worker, args=(priority,)) for priority in (BATCH, BACKGROUND, INTERACTIVE)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert order == [INTERACTIVE, BACKGROUND, BATCH]
+
+
+def test_bind_carries_priority_and_session_to_another_thread():
+    seen = []
+    with scheduling(BACKGROUND, "session-1"):
+        task = bind(lambda: seen.append((current_session(), _Ticket(0).priority)))
+    thread = threading.Thread(target=task)
+    thread.start()
+    thread.join(5)
+    assert seen == [("session-1", BACKGROUND)]
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+import streamlit as st
+from packaging.version import Version
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Readable theme stylesheets, one per theme key
+THEME_DIR = os.path.join(APP_DIR, "themes")
+# Streamlit serves this folder at app/static/ when server.enableStaticServing is on
+STATIC_DIR = os.path.join(APP_DIR, "static")
+# Link to the minified stylesheet instead of sending it inline on every rerun
+THEME_STATIC_ASSETS = os.environ.get("THEME_STATIC_ASSETS", "1") != "0"
+
+_COMMENTS = re.compile(r'/\*.*?\*/', re.DOTALL)
+_WHITESPACE = re.compile(r'\s+')
+_AROUND_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+# Innermost {...} blocks hold declarations; elsewhere a space before ":" is a descendant selector
+_DECLARATIONS = re.compile(r'\{[^{}]*\}')
+_AROUND_COLON = re.compile(r'\s*:\s*')
+
+
+def minify_css(css):
+    """Strip comments and unneeded whitespace from a stylesheet"""
+    css = _COMMENTS.sub('', css)
+    css = _WHITESPACE.sub(' ', css)
+    css = _AROUND_PUNCTUATION.sub(r'\1', css)
+    css = _DECLARATIONS.sub(lambda block: _AROUND_COLON.sub(':', block.group(0)), css)
+    return css.replace(';}', '}').strip()
+
+
+@lru_cache(maxsize=None)
+def theme_css(key):
+    """Minified CSS for a theme, read and compiled once per process"""
+    with open(os.path.join(THEME_DIR, f"{key}.css"), encoding="utf-8") as f:
+        return minify_css(f.read())
+
+
+def _static_css_supported():
+    """Whether the server sends .css files from the static folder as text/css
+
+    Static serving arrived in Streamlit 1.18. The Tornado handler sends
+    unlisted file types as text/plain with nosniff, which browsers refuse to
+    apply as a stylesheet; newer servers pick the type from the extension.
+    Anything unrecognised counts as unsupported, so the CSS is inlined.
+    """
+    if Version(st.__version__) < Version("1.18"):
+        return False
+    try:
+        from streamlit.web.server.app_static_file_handler import SAFE_APP_STATIC_FILE_EXTENSIONS
+    except ImportError:
+        try:
+            from streamlit.web.server.component_file_utils import guess_content_type
+        except ImportError:
+            return False
+        return guess_content_type("theme.css").startswith("text/css")
+    return ".css" in SAFE_APP_STATIC_FILE_EXTENSIONS
+
+
+@lru_cache(maxsize=None)
+def theme_url(key):
+    """Relative URL of the theme's static stylesheet, or None when it cannot be served"""
+    if not THEME_STATIC_ASSETS or not st.get_option("server.enableStaticServing") or not _static_css_supported():
+        return None
+
+    css = theme_css(key)
+    # The content hash in the name lets browsers cache the file indefinitely
+    name = f"theme-{key}-{hashlib.sha256(css.encode('utf-8')).hexdigest()[:12]}.min.css"
+    path = os.path.join(STATIC_DIR, name)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(STATIC_DIR, exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(css)
+            os.replace(temporary, path)
+    except OSError:
+        return None
+    return f"app/static/{name}"
+
+
+@lru_cache(maxsize=None)
+def theme_html(key):
+    """Markup that applies a theme: a short stylesheet link, or the minified CSS inline"""
+    url = theme_url(key)
+    if url:
+        return f'<link rel="stylesheet" href="{url}">'
+    return f"<style>{theme_css(key)}</style>"
@@ -1,32 +1,12 @@
-import re
 import streamlit as st
-
-def validate_ingredients(ingredients):
-    """Validate and clean ingredient list"""
-    validated = []
-    
-    for ingredient in ingredients:
-        # Clean the ingredient name
-        cleaned = ingredient.strip().lower()
-        
-        # Remove extra spaces and special characters
-        cleaned = re.sub(r'[^\w\s]', '', cleaned)
-        cleaned = ' '.join(cleaned.split())
-        
-        # Skip empty or very short ingredients
-        if len(cleaned) < 2:
-            continue
-            
-        # Skip common non-ingredient words
-        skip_words = {'and', 'or', 'the', 'a', 'an', 'some', 'any', 'with', 'have', 'got', 'i', 'we', 'my', 'our'}
-        if cleaned in skip_words:
-            continue
-            
-        # Capitalize first letter for display
-        cleaned = cleaned.capitalize()
-        validated.append(cleaned)
-    
-    return validated
+# Helpers shared with the API server, kept in a module that does not import streamlit
+from parsing import (
+    validate_ingredients,
+    merge_ingredients,
+    is_valid_ingredient,
+    clean_recipe_json,
+    estimate_cooking_difficulty
+)
 
 def format_recipe_display(recipe_text):
     """Format recipe text for better display"""
@@ -39,21 +19,6 @@ def format_recipe_display(recipe_text):
     
     return formatted
 
-def is_valid_ingredient(ingredient):
-    """Check if a string looks like a valid ingredient"""
-    if not ingredient or len(ingredient.strip()) < 2:
-        return False
-    
-    # Check if it contains mostly letters
-    letter_count = sum(1 for c in ingredient if c.isalpha())
-    total_count = len(ingredient.replace(' ', ''))
-    
-    if total_count == 0:
-        return False
-    
-    letter_ratio = letter_count / total_count
-    return letter_ratio > 0.5
-
 def get_ingredient_suggestions():
     """Get common ingredient suggestions for elderly users"""
     suggestions = [
@@ -82,42 +47,6 @@ def chunk_ingredients(ingredients, chunk_size=10):
     for i in range(0, len(ingredients), chunk_size):
         yield ingredients[i:i + chunk_size]
 
-def clean_recipe_json(recipe_data):
-    """Clean and validate recipe JSON data"""
-    if not isinstance(recipe_data, dict):
-        return recipe_data
-    
-    # Ensure required fields exist
-    required_fields = ['title', 'ingredients', 'instructions']
-    for field in required_fields:
-        if field not in recipe_data:
-            recipe_data[field] = f"No {field} provided"
-    
-    # Clean ingredients list
-    if isinstance(recipe_data.get('ingredients'), list):
-        recipe_data['ingredients'] = [ing for ing in recipe_data['ingredients'] if ing and ing.strip()]
-    
-    # Clean instructions list
-    if isinstance(recipe_data.get('instructions'), list):
-        recipe_data['instructions'] = [inst for inst in recipe_data['instructions'] if inst and inst.strip()]
-    
-    return recipe_data
-
-def estimate_cooking_difficulty(recipe_data):
-    """Estimate cooking difficulty based on recipe complexity"""
-    if not isinstance(recipe_data, dict):
-        return "Medium"
-    
-    ingredients_count = len(recipe_data.get('ingredients', []))
-    instructions_count = len(recipe_data.get('instructions', []))
-    
-    if ingredients_count <= 5 and instructions_count <= 5:
-        return "Easy"
-    elif ingredients_count <= 10 and instructions_count <= 10:
-        return "Medium"
-    else:
-        return "Advanced"
-
 def get_nutritional_tips():
     """Get general nutritional tips for elderly users"""
     tips = [